@@ -1,14 +1,24 @@
 # Import necessary classes and modules for chatbot functionality
-from typing import Callable, Dict, Optional
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Generator, Iterator, Optional, Tuple
 
 from chatbot.memory import MemoryManager
+from chatbot.profile import user_profiles
+from chatbot.timing import StageTimer
 
 from chatbot.chains.is_prompt_injection import IsPromptInjection
 
 from chatbot.chains.update_profile_info import UpdateUserInfoChain
 from chatbot.chains.insert_fav_author_genre import AddFavAuthorGenreChain
 from chatbot.chains.add_book_read_list import AddBookReadListChain
+from chatbot.chains.registry import LazyChainMap
 from chatbot.chains.router import RouterChain
+from chatbot.router.classifier import IntentClassifier
+from chatbot.router.fallback import LLM_INTENT_ALIASES, FallbackStats, load_fallback_classifier
 from chatbot.router.loader import load_intention_classifier
 from chatbot.chains.chitchat import ChitChatResponseChain, ChitChatClassifierChain
 from chatbot.chains.suggest_books import ExtractInput_Books
@@ -20,32 +30,42 @@ from chatbot.rag.rag import RagChain
 
 from langchain_core.runnables.history import RunnableWithMessageHistory
 
+PROMPT_INJECTION_RESPONSE = "It was detected prompt injection risks or malicious content in your input."
+
 
 class MainChatbot:
     """A bot that handles customer service interactions by processing user inputs and
     routing them through configured reasoning and response chains.
+
+    A single instance is meant to be shared by every session of the server process,
+    so no user or conversation state is kept on the instance: the session identifiers
+    are passed to each call instead.
     """
 
     def __init__(self):
         """Initialize the bot with session and language model configurations."""
+        # Measure how long it takes to warm up the router, chains and connections
+        start_time = time.perf_counter()
+
         # Initialize the memory manager to manage session history
         self.memory = MemoryManager()
 
-        # Map intent names to their corresponding reasoning and response chains
-        self.chain_map = {
-            "update_profile_info": self.add_memory_to_runnable(UpdateUserInfoChain()),
-            "insert_new_favorite_author_genre": self.add_memory_to_runnable(AddFavAuthorGenreChain()),
-            "add_book_to_read_list": self.add_memory_to_runnable(AddBookReadListChain()),
-            "router": RouterChain(),
-            "chitchat": self.add_memory_to_runnable(ChitChatResponseChain()),
-            "chitchat_class": ChitChatClassifierChain(),
-            "suggest_books": self.add_memory_to_runnable(ExtractInput_Books()),
-            "suggest_authors": self.add_memory_to_runnable(ExtractInput_Authors()),
-            "suggest_books_given_trope": self.add_memory_to_runnable(SuggestBookGivenTropeChain()),
-            "browse_available_genres_books_authors": self.add_memory_to_runnable(BrowserChain()),
-            "create_reading_plan": self.add_memory_to_runnable(CreateReadingPlanChain())
-        }
-        
+        # Map intent names to their corresponding reasoning and response chains.
+        # Chains are only built the first time their intent is routed to.
+        self.chain_map = LazyChainMap({
+            "update_profile_info": lambda: self.add_memory_to_runnable(UpdateUserInfoChain()),
+            "insert_new_favorite_author_genre": lambda: self.add_memory_to_runnable(AddFavAuthorGenreChain()),
+            "add_book_to_read_list": lambda: self.add_memory_to_runnable(AddBookReadListChain()),
+            "router": RouterChain,
+            "chitchat": lambda: self.add_memory_to_runnable(ChitChatResponseChain()),
+            "chitchat_class": ChitChatClassifierChain,
+            "suggest_books": lambda: self.add_memory_to_runnable(ExtractInput_Books()),
+            "suggest_authors": lambda: self.add_memory_to_runnable(ExtractInput_Authors()),
+            "suggest_books_given_trope": lambda: self.add_memory_to_runnable(SuggestBookGivenTropeChain()),
+            "browse_available_genres_books_authors": lambda: self.add_memory_to_runnable(BrowserChain()),
+            "create_reading_plan": lambda: self.add_memory_to_runnable(CreateReadingPlanChain()),
+            "rag": RagChain
+        })
 
         # Map of intentions to their corresponding handlers
         self.intent_handlers: Dict[Optional[str], Callable[[Dict[str, str]], str]] = {
@@ -56,32 +76,81 @@ class MainChatbot:
             "suggest_books": self.handle_suggest_books,
             "suggest_authors": self.handle_suggest_authors,
             "suggest_books_given_trope": self.handle_suggest_books_given_trope,
-            "recommend_bookstores_per_district": self.handle_rag,
-            "ask_about_chatbot_features": self.handle_rag,
-            "ask_about_company_info": self.handle_rag,
+            "recommend_bookstores_per_district": partial(self.handle_rag, intent="recommend_bookstores_per_district"),
+            "ask_about_chatbot_features": partial(self.handle_rag, intent="ask_about_chatbot_features"),
+            "ask_about_company_info": partial(self.handle_rag, intent="ask_about_company_info"),
             "browse_available_genres_books_authors": self.handle_browser,
             "create_reading_plan": self.handle_create_reading_plan,
         }
 
+        # Map of intentions to the chains used by the async and streaming handlers
+        self.intent_chains: Dict[str, str] = {
+            "update_profile_info": "update_profile_info",
+            "insert_new_favorite_author_genre": "insert_new_favorite_author_genre",
+            "add_book_to_read_list": "add_book_to_read_list",
+            "suggest_books": "suggest_books",
+            "suggest_authors": "suggest_authors",
+            "suggest_books_given_trope": "suggest_books_given_trope",
+            "browse_available_genres_books_authors": "browse_available_genres_books_authors",
+            "create_reading_plan": "create_reading_plan",
+        }
+
         # Load the intention classifier to determine user intents
         self.intention_classifier = load_intention_classifier()
+        # Score every route utterance with one matrix product instead of the RouteLayer
+        # path, unless SHELFMATE_INTENT_CLASSIFIER=routelayer
+        self.fast_intent_classifier = None
+        if os.getenv("SHELFMATE_INTENT_CLASSIFIER", "vectorized").lower() != "routelayer":
+            self.fast_intent_classifier = IntentClassifier.from_route_layer(self.intention_classifier)
+
+        # Resolve the inputs no route matched with the nearest labelled messages, and only
+        # ask the language models about the ambiguous ones, unless SHELFMATE_FALLBACK_CLASSIFIER=llm
+        self.fallback_classifier = None
+        if os.getenv("SHELFMATE_FALLBACK_CLASSIFIER", "knn").lower() != "llm":
+            self.fallback_classifier = load_fallback_classifier(self.intention_classifier)
+        self.fallback_stats = FallbackStats()
+
+        # Screen every user input for prompt injection before routing it
+        self.prompt_injection_chain = IsPromptInjection()
 
-    def user_login(self, username: str, conversation_id: str) -> None:
-        """Log in a user by setting the user and conversation identifiers.
+        # Worker threads shared by the sessions to run independent stages concurrently
+        self.executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shelfmate")
+
+        # Time spent building the bot, shown in the sidebar of the chatbot page
+        self.warmup_seconds = time.perf_counter() - start_time
+
+    @staticmethod
+    def get_memory_config(username: str, conversation_id: str) -> Dict[str, Any]:
+        """Build the runnable configuration that identifies a user session.
 
         Args:
             username: Identifier for the user.
             conversation_id: Identifier for the conversation.
+
+        Returns:
+            The configuration passed to the chains wrapped with session history.
         """
-        self.username = username
-        self.conversation_id = conversation_id
-        self.memory_config = {
+        return {
             "configurable": {
-                "conversation_id": self.conversation_id,
-                "user_id": self.username,
+                "conversation_id": conversation_id,
+                "user_id": username,
             }
         }
 
+    def get_session_history(self, memory_config: Dict[str, Any]):
+        """Retrieve the chat history of the session described by a memory config.
+
+        Args:
+            memory_config: The session configuration built by get_memory_config.
+
+        Returns:
+            The chat history of the session.
+        """
+        session = memory_config["configurable"]
+        return self.memory.get_session_history(
+            session["user_id"], session["conversation_id"]
+        )
+
     def add_memory_to_runnable(self, original_runnable):
         """Wrap a runnable with session history functionality.
 
@@ -106,6 +175,8 @@ class MainChatbot:
     def get_chain(self, intent: str):
         """Retrieve the reasoning and response chains based on user intent.
 
+        The chain is built on the first request for its intent and reused afterwards.
+
         Args:
             intent: The identified intent of the user input.
 
@@ -114,6 +185,21 @@ class MainChatbot:
         """
         return self.chain_map[intent]
 
+    def get_chain_stats(self) -> Dict[str, Any]:
+        """Report which chains have been built so far by this bot.
+
+        Returns:
+            A dictionary with the build counters and build times per chain.
+        """
+        return self.chain_map.stats()
+
+    def get_fallback_stats(self) -> Dict[str, Any]:
+        """Report which stage resolved the inputs the router could not classify.
+
+        Returns:
+            A dictionary with the counters and latency of each fallback stage.
+        """
+        return self.fallback_stats.stats()
 
     def get_user_intent(self, user_input: Dict):
         """Classify the user intent based on the input text.
@@ -124,6 +210,9 @@ class MainChatbot:
         Returns:
             The classified intent of the user input.
         """
+        if self.fast_intent_classifier is not None:
+            return self.fast_intent_classifier.classify(user_input["user_input"]).intent
+
         # Retrieve possible routes for the user's input using the classifier
         intent_routes = self.intention_classifier.retrieve_multiple_routes(
             user_input["user_input"]
@@ -148,180 +237,196 @@ class MainChatbot:
             )
             return None
 
-    def handle_update_profile_info(self, user_input: Dict[str, str]) -> str:
+    def handle_update_profile_info(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the update profile info intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the update profile info intent
         chain = self.get_chain("update_profile_info")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_new_favorite_author_genre(self, user_input: Dict[str, str]) -> str:
+    def handle_new_favorite_author_genre(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the insert new fav author/genre intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the insert new fav author/genre intent
         chain = self.get_chain("insert_new_favorite_author_genre")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_add_book_to_read_list(self, user_input: Dict[str, str]) -> str:
+    def handle_add_book_to_read_list(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the add book to the read list intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("add_book_to_read_list")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_suggest_books(self, user_input: Dict[str, str]) -> str:
+    def handle_suggest_books(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the suggest books intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("suggest_books")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_suggest_authors(self, user_input: Dict[str, str]) -> str:
+    def handle_suggest_authors(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the suggest authors intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("suggest_authors")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_suggest_books_given_trope(self, user_input: Dict[str, str]) -> str:
+    def handle_suggest_books_given_trope(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the suggest books given trope intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("suggest_books_given_trope")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_browser(self, user_input: Dict[str, str]) -> str:
+    def handle_browser(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the browse available authors, books and genres intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("browse_available_genres_books_authors")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_create_reading_plan(self, user_input: Dict[str, str]) -> str:
+    def handle_create_reading_plan(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle the create reading plan intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the add book to read list intent
         chain = self.get_chain("create_reading_plan")
-        user_input['chat_history'] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
+        user_input['chat_history'] = self.get_session_history(memory_config)
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_rag(self, user_input: Dict[str, str]) -> str:
+    def handle_rag(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any], intent: Optional[str] = None
+    ) -> str:
         """Handle the RAG intent by processing user input and providing a response.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+            intent: The RAG intent, which decides if the answer can come from the answer cache.
 
         Returns:
             The content of the response after processing through the chains.
         """
         # Retrieve reasoning and response chains for the RAG intent
-        rag = RagChain(username=self.username)
+        rag = self.get_chain("rag")
         
         # Generate a response using the output of the reasoning chain
-        response = rag.run_chain(question=user_input['user_input'])
+        response = rag.run_chain(question=user_input['user_input'],
+                                 username=memory_config["configurable"]["user_id"], intent=intent)
 
         return response
 
-    def handle_chitchat_intent(self, user_input: Dict[str, str]) -> str:
+    def handle_chitchat_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
         """Handle chitchat intents
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the new chain.
@@ -330,65 +435,449 @@ class MainChatbot:
         chain = self.get_chain("chitchat")
 
         # Generate a response using the output of the reasoning chain
-        response = chain.invoke(user_input, config=self.memory_config)
+        response = chain.invoke(user_input, config=memory_config)
 
         return response
 
-    def handle_unknown_intent(self, user_input: Dict[str, str]) -> str:
-        """Handle unknown intents by providing a chitchat response.
+    def unknown_intent_steps(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> Generator[Tuple[str, Any], Any, str]:
+        """Steps finding the intent of an input the router could not classify.
+
+        The nearest labelled messages decide first. Only when they are ambiguous the
+        language models are asked if the input is chitchat and, if not, for its intent.
+        The steps are shared by the sync and async paths: each call is yielded as
+        ('knn', text) or (chain name, input message) and its result is sent back.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The intent of the input, 'chitchat' for small talk.
+        """
+        start_time = time.perf_counter()
+        if self.fallback_classifier is not None:
+            prediction = yield "knn", user_input["user_input"]
+            if prediction.intent is not None:
+                self.fallback_stats.record("knn", prediction.intent, time.perf_counter() - start_time)
+                return prediction.intent
+
+        input_message = {
+            "user_input": user_input["user_input"],
+            "chat_history": self.get_session_history(memory_config),
+        }
+
+        if (yield "chitchat_class", input_message).chitchat:
+            self.fallback_stats.record("llm_chitchat", "chitchat", time.perf_counter() - start_time)
+            return "chitchat"
+
+        intent = (yield "router", input_message).intent
+        intent = LLM_INTENT_ALIASES.get(intent, intent)
+        self.fallback_stats.record("llm_router", intent, time.perf_counter() - start_time)
+        return intent
+
+    def resolve_unknown_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Find the intent of an input the router could not classify (see unknown_intent_steps).
+
+        Args:
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The intent of the input, 'chitchat' for small talk.
+        """
+        steps = self.unknown_intent_steps(user_input, memory_config)
+        result = None
+        try:
+            while True:
+                step, argument = steps.send(result)
+                if step == "knn":
+                    result = self.fallback_classifier.classify(argument)
+                else:
+                    result = self.get_chain(step).invoke(argument)
+        except StopIteration as done:
+            return done.value
+
+    def handle_unknown_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Handle unknown intents by resolving their intent with the fallback stages.
+
+        Args:
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the new chain.
         """
+        new_intention = self.resolve_unknown_intent(user_input, memory_config)
+        new_handler = self.intent_handlers.get(new_intention, self.handle_chitchat_intent)
+        return new_handler(user_input, memory_config)
 
-        chitchat_reasoning_chain = self.get_chain("chitchat_class")
-        
-        input_message = {}
+    async def aget_chain(self, intent: str):
+        """Retrieve the chain of an intent without blocking the event loop.
 
-        input_message["user_input"] = user_input["user_input"]
-        input_message["chat_history"] = self.memory.get_session_history(
-            self.username, self.conversation_id
-        )
-        
-        reasoning_output = chitchat_reasoning_chain.invoke(input_message)
-        
-        if reasoning_output.chitchat:
-            return self.handle_chitchat_intent(user_input)
-        else:
-            router_reasoning_chain2 = self.get_chain("router")
-            reasoning_output2 = router_reasoning_chain2.invoke(input_message)
-            new_intention = reasoning_output2.intent
-            new_handler = self.intent_handlers.get(new_intention)
-            return new_handler(user_input)
+        Args:
+            intent: The identified intent of the user input.
 
+        Returns:
+            The chain instance for the intent.
+        """
+        if self.chain_map.is_built(intent):
+            return self.chain_map[intent]
 
+        # Building a chain for the first time is blocking, do it in a worker thread
+        return await asyncio.to_thread(self.get_chain, intent)
 
-    def save_memory(self) -> None:
-        """Save the current memory state of the bot."""
-        self.memory.save_session_history(self.username, self.conversation_id)
+    async def ahandle_chain_intent(
+        self, intent: str, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Asynchronously handle an intent answered by one of the chains with memory.
 
-    def process_user_input(self, user_input: Dict[str, str]) -> str:
-        """Process user input by routing through the appropriate intention pipeline.
+        Args:
+            intent: The identified intent of the user input.
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        chain = await self.aget_chain(intent)
+        user_input['chat_history'] = self.get_session_history(memory_config)
+        response = await chain.ainvoke(user_input, config=memory_config)
+
+        return response
+
+    async def ahandle_rag(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any], intent: Optional[str] = None
+    ) -> str:
+        """Asynchronously handle the RAG intent.
+
+        Args:
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+            intent: The RAG intent, which decides if the answer can come from the answer cache.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        rag = await self.aget_chain("rag")
+
+        return await rag.arun_chain(question=user_input['user_input'],
+                                    username=memory_config["configurable"]["user_id"], intent=intent)
+
+    async def ahandle_chitchat_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Asynchronously handle chitchat intents.
+
+        Args:
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The content of the response after processing through the new chain.
+        """
+        chain = await self.aget_chain("chitchat")
+
+        return await chain.ainvoke(user_input, config=memory_config)
+
+    async def aresolve_unknown_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Asynchronously find the intent of an input the router could not classify.
+
+        Args:
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The intent of the input, 'chitchat' for small talk.
+        """
+        steps = self.unknown_intent_steps(user_input, memory_config)
+        result = None
+        try:
+            while True:
+                step, argument = steps.send(result)
+                if step == "knn":
+                    # The fallback encodes the input locally, which is CPU bound
+                    result = await asyncio.to_thread(self.fallback_classifier.classify, argument)
+                else:
+                    result = await (await self.aget_chain(step)).ainvoke(argument)
+        except StopIteration as done:
+            return done.value
+
+    async def ahandle_unknown_intent(
+        self, user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Asynchronously handle unknown intents by resolving their intent with the fallback stages.
 
         Args:
             user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            The content of the response after processing through the new chain.
+        """
+        new_intention = await self.aresolve_unknown_intent(user_input, memory_config)
+        if new_intention not in self.intent_handlers:
+            return await self.ahandle_chitchat_intent(user_input, memory_config)
+        return await self.ahandle_intent(new_intention, user_input, memory_config)
+
+    async def ahandle_intent(
+        self, intention: Optional[str], user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> str:
+        """Route the input to the async handler of an intention.
+
+        Args:
+            intention: The identified intent of the user input.
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
 
         Returns:
             The content of the response after processing through the chains.
         """
-        # Detect if there are dangers of prompt injection in the user input
-        prompt_injection_chain = IsPromptInjection()
-        result = prompt_injection_chain.invoke(user_input).is_prompt_injection
+        if intention in self.intent_chains:
+            return await self.ahandle_chain_intent(
+                self.intent_chains[intention], user_input, memory_config
+            )
+        if intention == "chitchat":
+            return await self.ahandle_chitchat_intent(user_input, memory_config)
+        if intention in ("recommend_bookstores_per_district", "ask_about_chatbot_features", "ask_about_company_info"):
+            return await self.ahandle_rag(user_input, memory_config, intent=intention)
 
-        if not result:
-            # Classify the user's intent based on their input
-            intention = self.get_user_intent(user_input)
+        return await self.ahandle_unknown_intent(user_input, memory_config)
 
-            # Route the input based on the identified intention
-            handler = self.intent_handlers.get(intention, self.handle_unknown_intent)
-            return handler(user_input)
+
+
+    def stream_intent(
+        self, intention: Optional[str], user_input: Dict[str, str], memory_config: Dict[str, Any]
+    ) -> Iterator[str]:
+        """Route the input to the handler of an intention and stream its response.
+
+        Args:
+            intention: The identified intent of the user input.
+            user_input: The input text from the user.
+            memory_config: The configuration identifying the user session.
+
+        Returns:
+            An iterator over the pieces of the response as they are generated.
+        """
+        if intention in self.intent_chains:
+            chain = self.get_chain(self.intent_chains[intention])
+            user_input['chat_history'] = self.get_session_history(memory_config)
+            yield from chain.stream(user_input, config=memory_config)
+        elif intention == "chitchat":
+            yield from self.get_chain("chitchat").stream(user_input, config=memory_config)
+        elif intention in ("recommend_bookstores_per_district", "ask_about_chatbot_features", "ask_about_company_info"):
+            yield from self.get_chain("rag").stream_chain(question=user_input['user_input'],
+                                                          username=memory_config["configurable"]["user_id"],
+                                                          intent=intention)
         else:
-            return "It was detected prompt injection risks or malicious content in your input."
+            # Unknown intents are resolved by the nearest labelled messages or the language models
+            new_intention = self.resolve_unknown_intent(user_input, memory_config)
+            if new_intention not in self.intent_handlers:
+                new_intention = "chitchat"
+            yield from self.stream_intent(new_intention, user_input, memory_config)
+
+    def save_memory(self, username: str, conversation_id: str) -> None:
+        """Save the memory state of a user session.
+
+        Args:
+            username: Identifier for the user.
+            conversation_id: Identifier for the conversation.
+        """
+        self.memory.save_session_history(username, conversation_id)
+
+    def process_user_input(
+        self,
+        user_input: Dict[str, str],
+        username: str,
+        conversation_id: str,
+        concurrent: bool = False,
+        timings: Optional[Dict[str, Dict[str, float]]] = None,
+    ) -> str:
+        """Process user input by routing through the appropriate intention pipeline.
+
+        Args:
+            user_input: The input text from the user.
+            username: Identifier for the user.
+            conversation_id: Identifier for the conversation.
+            concurrent: If True, screen the input for prompt injection, classify the
+                intent and prefetch the user profile at the same time.
+            timings: Optional dictionary filled with the start, end and duration of
+                each stage of the pipeline, in milliseconds.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        timer = StageTimer()
+        try:
+            if concurrent:
+                return self._process_concurrently(user_input, username, conversation_id, timer)
+
+            # Detect if there are dangers of prompt injection in the user input
+            result = timer.run(
+                "prompt_injection", self.prompt_injection_chain.invoke, user_input
+            ).is_prompt_injection
+
+            if not result:
+                memory_config = self.get_memory_config(username, conversation_id)
+
+                # Classify the user's intent based on their input
+                intention = timer.run("intent_classification", self.get_user_intent, user_input)
+
+                # Route the input based on the identified intention
+                handler = self.intent_handlers.get(intention, self.handle_unknown_intent)
+                return timer.run("handler", handler, user_input, memory_config)
+            else:
+                return PROMPT_INJECTION_RESPONSE
+        finally:
+            if timings is not None:
+                timings.clear()
+                timings.update(timer.report())
+
+    def _process_concurrently(
+        self, user_input: Dict[str, str], username: str, conversation_id: str, timer: StageTimer
+    ) -> str:
+        """Run the prompt injection check, intent classification and read-only
+        prefetches together, then wait for the injection verdict before the handler
+        performs any writes or generates the response.
+
+        Args:
+            user_input: The input text from the user.
+            username: Identifier for the user.
+            conversation_id: Identifier for the conversation.
+            timer: The timer recording the stages of the turn.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        is_prompt_injection, intention = self._screen_and_classify(user_input, username, timer)
+
+        # Nothing is written nor answered before the input is known to be safe
+        if is_prompt_injection:
+            return PROMPT_INJECTION_RESPONSE
+
+        memory_config = self.get_memory_config(username, conversation_id)
+
+        # Route the input based on the identified intention
+        handler = self.intent_handlers.get(intention, self.handle_unknown_intent)
+        return timer.run("handler", handler, user_input, memory_config)
+
+    def _screen_and_classify(
+        self, user_input: Dict[str, str], username: str, timer: StageTimer
+    ) -> Tuple[bool, Optional[str]]:
+        """Check the input for prompt injection while classifying its intent and
+        prefetching the user profile in the worker threads.
+
+        Args:
+            user_input: The input text from the user.
+            username: Identifier for the user.
+            timer: The timer recording the stages of the turn.
+
+        Returns:
+            A tuple with the prompt injection verdict and the classified intent.
+        """
+        injection_future = self.executor.submit(
+            timer.run, "prompt_injection", self.prompt_injection_chain.invoke, user_input
+        )
+        intent_future = self.executor.submit(
+            timer.run, "intent_classification", self.get_user_intent, user_input
+        )
+        # Warm the profile cache read by the handlers (district, favorites, read list)
+        self.executor.submit(timer.run, "profile_prefetch", user_profiles.get, username)
+
+        if injection_future.result().is_prompt_injection:
+            return True, None
+
+        return False, intent_future.result()
+
+    def stream_user_input(
+        self,
+        user_input: Dict[str, str],
+        username: str,
+        conversation_id: str,
+        timings: Optional[Dict[str, Dict[str, float]]] = None,
+    ) -> Iterator[str]:
+        """Process user input and stream the response as the language model generates it.
+
+        Args:
+            user_input: The input text from the user.
+            username: Identifier for the user.
+            conversation_id: Identifier for the conversation.
+            timings: Optional dictionary filled with the start, end and duration of
+                each stage of the pipeline, in milliseconds.
+
+        Returns:
+            An iterator over the pieces of the response.
+        """
+        timer = StageTimer()
+        try:
+            is_prompt_injection, intention = self._screen_and_classify(user_input, username, timer)
+
+            # Nothing is written nor answered before the input is known to be safe
+            if is_prompt_injection:
+                yield PROMPT_INJECTION_RESPONSE
+                return
+
+            memory_config = self.get_memory_config(username, conversation_id)
+            yield from timer.stream(
+                "handler", self.stream_intent(intention, user_input, memory_config)
+            )
+        finally:
+            if timings is not None:
+                timings.clear()
+                timings.update(timer.report())
+
+    async def aprocess_user_input(
+        self,
+        user_input: Dict[str, str],
+        username: str,
+        conversation_id: str,
+        timings: Optional[Dict[str, Dict[str, float]]] = None,
+    ) -> str:
+        """Asynchronously process user input by routing it through the intention pipeline.
+
+        The prompt injection check, the intent classification and the profile prefetch
+        are awaited together, so a single event loop can serve many conversations.
+
+        Args:
+            user_input: The input text from the user.
+            username: Identifier for the user.
+            conversation_id: Identifier for the conversation.
+            timings: Optional dictionary filled with the start, end and duration of
+                each stage of the pipeline, in milliseconds.
+
+        Returns:
+            The content of the response after processing through the chains.
+        """
+        timer = StageTimer()
+        try:
+            injection, intention, _ = await asyncio.gather(
+                timer.arun("prompt_injection", self.prompt_injection_chain.ainvoke(user_input)),
+                # The router encodes the input locally, which is CPU bound
+                timer.arun("intent_classification", asyncio.to_thread(self.get_user_intent, user_input)),
+                # Warm the profile cache read by the handlers, a failure here is not fatal
+                timer.arun("profile_prefetch", asyncio.to_thread(user_profiles.get, username)),
+                return_exceptions=True,
+            )
+            for result in (injection, intention):
+                if isinstance(result, BaseException):
+                    raise result
+
+            # Nothing is written nor answered before the input is known to be safe
+            if injection.is_prompt_injection:
+                return PROMPT_INJECTION_RESPONSE
+
+            memory_config = self.get_memory_config(username, conversation_id)
+            return await timer.arun(
+                "handler", self.ahandle_intent(intention, user_input, memory_config)
+            )
+        finally:
+            if timings is not None:
+                timings.clear()
+                timings.update(timer.report())
@@ -0,0 +1,175 @@
+# Import necessary modules and classes
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from chatbot.catalog.resolver import EntityResolver
+from chatbot.db.replica import get_catalog_connection
+
+
+class CatalogNames:
+    """Immutable snapshot of the genre and author names of the catalog."""
+
+    def __init__(self, genres: Dict[str, int], authors: Dict[str, int]):
+        """Initialize the snapshot.
+
+        Args:
+            genres: Map of genre names to their ids.
+            authors: Map of author names to their ids.
+        """
+        self.genre_ids = genres
+        self.author_ids = authors
+        self.author_names = {author_id: name for name, author_id in authors.items()}
+        self.genres: Tuple[str, ...] = tuple(genres)
+        self.authors: Tuple[str, ...] = tuple(authors)
+        # N-gram indexes with exact and normalized lookups, so only a shortlist of names is fuzzy scored
+        self.genre_resolver = EntityResolver(self.genres)
+        self.author_resolver = EntityResolver(self.authors)
+        self.loaded_at = time.monotonic()
+
+    def authors_by_id(self, author_ids: Iterable[int]) -> List[str]:
+        """Find the names of several authors.
+
+        Args:
+            author_ids: The ids of the authors.
+
+        Returns:
+            The names of the authors found, in the same order.
+        """
+        return [self.author_names[author_id] for author_id in author_ids if author_id in self.author_names]
+
+    def match_genre(self, name: str) -> Tuple[str, int]:
+        """Find the closest genre to a name.
+
+        Args:
+            name: The genre name extracted from the user input.
+
+        Returns:
+            The closest genre and its similarity score, from 0 to 100.
+        """
+        return self.genre_resolver.best(name) or (name, 0)
+
+    def match_author(self, name: str) -> Tuple[str, int]:
+        """Find the closest author to a name.
+
+        Args:
+            name: The author name extracted from the user input.
+
+        Returns:
+            The closest author and its similarity score, from 0 to 100.
+        """
+        return self.author_resolver.best(name) or (name, 0)
+
+
+def load_catalog_names() -> CatalogNames:
+    """Load the genre and author names from the catalog.
+
+    Returns:
+        A snapshot of the names of the catalog.
+    """
+    with get_catalog_connection() as con:
+        cursor = con.cursor()
+        cursor.execute("SELECT genre_id, genre FROM genres")
+        genres = {genre: genre_id for genre_id, genre in cursor.fetchall()}
+        cursor = con.cursor()
+        cursor.execute("SELECT author_id, author_name FROM authors")
+        authors = {author_name: author_id for author_id, author_name in cursor.fetchall()}
+
+    return CatalogNames(genres, authors)
+
+
+class CatalogNameCache:
+    """Process-wide cache of the catalog names used to resolve genres and authors.
+
+    The names are loaded once and shared by every extractor. After the time-to-live
+    the stale snapshot keeps being served while a background thread reloads it
+    (stale-while-revalidate), so no request waits for the database after the first.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, loader: Callable[[], CatalogNames] = load_catalog_names):
+        """Initialize the cache.
+
+        Args:
+            ttl_seconds: Number of seconds a snapshot is considered fresh.
+            loader: Function that loads a new snapshot.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.loader = loader
+        self.names: Optional[CatalogNames] = None
+        self.loads = 0
+        self.failed_refreshes = 0
+        self.last_load_seconds = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _load(self) -> CatalogNames:
+        start_time = time.perf_counter()
+        names = self.loader()
+        self.last_load_seconds = time.perf_counter() - start_time
+        self.loads += 1
+        self.names = names
+        return names
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self._load()
+        except Exception as e:
+            # Keep serving the stale names, the next request will try again
+            self.failed_refreshes += 1
+            print(f"Catalog names refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get(self) -> CatalogNames:
+        """Retrieve the current snapshot of the catalog names.
+
+        Returns:
+            The catalog names, loaded on the first call.
+        """
+        names = self.names
+        if names is None:
+            with self._lock:
+                # Concurrent first requests wait for a single load
+                if self.names is None:
+                    return self._load()
+                return self.names
+
+        if time.monotonic() - names.loaded_at >= self.ttl_seconds:
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh_in_background, name="catalog-names-refresh", daemon=True
+                    ).start()
+
+        return names
+
+    def refresh(self) -> CatalogNames:
+        """Reload the catalog names right away.
+
+        Returns:
+            The new snapshot of the catalog names.
+        """
+        with self._lock:
+            return self._load()
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the state of the cache.
+
+        Returns:
+            A dictionary with the load counters, the age and the size of the snapshot.
+        """
+        names = self.names
+        return {
+            "loads": self.loads,
+            "failed_refreshes": self.failed_refreshes,
+            "last_load_seconds": self.last_load_seconds,
+            "age_seconds": time.monotonic() - names.loaded_at if names else None,
+            "genres": len(names.genres) if names else 0,
+            "authors": len(names.authors) if names else 0,
+        }
+
+
+# Catalog names shared by every extractor of the process
+catalog_names = CatalogNameCache()
@@ -0,0 +1,216 @@
+# Import necessary modules and classes
+import argparse
+import random
+import re
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fuzzywuzzy import fuzz, process
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a genre, author or title so that trivial differences are ignored.
+
+    Accents, case, punctuation and repeated whitespace are removed.
+
+    Args:
+        name: The name to normalize.
+
+    Returns:
+        The normalized key of the name.
+    """
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    name = re.sub(r"[^\w\s]", " ", name.casefold())
+    return " ".join(name.split())
+
+
+def ngrams(key: str, n: int = 3) -> List[str]:
+    """Split a normalized name into its character n-grams.
+
+    The name is padded with spaces so the start and end of each word count too.
+
+    Args:
+        key: The normalized name.
+        n: The size of the n-grams.
+
+    Returns:
+        The distinct n-grams of the name.
+    """
+    padded = f" {key} "
+    if len(padded) <= n:
+        return [padded]
+    return list(dict.fromkeys(padded[i:i + n] for i in range(len(padded) - n + 1)))
+
+
+class EntityResolver:
+    """Fuzzy lookup of a name in a large list of genres, authors or titles.
+
+    Instead of scoring the query against every name like process.extractOne, an
+    inverted index of character n-grams shortlists the names that share the most
+    n-grams with the query, and only those are scored with the same scorer as
+    extractOne (fuzz.WRatio). Exact and normalized matches are answered from a
+    dictionary without any scoring.
+    """
+
+    def __init__(
+        self,
+        names: Sequence[str],
+        n: int = 3,
+        max_candidates: int = 100,
+        max_posting_ratio: float = 0.2,
+    ):
+        """Build the index.
+
+        Args:
+            names: The names to search.
+            n: The size of the n-grams.
+            max_candidates: Number of shortlisted names that are scored.
+            max_posting_ratio: N-grams found in more than this share of the names
+                (like ' th') are too common to tell names apart and are skipped
+                while shortlisting, unless the query has no other n-grams.
+        """
+        self.names: Tuple[str, ...] = tuple(names)
+        self.n = n
+        self.max_candidates = max_candidates
+        self.max_posting = max(1, int(len(self.names) * max_posting_ratio))
+
+        self.exact: Dict[str, int] = {}
+        self.normalized: Dict[str, int] = {}
+        postings: Dict[str, List[int]] = {}
+        for position, name in enumerate(self.names):
+            self.exact.setdefault(name, position)
+            key = normalize_name(name)
+            self.normalized.setdefault(key, position)
+            for gram in ngrams(key, n):
+                postings.setdefault(gram, []).append(position)
+
+        # Compact integer arrays keep the index small for millions of names
+        self.postings: Dict[str, array] = {gram: array("I", ids) for gram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def shortlist(self, key: str) -> List[int]:
+        """Find the names that share the most n-grams with a normalized query.
+
+        Args:
+            key: The normalized query.
+
+        Returns:
+            The positions of the shortlisted names, best first.
+        """
+        grams = [gram for gram in ngrams(key, self.n) if gram in self.postings]
+        rare = [gram for gram in grams if len(self.postings[gram]) <= self.max_posting]
+
+        counts: Counter = Counter()
+        for gram in rare or grams:
+            counts.update(self.postings[gram])
+
+        return [position for position, _ in counts.most_common(self.max_candidates)]
+
+    def resolve(self, query: str, k: int = 1) -> List[Tuple[str, int]]:
+        """Find the names closest to a query.
+
+        Args:
+            query: The name to look for.
+            k: Number of matches to return.
+
+        Returns:
+            Up to k names with their similarity score from 0 to 100, best first.
+        """
+        if query in self.exact:
+            return [(query, 100)]
+
+        key = normalize_name(query)
+        if key in self.normalized:
+            return [(self.names[self.normalized[key]], 100)]
+
+        candidates = [self.names[position] for position in self.shortlist(key)]
+        scored = [(name, fuzz.WRatio(query, name)) for name in candidates]
+        scored.sort(key=lambda match: match[1], reverse=True)
+        return scored[:k]
+
+    def best(self, query: str) -> Optional[Tuple[str, int]]:
+        """Find the closest name to a query, like process.extractOne.
+
+        Args:
+            query: The name to look for.
+
+        Returns:
+            The closest name and its score, or None if nothing shares an n-gram with the query.
+        """
+        matches = self.resolve(query, k=1)
+        return matches[0] if matches else None
+
+
+def _misspell(name: str, rng: random.Random) -> str:
+    # Drop, swap or lowercase characters the way users mistype names
+    chars = list(name)
+    for _ in range(max(1, len(chars) // 8)):
+        position = rng.randrange(len(chars))
+        edit = rng.choice(["drop", "swap", "lower"])
+        if edit == "drop" and len(chars) > 3:
+            del chars[position]
+        elif edit == "swap" and position < len(chars) - 1:
+            chars[position], chars[position + 1] = chars[position + 1], chars[position]
+        else:
+            chars[position] = chars[position].lower()
+    return "".join(chars)
+
+
+def benchmark(names: Sequence[str], queries: int = 200, seed: int = 42, scan: bool = True) -> Dict[str, float]:
+    """Compare the resolver with a linear process.extractOne scan.
+
+    Args:
+        names: The names to search.
+        queries: Number of misspelled names to look up.
+        seed: Seed of the random misspellings.
+        scan: If False, the slow extractOne baseline is skipped.
+
+    Returns:
+        The build time, the average lookup times in milliseconds and how often the
+        resolver agrees with extractOne.
+    """
+    rng = random.Random(seed)
+    sample = [_misspell(name, rng) for name in rng.sample(list(names), min(queries, len(names)))]
+
+    start_time = time.perf_counter()
+    resolver = EntityResolver(names)
+    report = {"names": len(names), "build_seconds": time.perf_counter() - start_time}
+
+    start_time = time.perf_counter()
+    indexed = [resolver.best(query) for query in sample]
+    report["resolver_ms"] = (time.perf_counter() - start_time) / len(sample) * 1000
+
+    if scan:
+        start_time = time.perf_counter()
+        scanned = [process.extractOne(query, names) for query in sample]
+        report["extract_one_ms"] = (time.perf_counter() - start_time) / len(sample) * 1000
+        # Ties between names with the same score count as agreement
+        report["agreement"] = sum(
+            match is not None and match[1] == expected[1] for match, expected in zip(indexed, scanned)
+        ) / len(sample)
+
+    return report
+
+
+if __name__ == "__main__":
+    from chatbot.db.replica import DATA_DIR, read_catalog_csv
+
+    parser = argparse.ArgumentParser(description="Benchmark the entity resolver against process.extractOne.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of misspelled author names to look up.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Repeat the author list this many times with suffixes to simulate a larger catalog.")
+    parser.add_argument("--no-scan", action="store_true", help="Skip the extractOne baseline.")
+    args = parser.parse_args()
+
+    authors = [row[1] for row in read_catalog_csv("authors", DATA_DIR)]
+    names = authors + [f"{author} {copy}" for copy in range(1, args.scale) for author in authors]
+
+    report = benchmark(names, args.queries, scan=not args.no_scan)
+    for metric, value in report.items():
+        print(f"{metric}: {value:.3f}" if isinstance(value, float) else f"{metric}: {value}")
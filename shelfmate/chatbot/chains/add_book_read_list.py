@@ -1,13 +1,16 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+import asyncio
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
+from chatbot.profile import user_profiles
 from pydantic import BaseModel
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
-import openai
 import sqlitecloud
-from pinecone import Pinecone
+from chatbot.db.pool import get_connection
+from chatbot.vectors.retrieval import get_retrieval_service
+from chatbot.vectors.embeddings import embed_text
 
 class BookToAdd(BaseModel):
     book_id: str # 
@@ -58,13 +61,23 @@ class ExtractBookToAdd(Runnable):
                 "chat_history": inputs["chat_history"],
                 "format_instructions": self.format_instructions,
             })
-        pinecone = Pinecone()
-        index = pinecone.Index('books')
+        return self.resolve(result)
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            })
+        # The embedding and vector search clients block, keep them off the event loop
+        return await asyncio.to_thread(self.resolve, result)
+
+    def resolve(self, result):
+        index = get_retrieval_service()
 
         title = result.book_id
-        embedding = openai.embeddings.create(
-            model="text-embedding-ada-002",
-            input=[title]).data[0].embedding
+        embedding = embed_text(title)
 
         filter_condition = {"type": {"$eq": "title"}}
         search_results = index.query(
@@ -84,7 +97,7 @@ class ExtractBookToAdd(Runnable):
 class AddBookOutput(BaseModel):
     output: str
 
-class AddBookReadListChain(Runnable): 
+class AddBookReadListChain(ExtractProcessRespondChain): 
 
     def __init__(self, memory: bool = True) -> str:
         self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
@@ -120,49 +133,49 @@ class AddBookReadListChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory) 
         self.output_parser = PydanticOutputParser(pydantic_object=AddBookOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__}) 
+        self.build_response_chains(self.prompt, self.output_parser)
 
 
-    def invoke(self, user_input, config): 
-        username = config.get('configurable').get('user_id') 
-        book_info = self.extract_chain.invoke(user_input) 
+    def process(self, book_info, username):
         if book_info.rating == 0:
             book_info.rating = None
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-
-        cursor.execute(f"SELECT book_id FROM read_list WHERE username = ? AND book_id = ?", (username, book_info.book_id))
-        query_results = cursor.fetchone()
-
-        if not query_results: 
-            try:
-                cursor = con.cursor()
-                cursor.execute(
-                    "INSERT INTO read_list (username, book_id, rating, did_not_finish_flag) VALUES (?, ?, ?, ?)",
-                    (username, book_info.book_id, book_info.rating, book_info.did_not_finish_flag),
-                )
-                con.commit()
-                cursor = con.cursor()
-                cursor.execute("SELECT title FROM books WHERE book_id = ?", (book_info.book_id,))
-                title = cursor.fetchone()[0]
-                self.status = 'success'
-
-            except sqlitecloud.OperationalError as e:
-                print(f"Error: {e}")
-                self.status = 'error'
-            finally:
-                cursor.close()
-                con.close()
-        
-        else:
-            if query_results[0]==book_info.book_id:
-                self.status = 'no_change'
-        con.close()
-        response = self.chain.invoke({ 
+        with get_connection() as con:
+            cursor = con.cursor()
+
+            cursor.execute(f"SELECT book_id FROM read_list WHERE username = ? AND book_id = ?", (username, book_info.book_id))
+            query_results = cursor.fetchone()
+
+            if not query_results: 
+                try:
+                    cursor = con.cursor()
+                    cursor.execute(
+                        "INSERT INTO read_list (username, book_id, rating, did_not_finish_flag) VALUES (?, ?, ?, ?)",
+                        (username, book_info.book_id, book_info.rating, book_info.did_not_finish_flag),
+                    )
+                    con.commit()
+                    # The cached profile of the user is now outdated
+                    user_profiles.invalidate(username)
+                    cursor = con.cursor()
+                    cursor.execute("SELECT title FROM books WHERE book_id = ?", (book_info.book_id,))
+                    title = cursor.fetchone()[0]
+                    status = 'success'
+
+                except sqlitecloud.OperationalError as e:
+                    print(f"Error: {e}")
+                    status = 'error'
+                finally:
+                    cursor.close()
+
+            else:
+                if query_results[0]==book_info.book_id:
+                    status = 'no_change'
+
+        return status
+
+    def get_response_inputs(self, user_input, status):
+        return { 
             "user_input": user_input['user_input'],
             'chat_history': user_input['chat_history'], 
-            "status": self.status,
+            "status": status,
             "format_instructions": self.format_instructions
-        })
-
-        return response.output
\ No newline at end of file
+        }
\ No newline at end of file
@@ -1,10 +1,14 @@
+import asyncio
 from langchain.prompts import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate,
     MessagesPlaceholder,
     SystemMessagePromptTemplate,
 )
+from langchain.schema.runnable.base import Runnable
+from langchain_core.output_parsers import JsonOutputParser
 from pydantic import BaseModel, Field
+from typing import Any, Dict, Iterator, Optional
 
 
 class PromptTemplate(BaseModel):
@@ -56,4 +60,137 @@ def generate_prompt_templates(
             ]
         )
 
-    return prompt
\ No newline at end of file
+    return prompt
+
+def stream_output_field(chain, inputs: dict, field: str = "output") -> Iterator[str]:
+    """Stream the text of a field of a JSON response as the language model generates it.
+
+    Args:
+        chain: A runnable ending with a JsonOutputParser, which yields partial objects.
+        inputs: The inputs of the chain.
+        field: The name of the field holding the text for the user.
+
+    Returns:
+        An iterator over the new pieces of text of the field.
+    """
+    emitted = ""
+    for partial in chain.stream(inputs):
+        text = partial.get(field) if isinstance(partial, dict) else None
+        if isinstance(text, str) and len(text) > len(emitted):
+            yield text[len(emitted):]
+            emitted = text
+
+
+def get_username(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Retrieve the user of a session from the configuration of a call."""
+    return (config or {}).get("configurable", {}).get("user_id")
+
+
+class ExtractProcessRespondChain(Runnable):
+    """Skeleton of the chains that answer in three steps: the language model extracts
+    the request of the user, process acts on it (database, vector search) and the
+    language model phrases the result.
+
+    Subclasses set extract_chain and call build_response_chains in their constructor,
+    then define process and get_response_inputs. The invoke, ainvoke and stream paths
+    share these steps, so they cannot drift apart.
+    """
+
+    # Answer 'Error: ...' instead of raising when the extraction or the processing fails
+    errors_as_answers = False
+
+    def build_response_chains(self, prompt, output_parser) -> None:
+        """Build the chain phrasing the result and its streaming version.
+
+        Args:
+            prompt: The prompt of the response.
+            output_parser: The parser of the response, whose model has an 'output' field.
+        """
+        self.chain = (prompt | self.llm | output_parser).with_config({"run_name": self.__class__.__name__})
+        # Same prompt parsed as partial JSON, so the answer can be streamed while it is generated
+        self.stream_chain = prompt | self.llm | JsonOutputParser()
+
+    def extract(self, user_input, config=None):
+        """Extract the request of the user with the extract chain."""
+        return self.extract_chain.invoke(user_input)
+
+    async def aextract(self, user_input, config=None):
+        """Asynchronously extract the request of the user with the extract chain."""
+        return await self.extract_chain.ainvoke(user_input)
+
+    def process(self, extracted, username: Optional[str]):
+        """Act on the extracted request.
+
+        Args:
+            extracted: The output of the extract chain.
+            username: Identifier for the user.
+
+        Returns:
+            The result passed to get_response_inputs.
+        """
+        raise NotImplementedError
+
+    async def aprocess(self, extracted, username: Optional[str]):
+        """Asynchronously act on the extracted request.
+
+        The processing calls blocking clients (sqlitecloud, Pinecone, OpenAI embeddings),
+        so by default it runs in a worker thread.
+        """
+        return await asyncio.to_thread(self.process, extracted, username)
+
+    def get_response_inputs(self, user_input: Dict[str, Any], processed) -> Dict[str, Any]:
+        """Build the inputs of the response chain from the result of process."""
+        raise NotImplementedError
+
+    def direct_answer(self, processed) -> Optional[Any]:
+        """Return the result of process as the answer without phrasing it, or None to phrase it.
+
+        By default every result is phrased by the language model.
+        """
+        return None
+
+    def invoke(self, user_input, config=None, **kwargs):
+        try:
+            processed = self.process(self.extract(user_input, config), get_username(config))
+        except Exception as e:
+            if not self.errors_as_answers:
+                raise
+            return f"Error: {e}"
+
+        answer = self.direct_answer(processed)
+        if answer is not None:
+            return answer
+
+        return self.chain.invoke(self.get_response_inputs(user_input, processed)).output
+
+    async def ainvoke(self, user_input, config=None, **kwargs):
+        try:
+            extracted = await self.aextract(user_input, config)
+            processed = await self.aprocess(extracted, get_username(config))
+        except Exception as e:
+            if not self.errors_as_answers:
+                raise
+            return f"Error: {e}"
+
+        answer = self.direct_answer(processed)
+        if answer is not None:
+            return answer
+
+        response = await self.chain.ainvoke(self.get_response_inputs(user_input, processed))
+        return response.output
+
+    def stream(self, user_input, config=None, **kwargs):
+        try:
+            processed = self.process(self.extract(user_input, config), get_username(config))
+        except Exception as e:
+            if not self.errors_as_answers:
+                raise
+            yield f"Error: {e}"
+            return
+
+        answer = self.direct_answer(processed)
+        if answer is not None:
+            yield answer
+            return
+
+        yield from stream_output_field(self.stream_chain, self.get_response_inputs(user_input, processed))
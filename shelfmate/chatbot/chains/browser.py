@@ -1,4 +1,5 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates
+import asyncio
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.agents import Tool
@@ -6,10 +7,10 @@ from langchain.agents import AgentExecutor
 from langchain.tools import BaseTool
 from langchain.output_parsers import PydanticOutputParser
 from langchain_community.utilities.sql_database import SQLDatabase
-from fuzzywuzzy import process
 from pydantic import BaseModel
+from chatbot.catalog.cache import catalog_names
 from typing import Type
-import sqlitecloud  
+from chatbot.db.replica import get_catalog_connection
 
 class QueryType(BaseModel):
     query_type: str
@@ -19,7 +20,7 @@ class QueryType(BaseModel):
 
 # Define ExtractQueryType class
 class ExtractQueryType(Runnable):
-    def __init__(self, llm, memory=False):
+    def __init__(self, llm, memory=False, catalog=None):
         super().__init__()
         self.llm = llm
 
@@ -55,14 +56,8 @@ class ExtractQueryType(Runnable):
 
         self.chain = self.prompt | self.llm | self.output_parser
 
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        cursor.execute("SELECT genre FROM genres")
-        self.genres = [row[0] for row in cursor.fetchall()]
-        cursor = con.cursor()
-        cursor.execute("SELECT author_name FROM authors")
-        self.authors = [row[0] for row in cursor.fetchall()]
-        con.close()
+        # Genre and author names shared with the other extractors
+        self.catalog = catalog or catalog_names
 
     def invoke(self, inputs):
         # Pass user input and format instructions to the chain
@@ -72,13 +67,27 @@ class ExtractQueryType(Runnable):
             "format_instructions": self.format_instructions
         })
 
+        return self.resolve(result)
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke({
+            "user_input": inputs["user_input"],
+            "chat_history": inputs["chat_history"],
+            "format_instructions": self.format_instructions
+        })
+
+        # Fuzzy matching is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.resolve, result)
+
+    def resolve(self, result):
+        names = self.catalog.get()
         # Perform fuzzy matching for genres or authors
         if result.query_type in ['authors_by_genre', 'books_by_genre']:
-            closest_match, score = process.extractOne(result.value, self.genres)
+            closest_match, score = names.match_genre(result.value)
             if score > 80:  # Adjust the threshold as needed
                 result.value = closest_match
         elif result.query_type == 'books_by_author':
-            closest_match, score = process.extractOne(result.value, self.authors)
+            closest_match, score = names.match_author(result.value)
             if score > 80:
                 result.value = closest_match
 
@@ -88,7 +97,7 @@ class ExtractQueryType(Runnable):
 class Output(BaseModel):
     output:str
 
-class BrowserChain(Runnable):
+class BrowserChain(ExtractProcessRespondChain):
     name: str = "BrowserChain"
     description: str = (
         "Queries the database for genres, authors, or books based on user input, "
@@ -96,6 +105,7 @@ class BrowserChain(Runnable):
     )
     args_schema: Type[BaseModel] = QueryType
     return_direct: bool = True
+    errors_as_answers = True
 
     def __init__(self, memory=True) -> str:
         # Initialize the LLM and extract query information
@@ -132,15 +142,13 @@ class BrowserChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=Output)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
+        self.build_response_chains(self.prompt, self.output_parser)
     
-    def invoke(self, user_input, config):
-        # Define the database path and connect
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
+    def process(self, query_info, username):
+        # Every query of the browser only reads the catalog
+        with get_catalog_connection() as con:
+            cursor = con.cursor()
 
-        try:
-            query_info = self.extract_chain.invoke(user_input)
             num_results = query_info.num_results
 
             # Handle 'list_genres' query type
@@ -148,9 +156,9 @@ class BrowserChain(Runnable):
                 query = f"SELECT genre FROM genres LIMIT {num_results}"
                 results = cursor.execute(query).fetchall()
                 if not results:
-                    self.status = "It was not possible to find any genres. Double-check the genre name or try a different query."
+                    status = "It was not possible to find any genres. Double-check the genre name or try a different query."
                 results_str = str(results).strip("[()]\"").replace(",)", "").replace("(", "").strip(",\"")
-                self.status =  f"Genres: {results_str}. Let me know if you want more suggestions"
+                status =  f"Genres: {results_str}. Let me know if you want more suggestions"
 
             # Handle 'authors_by_genre' query type
             elif query_info.query_type == 'authors_by_genre':
@@ -159,13 +167,13 @@ class BrowserChain(Runnable):
                     SELECT a.author_name FROM authors a 
                     JOIN genres g ON a.top_genre = g.genre_id 
                     WHERE g.genre = '{genre}' ORDER BY RANDOM() LIMIT {num_results}"""
-                
+
                 cursor = con.cursor()
                 results = cursor.execute(query).fetchall()
                 if not results:
-                    self.status = f"It was not possible to find any authors for the genre '{genre}'. Please check the spelling or try another genre."
+                    status = f"It was not possible to find any authors for the genre '{genre}'. Please check the spelling or try another genre."
                 results_str = str(results).strip("[()]\"").replace(",)", "").replace("(", "").strip(",\"")
-                self.status =  f"Writers who write in the '{genre}' genre: {results_str}. Would you like more recommendations?"
+                status =  f"Writers who write in the '{genre}' genre: {results_str}. Would you like more recommendations?"
 
             # Handle 'books_by_genre' query type
             elif query_info.query_type == 'books_by_genre':
@@ -179,9 +187,9 @@ class BrowserChain(Runnable):
                 cursor = con.cursor()
                 results = cursor.execute(query).fetchall()
                 if not results:
-                    self.status = f"It was not possible to find any books for the genre '{genre}' in our collection. You can try another genre or let me know if you need suggestions."
+                    status = f"It was not possible to find any books for the genre '{genre}' in our collection. You can try another genre or let me know if you need suggestions."
                 results_str = str(results).strip("[()]\"").replace(",)", "").replace("(", "").strip(",\"")
-                self.status = f"Books from the '{genre}' genre: {results_str}. Let me know if you'd like more book recommendations."
+                status = f"Books from the '{genre}' genre: {results_str}. Let me know if you'd like more book recommendations."
 
             # Handle 'books_by_author' query type
             elif query_info.query_type == 'books_by_author':
@@ -191,26 +199,24 @@ class BrowserChain(Runnable):
                     JOIN authors_books ab ON b.book_id = ab.book_id 
                     JOIN authors a ON ab.author_id = a.author_id 
                     WHERE a.author_name = '{author}' ORDER BY RANDOM() LIMIT {num_results}"""
-                
+
                 cursor = con.cursor()
                 results = cursor.execute(query).fetchall()
                 if not results:
-                    self.status = f"It was not possible to find any books by the author '{author}'. Perhaps you'd like to try a different author or genre?"
+                    status = f"It was not possible to find any books by the author '{author}'. Perhaps you'd like to try a different author or genre?"
                 results_str = str(results).strip("[()]\"").replace(",)", "").replace("(", "").strip(",\"")
-                self.status = f"Books written by '{author}': {results_str}. Let me know if you'd like more options or have a specific book in mind."
+                status = f"Books written by '{author}': {results_str}. Let me know if you'd like more options or have a specific book in mind."
 
             # Handle invalid query types
             else:
-                self.status = "Input not understandable"
+                status = "Input not understandable"
 
-        except Exception as e:
-            return f"Error: {e}"
+        return status
 
-        response =  self.chain.invoke({
+    def get_response_inputs(self, user_input, status):
+        return {
             "user_input": user_input['user_input'],
             'chat_history': user_input['chat_history'],
-            "status": self.status,
+            "status": status,
             "format_instructions": self.format_instructions
-        })
-
-        return response.output
+        }
@@ -63,6 +63,16 @@ class ChitChatClassifierChain(Runnable):
         )
         return result
 
+    async def ainvoke(self, inputs, config=None, **kwargs) -> ChitChatClassifier:
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            },
+        )
+        return result
+
 
 class ChitChatResponseChain(Runnable):
     def __init__(self, memory=True):
@@ -103,4 +113,10 @@ class ChitChatResponseChain(Runnable):
         self.chain = self.prompt | self.llm | self.output_parser
 
     def invoke(self, inputs, config=None, **kwargs):
-        return self.chain.invoke(inputs, config=config)
\ No newline at end of file
+        return self.chain.invoke(inputs, config=config)
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        return await self.chain.ainvoke(inputs, config=config)
+
+    def stream(self, inputs, config=None, **kwargs):
+        yield from self.chain.stream(inputs, config=config)
@@ -1,33 +1,30 @@
 import ast
+import asyncio
 from langchain_community.utilities.sql_database import SQLDatabase
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
+from chatbot.profile import user_profiles
 from pydantic import BaseModel
+from chatbot.catalog.cache import catalog_names
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
 import sqlitecloud
-from fuzzywuzzy import process
+from chatbot.db.pool import get_connection
 
 class FavAuthorGenreToInsert(BaseModel):
     field_to_insert: str
     value: str
 
 class ExtractFavAuthorGenreToInsert(Runnable):
-    def __init__(self, llm, memory=False):
+    def __init__(self, llm, memory=False, catalog=None):
         super().__init__()
 
         self.llm = llm
 
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        cursor.execute("SELECT genre FROM genres")
-        self.genres_list = [row[0] for row in cursor.fetchall()]
-        cursor = con.cursor()
-        cursor.execute("SELECT author_name FROM authors")
-        self.authors_list = [row[0] for row in cursor.fetchall()]
-        con.close()
+        # Genre and author names shared with the other extractors
+        self.catalog = catalog or catalog_names
         
         prompt_template = PromptTemplate(
             system_template = """
@@ -64,33 +61,34 @@ class ExtractFavAuthorGenreToInsert(Runnable):
                 "chat_history": inputs["chat_history"],
                 "format_instructions": self.format_instructions,
             })
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
+        return self.resolve(result)
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            })
+        # Fuzzy matching is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.resolve, result)
+
+    def resolve(self, result):
+        names = self.catalog.get()
         if result.field_to_insert == 'genre':
-            closest_match, score = process.extractOne(result.value, self.genres_list)
-            if score > 90:  
-                result.value = closest_match
-                cursor = con.cursor()
-                query = f"SELECT genre_id, genre FROM genres WHERE genre = '{result.value}'"
-                cursor.execute(query)
-                results = cursor.fetchone()
-                result.value = results[0]
+            closest_match, score = names.match_genre(result.value)
+            if score > 90:
+                result.value = names.genre_ids[closest_match]
             else:
                 return 'Genre not found.'
-            
-            
+
         elif result.field_to_insert == 'author':
-            closest_match, score = process.extractOne(result.value, self.authors_list)
+            closest_match, score = names.match_author(result.value)
             if score > 90:
-                result.value = closest_match
-                cursor = con.cursor()
-                query = f"SELECT author_id, author_name FROM authors WHERE author_name = '{result.value}'"
-                cursor.execute(query)
-                results = cursor.fetchone()
-                result.value = results[0]
+                result.value = names.author_ids[closest_match]
             else:
                 return 'Author not found.'
-            
-        con.close()
+
         return result
 
 ######################################################
@@ -98,7 +96,7 @@ class ExtractFavAuthorGenreToInsert(Runnable):
 class AddFavAuthorGenreOutput(BaseModel):
     output: str
 
-class AddFavAuthorGenreChain(Runnable):
+class AddFavAuthorGenreChain(ExtractProcessRespondChain):
 
     def __init__(self, memory: bool = True) -> str:
         self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
@@ -135,49 +133,49 @@ class AddFavAuthorGenreChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=AddFavAuthorGenreOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
-
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        fav_info = self.extract_chain.invoke(user_input)
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-
-        # Checking if the author/genre already exists in the fav_authors/genres tables
-        if fav_info.field_to_insert in ['author','genre']:
-            field = fav_info.field_to_insert + '_id'
-            table = 'fav_' + fav_info.field_to_insert + 's'
-        else:
-            self.status = 'error'
-        cursor = con.cursor()
-        cursor.execute(f"SELECT {field} FROM {table} WHERE username = ? AND {field} = ?", (username, fav_info.value))
-        query_results = cursor.fetchone()
-    
-        if not query_results: # if does not exist already in the table
-            try:
-                cursor = con.cursor()
-                cursor.execute(
-                    f"INSERT INTO {table} (username, {field}) VALUES (?, ?)",
-                    (username, fav_info.value),
-                )
-                con.commit()
-                self.status = 'success'
-
-            except sqlitecloud.OperationalError as e:
-                print(f"Error: {e}")
-                self.status = 'error'
-            finally:
-                cursor.close()
-                con.close()
-        else:
-            if query_results[0]==fav_info.value:
-                self.status = 'no_change'
-        con.close()
-        response = self.chain.invoke({
+        self.build_response_chains(self.prompt, self.output_parser)
+
+    def process(self, fav_info, username):
+        with get_connection() as con:
+            cursor = con.cursor()
+
+            # Checking if the author/genre already exists in the fav_authors/genres tables
+            if fav_info.field_to_insert in ['author','genre']:
+                field = fav_info.field_to_insert + '_id'
+                table = 'fav_' + fav_info.field_to_insert + 's'
+            else:
+                status = 'error'
+            cursor = con.cursor()
+            cursor.execute(f"SELECT {field} FROM {table} WHERE username = ? AND {field} = ?", (username, fav_info.value))
+            query_results = cursor.fetchone()
+
+            if not query_results: # if does not exist already in the table
+                try:
+                    cursor = con.cursor()
+                    cursor.execute(
+                        f"INSERT INTO {table} (username, {field}) VALUES (?, ?)",
+                        (username, fav_info.value),
+                    )
+                    con.commit()
+                    # The cached profile of the user is now outdated
+                    user_profiles.invalidate(username)
+                    status = 'success'
+
+                except sqlitecloud.OperationalError as e:
+                    print(f"Error: {e}")
+                    status = 'error'
+                finally:
+                    cursor.close()
+            else:
+                if query_results[0]==fav_info.value:
+                    status = 'no_change'
+
+        return status
+
+    def get_response_inputs(self, user_input, status):
+        return {
                 "user_input": user_input['user_input'],
                 'chat_history': user_input['chat_history'],
-                "status": self.status,
+                "status": status,
                 "format_instructions": self.format_instructions
-            })
-
-        return response.output
\ No newline at end of file
+            }
\ No newline at end of file
@@ -94,4 +94,13 @@ class IsPromptInjection(Runnable):
                 "format_instructions": self.format_instructions,
             })
         
+        return result
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "format_instructions": self.format_instructions,
+            })
+
         return result
\ No newline at end of file
@@ -1,4 +1,4 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
 from chatbot.chains.suggest_books_given_favourites import SuggestBooksGivenFavChain
 from chatbot.chains.suggest_books_given_input import SuggestBooksGivenInputChain
 from pydantic import BaseModel
@@ -7,12 +7,8 @@ from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
-from sklearn.cluster import KMeans
-import sqlitecloud
-from pinecone import Pinecone
+from chatbot.db.pool import get_connection
 
-pinecone = Pinecone()
-index = pinecone.Index('books')
 
 class ReadingPlan(BaseModel):
     timeframe: str  # Either "monthly" or "annual"
@@ -62,13 +58,23 @@ class ExtractReadingPlanInput(Runnable):
                 "format_instructions": self.format_instructions,
             })
         return result
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            })
+
+        return result
     
 #######################################################################################################################
 
 class ReadingPlanOutput(BaseModel):
     output: str
 
-class CreateReadingPlanChain(Runnable):
+class CreateReadingPlanChain(ExtractProcessRespondChain):
     name: str = "CreateReadingPlanChain" 
     description: str = "Create a reading plan based on the user's favorite books, genres or authors or on a specific book, genre or author."
     args_schema: Type[BaseModel] = ReadingPlanOutput
@@ -118,52 +124,54 @@ class CreateReadingPlanChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=ReadingPlanOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
+        self.build_response_chains(self.prompt, self.output_parser)
         
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
+    def get_suggestion_chain(self, u_input):
+        if u_input.fav_or_input == 'fav': 
+            return SuggestBooksGivenFavChain(return_titles=True, total_books=u_input.total_books)
+
+        return SuggestBooksGivenInputChain(return_titles=True, total_books=u_input.total_books)
 
+    def extract(self, user_input, config=None):
         u_input = self.extract_chain.invoke(user_input)
-        
-        chain_fav = SuggestBooksGivenFavChain(return_titles=True, total_books=u_input.total_books)
-        chain_input = SuggestBooksGivenInputChain(return_titles=True, total_books=u_input.total_books)
-        
-        if u_input.fav_or_input == 'fav': 
-            self.books_to_include = chain_fav.invoke(user_input, config= config)
+        return u_input, self.get_suggestion_chain(u_input).invoke(user_input, config=config)
 
-        else: 
-            self.books_to_include = chain_input.invoke(user_input, config= config)
+    async def aextract(self, user_input, config=None):
+        u_input = await self.extract_chain.ainvoke(user_input)
+        return u_input, await self.get_suggestion_chain(u_input).ainvoke(user_input, config=config)
 
-        self.total_books = u_input.total_books
-        self.timeframe = u_input.timeframe
-        self.books_to_include = [tup[0] for tup in self.books_to_include]
-        
-        self.book_pages = None
-        # Retrieve the number of pages for each book based on titles in self.books_to_include
-        if self.books_to_include:
-            query = """
-                SELECT page_number 
-                FROM books 
-                WHERE title IN ({})
-            """.format(','.join('?' for _ in self.books_to_include))
-            cursor.execute(query, self.books_to_include)
-            results = cursor.fetchall()
-
-            # Create a list of tuples [(title, page_number)]
-            self.book_pages = [row[0] for row in results]
-
-        # Close connection if no conditions match
-        con.close()
-
-        response = self.chain.invoke({
+    def process(self, extracted, username):
+        u_input, books_to_include = extracted
+        with get_connection() as con:
+            cursor = con.cursor()
+
+            books_to_include = [tup[0] for tup in books_to_include or []]
+
+            book_pages = None
+            # Retrieve the number of pages for each book based on titles in books_to_include
+            if books_to_include:
+                query = """
+                    SELECT page_number 
+                    FROM books 
+                    WHERE title IN ({})
+                """.format(','.join('?' for _ in books_to_include))
+                cursor.execute(query, books_to_include)
+                results = cursor.fetchall()
+
+                # Create a list of tuples [(title, page_number)]
+                book_pages = [row[0] for row in results]
+
+
+        return u_input, books_to_include, book_pages
+
+    def get_response_inputs(self, user_input, processed):
+        u_input, books_to_include, book_pages = processed
+        return {
             "user_input": user_input['user_input'],
             'chat_history': user_input['chat_history'],
-            'timeframe': self.timeframe, 
-            "books_to_include": self.books_to_include,
-            "total_books": self.total_books,
-            "book_pages": self.book_pages,
+            'timeframe': u_input.timeframe, 
+            "books_to_include": books_to_include,
+            "total_books": u_input.total_books,
+            "book_pages": book_pages,
             "format_instructions": self.format_instructions
-        })
-        return response.output
\ No newline at end of file
+        }
\ No newline at end of file
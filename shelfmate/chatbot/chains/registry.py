@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import Counter
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator
+
+
+class LazyChainMap(Mapping):
+    """Registry of chains that are only built the first time they are requested.
+
+    Each chain is created by its factory on first access and memoized, so a turn
+    only pays for the construction of the chains it actually uses.
+    """
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]]):
+        """Initialize the registry.
+
+        Args:
+            factories: Map of chain names to callables that build the chain.
+        """
+        self.factories = factories
+        self.chains: Dict[str, Any] = {}
+        self.build_counts: Counter = Counter()
+        self.build_seconds: Dict[str, float] = {}
+        # One lock per chain so concurrent sessions never build the same chain twice
+        self._locks = {name: threading.Lock() for name in factories}
+
+    def __getitem__(self, name: str) -> Any:
+        """Return the chain registered under a name, building it if needed.
+
+        Args:
+            name: The name of the chain.
+
+        Returns:
+            The memoized chain instance.
+        """
+        chain = self.chains.get(name)
+        if chain is not None:
+            return chain
+
+        with self._locks[name]:
+            # Another thread may have built the chain while we were waiting
+            if name not in self.chains:
+                start_time = time.perf_counter()
+                self.chains[name] = self.factories[name]()
+                self.build_seconds[name] = time.perf_counter() - start_time
+                self.build_counts[name] += 1
+
+        return self.chains[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.factories)
+
+    def __len__(self) -> int:
+        return len(self.factories)
+
+    def is_built(self, name: str) -> bool:
+        """Check if a chain has already been built."""
+        return name in self.chains
+
+    def stats(self) -> Dict[str, Any]:
+        """Report which chains were built and how long each one took.
+
+        Returns:
+            A dictionary with the build counters and build times per chain.
+        """
+        return {
+            "built": sorted(self.chains),
+            "not_built": sorted(set(self.factories) - set(self.chains)),
+            "build_counts": dict(self.build_counts),
+            "build_seconds": dict(self.build_seconds),
+        }
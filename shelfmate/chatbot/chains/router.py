@@ -120,3 +120,14 @@ class RouterChain(Runnable):
                     "format_instructions": self.format_instructions,
                 },
             )
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        """Invoke the product information response chain asynchronously."""
+        with callbacks.collect_runs() as cb:
+            return await self.chain.ainvoke(
+                {
+                    "user_input": inputs["user_input"],
+                    "chat_history": inputs["chat_history"],
+                    "format_instructions": self.format_instructions,
+                },
+            )
@@ -1,4 +1,6 @@
+import asyncio
 from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+from chatbot.chains.registry import LazyChainMap
 from chatbot.chains.suggest_authors_given_favourites import SuggestAuthorsGivenFavChain
 from chatbot.chains.suggest_authors_given_input import SuggestAuthorsGivenInputChain
 from pydantic import BaseModel
@@ -42,6 +44,16 @@ class ExtractInput_Authors(Runnable):
 
         self.chain = self.prompt | self.llm | self.output_parser
 
+        # Suggestion chains are only built once the first request needs them
+        self.suggestion_chains = LazyChainMap({
+            "fav": SuggestAuthorsGivenFavChain,
+            "input": SuggestAuthorsGivenInputChain,
+        })
+
+    @staticmethod
+    def chain_name(result):
+        # Anything other than 'fav' is answered from the input, so a reply is always produced
+        return 'fav' if result.fav_or_input == 'fav' else 'input'
 
     def invoke(self, inputs, config):
         result = self.chain.invoke(
@@ -50,12 +62,27 @@ class ExtractInput_Authors(Runnable):
                 "format_instructions": self.format_instructions,
             })
 
-        if result.fav_or_input == 'fav':
-            chain = SuggestAuthorsGivenFavChain()
-            response = chain.invoke(inputs, config)
-        elif result.fav_or_input == 'input':
-            chain = SuggestAuthorsGivenInputChain()
-            response = chain.invoke(inputs, config)
+        chain = self.suggestion_chains[self.chain_name(result)]
+        return chain.invoke(inputs, config)
+
+    def stream(self, inputs, config=None, **kwargs):
+        result = self.chain.invoke(
+            {
+                "user_input": inputs["user_input"],
+                "format_instructions": self.format_instructions,
+            })
+
+        chain = self.suggestion_chains[self.chain_name(result)]
+        yield from chain.stream(inputs, config)
+
+    async def ainvoke(self, inputs, config=None, **kwargs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "format_instructions": self.format_instructions,
+            })
 
-        return response
+        # Building a chain for the first time is blocking, do it off the event loop
+        chain = await asyncio.to_thread(self.suggestion_chains.__getitem__, self.chain_name(result))
+        return await chain.ainvoke(inputs, config)
   
\ No newline at end of file
@@ -1,48 +1,15 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
+from chatbot.profile import user_profiles
 from pydantic import BaseModel
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
-import openai
-import sqlitecloud
-from pinecone import Pinecone
-
-pinecone = Pinecone()
-index = pinecone.Index('books')
-
-def semantic_search(ids, k):
-   
-    # Generate embeddings
-    desc_ids = ['desc_' + str(i) for i in ids]
-    fetch_results = index.fetch(desc_ids)
-    embeddings = [fetch_results.vectors[i].values for i in desc_ids]
-
-    # Cluster embeddings
-    kmeans = KMeans(n_clusters=1, random_state=42)
-    kmeans.fit(embeddings)
-    cluster_centers = kmeans.cluster_centers_
-    
-    filter_condition = {"book_id": {"$nin": ids}, 
-                        "type": {"$eq": 'description'}}
-
-    # Perform semantic search
-    search_results = index.query(
-        vector=cluster_centers[0].tolist(),
-        top_k=k,
-        include_metadata=True,
-        filter=filter_condition
-    )
-
-    results = []
-    for match in search_results["matches"]:
-        results.append(
-            int(match['metadata']['book_id'])
-        )
-
-    return results
-
+from chatbot.db.pool import get_connection
+from chatbot.vectors.retrieval import semantic_search
+from chatbot.vectors.centroids import get_centroid_index
+from chatbot.catalog.cache import catalog_names
 
 
 class WhichFavourite_(BaseModel):
@@ -89,12 +56,22 @@ class ExtractFavourite_(Runnable):
 
         return result
 
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            })
+
+        return result
+
 #########################################################################################################################################################
 
 class SuggestNewAuthorsOutput(BaseModel):
     output: str
 
-class SuggestAuthorsGivenFavChain(Runnable):
+class SuggestAuthorsGivenFavChain(ExtractProcessRespondChain):
     name: str = "SuggestAuthorsGivenFavChain"
     description: str = "Suggest new authors based on the user's favorite books, genres, and authors."
     args_schema: Type[BaseModel] = SuggestNewAuthorsOutput
@@ -103,7 +80,6 @@ class SuggestAuthorsGivenFavChain(Runnable):
     def __init__(self, memory: bool = True):
         self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
         self.extract_chain = ExtractFavourite_(self.llm)
-        self.suggestions = None
         
         prompt_bot_return = PromptTemplate(
             system_template="""
@@ -133,131 +109,118 @@ class SuggestAuthorsGivenFavChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=SuggestNewAuthorsOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
-
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        
-        u_input = self.extract_chain.invoke(user_input)
-
-        
+        self.build_response_chains(self.prompt, self.output_parser)
 
-        # Suggest authors based on user's favorite books
-        if u_input.which_fav == 'books':
-            # Check if the user has any books in their read list with a rating > 4
+    def process(self, u_input, username):
+        with get_connection() as con:
             cursor = con.cursor()
-            cursor.execute("""
-                SELECT b.book_id, b.title 
-                FROM read_list rl
-                INNER JOIN books b ON rl.book_id = b.book_id
-                WHERE rl.username = ? AND b.rating >= 4
-            """, (username,))
-            favorite_books = cursor.fetchall()
-
-            if not favorite_books:
-                con.close()
-                return "You don't have any books with a rating higher or equal than 4 in your read list. Add some of your favorite books first so we can provide suggestions!"
-                
-            book_ids = [book[0] for book in favorite_books]
-
-            # Perform semantic search to find similar books
-            similar_books = semantic_search(book_ids, 10)
-
-            if similar_books:
-                query = """
-                    SELECT DISTINCT a.author_name
-                    FROM authors a
-                    INNER JOIN authors_books ab ON a.author_id = ab.author_id
-                    WHERE ab.book_id IN ({})
-                """.format(','.join('?' for _ in similar_books))
-                cursor = con.cursor()
-                cursor.execute(query, similar_books)
-                similar_authors = cursor.fetchall() 
-
-                if similar_authors: 
-                    con.close()
-                    self.suggestions = similar_authors
-                    
-
-        # Suggest authors in favorite genres
-        if u_input.which_fav == 'genres':
-            cursor = con.cursor()
-            cursor.execute("""
-                SELECT g.genre_id, g.genre 
-                FROM fav_genres fg
-                INNER JOIN genres g ON fg.genre_id = g.genre_id
-                WHERE fg.username = ?
-            """, (username,))
-            favorite_genres = cursor.fetchall()
-
-            if not favorite_genres:
-                con.close()
-                return "You don't have any genres set as favorites. Add some favorite genres first so we can provide suggestions!"
-
-            if favorite_genres:
-                genre_ids = [genre[0] for genre in favorite_genres]
-                query = """
-                    SELECT DISTINCT a.author_name
-                    FROM authors a
-                    INNER JOIN authors_books ab ON a.author_id = ab.author_id
-                    INNER JOIN books_genres bg ON ab.book_id = bg.book_id
-                    WHERE bg.genre_id IN ({})
-                    LIMIT 5
-                """.format(','.join('?' for _ in genre_ids))
-                cursor = con.cursor()
-                cursor.execute(query, genre_ids)
-                genre_authors = cursor.fetchall() 
-
-                if genre_authors:
-                    con.close()
-                    self.suggestions = genre_authors
-
-        # Suggest authors based on favorite authors
-        if u_input.which_fav == 'authors':
-            cursor = con.cursor()
-            cursor.execute("""
-                SELECT a.author_id, a.author_name 
-                FROM fav_authors fa
-                INNER JOIN authors a ON fa.author_id = a.author_id
-                WHERE fa.username = ?
-            """, (username,))
-            favorite_authors = cursor.fetchall()
-        
-            if not favorite_authors:
-                con.close()
-                return "You don't have any authors set as favorites. Add some of your favorite authors first so we can provide suggestions!"
-
-            if favorite_authors:
-                author_ids = [author[0] for author in favorite_authors]
-
-                # Find authors similar to the user's favorite authors
-                query = """
-                    SELECT DISTINCT a2.author_name
-                    FROM authors a2
-                    INNER JOIN authors_books ab2 ON a2.author_id = ab2.author_id
-                    WHERE ab2.book_id IN (
-                        SELECT DISTINCT ab.book_id
-                        FROM authors_books ab
-                        WHERE ab.author_id IN ({})
-                    ) AND a2.author_id NOT IN ({})
-                """.format(','.join('?' for _ in author_ids), ','.join('?' for _ in author_ids))
-                cursor.execute(query, author_ids + author_ids)
-                similar_authors = cursor.fetchall() 
-
-                if similar_authors: 
-                    con.close()
-                    self.suggestions = similar_authors
-
-        con.close()
-        response = self.chain.invoke({ 
+
+            suggestions = None
+
+            # Favorites and read list prefetched by the chatbot (or loaded on demand)
+            profile = user_profiles.get(username)
+
+            # Suggest authors based on user's favorite books
+            if u_input.which_fav == 'books':
+                # Check if the user has any books in their read list with a rating > 4
+                book_ids = profile['liked_book_ids']
+
+                if not book_ids:
+                    return "You don't have any books with a rating higher or equal than 4 in your read list. Add some of your favorite books first so we can provide suggestions!"
+
+                # Perform semantic search to find similar books
+                similar_books = semantic_search(book_ids, 10, interests=3)
+
+                if similar_books:
+                    query = """
+                        SELECT DISTINCT a.author_name
+                        FROM authors a
+                        INNER JOIN authors_books ab ON a.author_id = ab.author_id
+                        WHERE ab.book_id IN ({})
+                    """.format(','.join('?' for _ in similar_books))
+                    cursor = con.cursor()
+                    cursor.execute(query, similar_books)
+                    similar_authors = cursor.fetchall() 
+
+                    if similar_authors: 
+                        suggestions = similar_authors
+
+            # Suggest authors in favorite genres
+            if u_input.which_fav == 'genres':
+                genre_ids = profile['fav_genre_ids']
+
+                if not genre_ids:
+                    return "You don't have any genres set as favorites. Add some favorite genres first so we can provide suggestions!"
+
+                centroids = get_centroid_index()
+                if centroids is not None and centroids.has_genres(genre_ids):
+                    # Authors whose books are closest to the favourite genres as a whole
+                    genre_author_ids = centroids.authors_for_genres(genre_ids, k=5)
+                    return [(name,) for name in catalog_names.get().authors_by_id(genre_author_ids)]
+
+                if genre_ids:
+                    query = """
+                        SELECT DISTINCT a.author_name
+                        FROM authors a
+                        INNER JOIN authors_books ab ON a.author_id = ab.author_id
+                        INNER JOIN books_genres bg ON ab.book_id = bg.book_id
+                        WHERE bg.genre_id IN ({})
+                        LIMIT 5
+                    """.format(','.join('?' for _ in genre_ids))
+                    cursor = con.cursor()
+                    cursor.execute(query, genre_ids)
+                    genre_authors = cursor.fetchall() 
+
+                    if genre_authors:
+                        suggestions = genre_authors
+
+            # Suggest authors based on favorite authors
+            if u_input.which_fav == 'authors':
+                author_ids = profile['fav_author_ids']
+
+                if not author_ids:
+                    return "You don't have any authors set as favorites. Add some of your favorite authors first so we can provide suggestions!"
+
+                centroids = get_centroid_index()
+                if centroids is not None and centroids.has_authors(author_ids):
+                    # One nearest-neighbour query over the precomputed author vectors
+                    similar_ids = centroids.similar_authors(author_ids, k=5)
+                    return [(name,) for name in catalog_names.get().authors_by_id(similar_ids)]
+
+                if author_ids:
+
+                    # Find authors similar to the user's favorite authors
+                    query = """
+                        SELECT DISTINCT a2.author_name
+                        FROM authors a2
+                        INNER JOIN authors_books ab2 ON a2.author_id = ab2.author_id
+                        WHERE ab2.book_id IN (
+                            SELECT DISTINCT ab.book_id
+                            FROM authors_books ab
+                            WHERE ab.author_id IN ({})
+                        ) AND a2.author_id NOT IN ({})
+                    """.format(','.join('?' for _ in author_ids), ','.join('?' for _ in author_ids))
+                    cursor.execute(query, author_ids + author_ids)
+                    similar_authors = cursor.fetchall() 
+
+                    if similar_authors: 
+                        suggestions = similar_authors
+
+
+        return suggestions
+
+    def direct_answer(self, suggestions):
+        # Messages explaining why no suggestions could be made are returned as they are
+        if isinstance(suggestions, str):
+            return suggestions
+        return None
+
+    def get_response_inputs(self, user_input, suggestions):
+        return {
             "user_input": user_input['user_input'],
-            'chat_history': user_input['chat_history'], 
-            "suggestions": self.suggestions,
+            'chat_history': user_input['chat_history'],
+            "suggestions": suggestions,
             "format_instructions": self.format_instructions
-        })
-
-        return response.output
+        }
     
     
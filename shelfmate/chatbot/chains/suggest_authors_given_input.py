@@ -1,52 +1,16 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+import asyncio
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
 from pydantic import BaseModel
+from chatbot.catalog.cache import catalog_names
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
-import openai
-import sqlitecloud
-from pinecone import Pinecone
-from sklearn.cluster import KMeans
-from fuzzywuzzy import process
-
-pinecone = Pinecone()
-index = pinecone.Index('books')
-
-
-def semantic_search(ids, k):
-   
-    # Generate embeddings
-    desc_ids = ['desc_' + str(i) for i in ids]
-    fetch_results = index.fetch(desc_ids)
-    embeddings = [fetch_results.vectors[i].values for i in desc_ids]
-
-    # Cluster embeddings
-    kmeans = KMeans(n_clusters=1, random_state=42)
-    kmeans.fit(embeddings)
-    cluster_centers = kmeans.cluster_centers_
-    
-    filter_condition = {"book_id": {"$nin": ids}, 
-                        "type": {"$eq": 'description'}}
-
-    # Perform semantic search
-    search_results = index.query(
-        vector=cluster_centers[0].tolist(),
-        top_k=k,
-        include_metadata=True,
-        filter=filter_condition
-    )
-
-    # Display results
-    results = []
-    for match in search_results["matches"]:
-        results.append(
-            int(match['metadata']['book_id'])
-        )
-
-    return results
-
+from chatbot.db.pool import get_connection
+from chatbot.vectors.retrieval import get_retrieval_service, semantic_search
+from chatbot.vectors.embeddings import embed_text
+from chatbot.vectors.centroids import get_centroid_index
 
 
 class WhichInput_(BaseModel):
@@ -55,7 +19,7 @@ class WhichInput_(BaseModel):
 
 
 class ExtractInput_(Runnable):
-    def __init__(self, llm, memory= False):
+    def __init__(self, llm, memory=False, catalog=None):
         super().__init__()
         self.llm = llm
         prompt_template = PromptTemplate(
@@ -81,14 +45,8 @@ class ExtractInput_(Runnable):
 
         self.chain = self.prompt | self.llm | self.output_parser
 
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        cursor.execute("SELECT genre FROM genres")
-        self.genres = [row[0] for row in cursor.fetchall()]
-        cursor = con.cursor()
-        cursor.execute("SELECT author_name FROM authors")
-        self.authors = [row[0] for row in cursor.fetchall()]
-        con.close()
+        # Genre and author names shared with the other extractors
+        self.catalog = catalog or catalog_names
 
     def invoke(self, inputs):
         result = self.chain.invoke(
@@ -98,12 +56,27 @@ class ExtractInput_(Runnable):
                 "format_instructions": self.format_instructions,
             })
 
+        return self.resolve(result)
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            })
+
+        # Fuzzy matching is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.resolve, result)
+
+    def resolve(self, result):
+        names = self.catalog.get()
         if result.which_input == 'genre':
-            closest_match, score = process.extractOne(result.name, self.genres)
+            closest_match, score = names.match_genre(result.name)
             if score > 85:  
                 result.name = closest_match
         elif result.which_input == 'author':
-            closest_match, score = process.extractOne(result.name, self.authors)
+            closest_match, score = names.match_author(result.name)
             if score > 85:
                 result.name = closest_match
 
@@ -114,7 +87,7 @@ class ExtractInput_(Runnable):
 class SuggestAuthorOutput(BaseModel):
     output: str
 
-class SuggestAuthorsGivenInputChain(Runnable):
+class SuggestAuthorsGivenInputChain(ExtractProcessRespondChain):
     name: str = "SuggestAuthorTool" 
     description: str = "Suggest an author based on the user input"
     args_schema: Type[BaseModel] = SuggestAuthorOutput
@@ -123,7 +96,6 @@ class SuggestAuthorsGivenInputChain(Runnable):
     def __init__(self, memory:bool =True):
         self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
         self.extract_chain = ExtractInput_(self.llm)
-        self.suggestions = None
         
         prompt_bot_return = PromptTemplate(
             system_template=""" 
@@ -153,141 +125,166 @@ class SuggestAuthorsGivenInputChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=SuggestAuthorOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
-        
+        self.build_response_chains(self.prompt, self.output_parser)
         
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
         
-        u_input = self.extract_chain.invoke(user_input)
+    def process(self, u_input, username):
+        with get_connection() as con:
+            cursor = con.cursor()
 
-        if u_input.which_input == 'author':
-            author_name = u_input.name
-            cursor.execute("SELECT author_id FROM authors WHERE author_name LIKE ?", (author_name,))
-            author_results = cursor.fetchall()
+            suggestions = None
 
-            if not author_results:
-                raise ValueError(f"Author '{author_name}' not in the Database.")
+            index = get_retrieval_service()
 
-            author_id = author_results[0][0]
-            cursor = con.cursor()
-            cursor.execute(f"SELECT author_name FROM authors WHERE author_id LIKE ?", (author_id,))
-
-            # Query to get up to 5 books by the given author
-            query = """
-            SELECT b.book_id
-            FROM books b
-            INNER JOIN authors_books ab ON b.book_id = ab.book_id
-            WHERE ab.author_id = ?
-            LIMIT 5
-            """
-            cursor = con.cursor()
-            cursor.execute(query, (author_id,))
-            author_books = cursor.fetchall()
-
-            if not author_books:
-                return f"No books found for the author '{author_name}'."
-
-            # Get book IDs for semantic search
-            book_ids = [book[0] for book in author_books]
-
-            # Perform semantic search to find similar books
-            similar_book_ids = semantic_search(book_ids, 10)
-
-            # Query to fetch distinct authors of similar books, excluding the queried author
-            query = """
-            SELECT DISTINCT a.author_name
-            FROM authors a
-            INNER JOIN authors_books ab ON a.author_id = ab.author_id
-            WHERE ab.book_id IN ({})
-            AND a.author_name != ?
-            """.format(','.join('?' for _ in similar_book_ids))
-            cursor = con.cursor()
-            cursor.execute(query, similar_book_ids + [author_name])
-            self.suggestions = cursor.fetchall()
-        
-        if u_input.which_input == 'genre':
-            genre_name = u_input.name
-            cursor = con.cursor()
-            cursor.execute("SELECT genre_id FROM genres WHERE genre LIKE ?", (genre_name,))
-            genre_results = cursor.fetchall()
+            if u_input.which_input == 'author':
+                author_name = u_input.name
+                cursor.execute("SELECT author_id FROM authors WHERE author_name LIKE ?", (author_name,))
+                author_results = cursor.fetchall()
 
-            if not genre_results:
-                raise ValueError(f"Genre '{genre_name}' not in the Database.")
+                if not author_results:
+                    raise ValueError(f"Author '{author_name}' not in the Database.")
 
-            genre_id = genre_results[0][0]
-            cursor = con.cursor()
-            cursor.execute("SELECT genre FROM genres WHERE genre_id LIKE ?", (genre_id,))
-            
-            # Query to get distinct authors for the given genre (limit to 5)
-            query = """
-                SELECT DISTINCT a.author_name
-                FROM authors a
-                WHERE a.top_genre = ?
-                ORDER BY a.author_name
+                author_id = author_results[0][0]
+
+                centroids = get_centroid_index()
+                if centroids is not None and centroids.has_authors([author_id]):
+                    # One nearest-neighbour query over the precomputed author vectors
+                    similar_ids = centroids.similar_authors([author_id], k=5)
+                    return [(name,) for name in catalog_names.get().authors_by_id(similar_ids)]
+
+                # Query to get up to 5 books by the given author
+                query = """
+                SELECT b.book_id
+                FROM books b
+                INNER JOIN authors_books ab ON b.book_id = ab.book_id
+                WHERE ab.author_id = ?
                 LIMIT 5
                 """
-            cursor = con.cursor()
-            cursor.execute(query, (genre_id,))
-            self.suggestions = cursor.fetchall()
+                cursor = con.cursor()
+                cursor.execute(query, (author_id,))
+                author_books = cursor.fetchall()
 
+                if not author_books:
+                    return f"No books found for the author '{author_name}'."
 
-        if u_input.which_input == 'book':
-            book_title = u_input.name
+                # Name as stored in the database, excluded from the suggestions below
+                cursor = con.cursor()
+                cursor.execute("SELECT author_name FROM authors WHERE author_id LIKE ?", (author_id,))
+                author_name = cursor.fetchone()[0]
 
-            # Fetch embedding and perform semantic search
-            embedding = openai.embeddings.create(model="text-embedding-ada-002", input=[book_title]).data[0].embedding
-            filter_condition = {"type": {"$eq": "title"}}
-            search_results = index.query(
-                vector=embedding,
-                top_k=1,
-                include_metadata=True,
-                filter=filter_condition,
-            )
+                # Get book IDs for semantic search
+                book_ids = [book[0] for book in author_books]
 
-            book_id = int(search_results['matches'][0]['metadata']['book_id'])
-            
-            # Fetch the author's ID(s) based on the book_id
-            cursor = con.cursor()
-            cursor.execute("SELECT author_id FROM authors_books WHERE book_id = ?", (book_id,))
-            author_ids = cursor.fetchall()
-            
-            # Extract book IDs for the authors
-            book_ids = []
-            for author_id_tuple in author_ids:  # Iterate over each tuple (since fetchall() returns a list of tuples)
-                author_id = author_id_tuple[0]  # Extract the first element of the tuple (the actual author_id)
+                # Perform semantic search to find similar books
+                similar_book_ids = semantic_search(book_ids, 10)
+
+                # Query to fetch distinct authors of similar books, excluding the queried author
+                query = """
+                SELECT DISTINCT a.author_name
+                FROM authors a
+                INNER JOIN authors_books ab ON a.author_id = ab.author_id
+                WHERE ab.book_id IN ({})
+                AND a.author_name != ?
+                """.format(','.join('?' for _ in similar_book_ids))
                 cursor = con.cursor()
-                cursor.execute("SELECT book_id FROM authors_books WHERE author_id = ?", (author_id,))
-                books = cursor.fetchall()
-                book_ids.extend([book[0] for book in books])  # Add the book IDs to the list
-
-            # Use the book_ids for semantic search to find similar books
-            similar_book_ids = semantic_search(book_ids, 10)
-
-            # Exclude the original authors from the results
-            filtered_author_ids = [author_id for author_id in similar_book_ids if author_id not in author_ids]
-
-            # Query to fetch author names
-            query = """
-            SELECT DISTINCT author_name
-            FROM authors
-            WHERE author_id IN ({})
-            ORDER BY author_name
-            LIMIT 5
-            """.format(",".join("?" * len(filtered_author_ids)))
-            cursor = con.cursor()
-            cursor.execute(query, filtered_author_ids)
-            self.suggestions = cursor.fetchall()
+                cursor.execute(query, similar_book_ids + [author_name])
+                suggestions = cursor.fetchall()
 
-        con.close()
-        
-        response = self.chain.invoke({ 
-                    "user_input": user_input['user_input'],
-                    'chat_history': user_input['chat_history'], 
-                    "suggestions": self.suggestions,
-                    "format_instructions": self.format_instructions
-                })
-
-        return response.output
\ No newline at end of file
+            if u_input.which_input == 'genre':
+                genre_name = u_input.name
+                cursor = con.cursor()
+                cursor.execute("SELECT genre_id FROM genres WHERE genre LIKE ?", (genre_name,))
+                genre_results = cursor.fetchall()
+
+                if not genre_results:
+                    raise ValueError(f"Genre '{genre_name}' not in the Database.")
+
+                genre_id = genre_results[0][0]
+
+                centroids = get_centroid_index()
+                if centroids is not None and centroids.has_genres([genre_id]):
+                    # Authors whose books are closest to the genre as a whole
+                    genre_author_ids = centroids.authors_for_genres([genre_id], k=5)
+                    return [(name,) for name in catalog_names.get().authors_by_id(genre_author_ids)]
+
+                # Query to get distinct authors for the given genre (limit to 5)
+                query = """
+                    SELECT DISTINCT a.author_name
+                    FROM authors a
+                    WHERE a.top_genre = ?
+                    ORDER BY a.author_name
+                    LIMIT 5
+                    """
+                cursor = con.cursor()
+                cursor.execute(query, (genre_id,))
+                suggestions = cursor.fetchall()
+
+            if u_input.which_input == 'book':
+                book_title = u_input.name
+
+                # Fetch embedding and perform semantic search
+                embedding = embed_text(book_title)
+                filter_condition = {"type": {"$eq": "title"}}
+                search_results = index.query(
+                    vector=embedding,
+                    top_k=1,
+                    include_metadata=True,
+                    filter=filter_condition,
+                )
+
+                book_id = int(search_results['matches'][0]['metadata']['book_id'])
+
+                # Fetch the author's ID(s) based on the book_id
+                cursor = con.cursor()
+                cursor.execute("SELECT author_id FROM authors_books WHERE book_id = ?", (book_id,))
+                author_ids = cursor.fetchall()
+
+                centroids = get_centroid_index()
+                book_author_ids = [author_id_tuple[0] for author_id_tuple in author_ids]
+                if centroids is not None and centroids.has_authors(book_author_ids):
+                    similar_ids = centroids.similar_authors(book_author_ids, k=5)
+                    return [(name,) for name in catalog_names.get().authors_by_id(similar_ids)]
+
+                # Extract book IDs for the authors
+                book_ids = []
+                for author_id_tuple in author_ids:  # Iterate over each tuple (since fetchall() returns a list of tuples)
+                    author_id = author_id_tuple[0]  # Extract the first element of the tuple (the actual author_id)
+                    cursor = con.cursor()
+                    cursor.execute("SELECT book_id FROM authors_books WHERE author_id = ?", (author_id,))
+                    books = cursor.fetchall()
+                    book_ids.extend([book[0] for book in books])  # Add the book IDs to the list
+
+                # Use the book_ids for semantic search to find similar books
+                similar_book_ids = semantic_search(book_ids, 10)
+
+                # Exclude the original authors from the results
+                filtered_author_ids = [author_id for author_id in similar_book_ids if author_id not in author_ids]
+
+                # Query to fetch author names
+                query = """
+                SELECT DISTINCT author_name
+                FROM authors
+                WHERE author_id IN ({})
+                ORDER BY author_name
+                LIMIT 5
+                """.format(",".join("?" * len(filtered_author_ids)))
+                cursor = con.cursor()
+                cursor.execute(query, filtered_author_ids)
+                suggestions = cursor.fetchall()
+
+
+        return suggestions
+
+    def direct_answer(self, suggestions):
+        # Messages explaining why no suggestions could be made are returned as they are
+        if isinstance(suggestions, str):
+            return suggestions
+        return None
+
+    def get_response_inputs(self, user_input, suggestions):
+        return {
+            "user_input": user_input['user_input'],
+            'chat_history': user_input['chat_history'],
+            "suggestions": suggestions,
+            "format_instructions": self.format_instructions
+        }
\ No newline at end of file
@@ -1,16 +1,18 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+import asyncio
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
 from pydantic import BaseModel
+from chatbot.catalog.cache import catalog_names
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
 from typing import Type
 from langchain_community.chat_models import ChatOpenAI
-from langchain import callbacks
-import sqlitecloud
-import openai
-from pinecone import Pinecone
-from fuzzywuzzy import process
+from chatbot.db.replica import get_catalog_connection
+from chatbot.profile import user_profiles
+from chatbot.vectors.retrieval import get_retrieval_service
+from chatbot.vectors.embeddings import embed_text
+from chatbot.vectors.neighbours import get_neighbour_table
 
 
 class WhichInput(BaseModel):
@@ -19,7 +21,7 @@ class WhichInput(BaseModel):
 
 
 class ExtractInput(Runnable):
-    def __init__(self, llm, memory= False):
+    def __init__(self, llm, memory=False, catalog=None):
         super().__init__()
 
         self.llm = llm
@@ -50,15 +52,8 @@ class ExtractInput(Runnable):
 
         self.chain = self.prompt | self.llm | self.output_parser
 
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        cursor = con.cursor()
-        cursor.execute("SELECT genre FROM genres")
-        self.genres = [row[0] for row in cursor.fetchall()]
-        cursor = con.cursor()
-        cursor.execute("SELECT author_name FROM authors")
-        self.authors = [row[0] for row in cursor.fetchall()]
-        con.close()
+        # Genre and author names shared with the other extractors
+        self.catalog = catalog or catalog_names
 
     def invoke(self, inputs):
         result = self.chain.invoke(
@@ -68,12 +63,27 @@ class ExtractInput(Runnable):
                 "format_instructions": self.format_instructions,
             })
 
+        return self.resolve(result)
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs['chat_history'],
+                "format_instructions": self.format_instructions,
+            })
+
+        # Fuzzy matching is CPU bound, keep it off the event loop
+        return await asyncio.to_thread(self.resolve, result)
+
+    def resolve(self, result):
+        names = self.catalog.get()
         if result.which_input == 'genre':
-            closest_match, score = process.extractOne(result.name, self.genres)
+            closest_match, score = names.match_genre(result.name)
             if score > 85:  
                 result.name = closest_match
         elif result.which_input == 'author':
-            closest_match, score = process.extractOne(result.name, self.authors)
+            closest_match, score = names.match_author(result.name)
             if score > 85:
                 result.name = closest_match
 
@@ -86,7 +96,7 @@ class SuggestBookOutput(BaseModel):
     output: str
     
 
-class SuggestBooksGivenInputChain(Runnable):
+class SuggestBooksGivenInputChain(ExtractProcessRespondChain):
     name: str = "SuggestBooksGivenInputChain" 
     description: str = "Suggest a book based on the user input"
     args_schema: Type[BaseModel] = SuggestBookOutput
@@ -97,7 +107,6 @@ class SuggestBooksGivenInputChain(Runnable):
         self.extract_chain = ExtractInput(self.llm)
         self.return_titles = return_titles
         self.total_books = total_books
-        self.suggestions = None
         prompt_bot_return = PromptTemplate(
             system_template="""
             You are a part of the database manager team for a book recommendation platform called Shelfmate. 
@@ -126,126 +135,130 @@ class SuggestBooksGivenInputChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=SuggestBookOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__}) # adicionar isto do with_config
+        self.build_response_chains(self.prompt, self.output_parser)
 
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
+    def process(self, u_input, username):
+        # The read list lives in the remote database, the catalog is read locally
+        read_list_ids = user_profiles.get(username)['read_book_ids']
+        not_read = "b.book_id NOT IN ({})".format(','.join('?' for _ in read_list_ids))
 
-        u_input = self.extract_chain.invoke(user_input)
-
-        pinecone = Pinecone()
-        index = pinecone.Index('books')
-        
-        if u_input.which_input == 'genre':
-            genre_name = u_input.name
+        with get_catalog_connection() as con:
             cursor = con.cursor()
-            cursor.execute("SELECT genre_id FROM genres WHERE genre LIKE ?", (genre_name,))
-            genre_results = cursor.fetchall()
-            
-            if not genre_results:
-                return "Genre not in the Database"
-
-            genre_id = genre_results[0][0]
-            query = """
-            SELECT 
-                b.title,
-                GROUP_CONCAT(a.author_name, ', ') AS authors
-            FROM books b
-            INNER JOIN books_genres bg ON b.book_id = bg.book_id
-            INNER JOIN authors_books ab ON b.book_id = ab.book_id
-            INNER JOIN authors a ON ab.author_id = a.author_id
-            LEFT JOIN read_list rl ON b.book_id = rl.book_id
-            WHERE bg.genre_id = ? AND b.rating >= 4.7 AND rl.book_id IS NULL
-            GROUP BY b.book_id
-            ORDER BY RANDOM()
-            LIMIT ?
-            """
-            cursor = con.cursor()
-            cursor.execute(query, (genre_id, self.total_books, ))
-            self.suggestions = cursor.fetchall()
-            
-            
-        if u_input.which_input == 'author':
-            author_name = u_input.name
-            cursor = con.cursor()
-            cursor.execute("SELECT author_id FROM authors WHERE author_name LIKE ?", (author_name,))
-            author_results = cursor.fetchall()
-
-            if not author_results:
-                return "Author not in the Database"
-
-            author_id = author_results[0][0]
-            query = """
-            SELECT 
-                b.book_id, 
-                b.title 
-            FROM books b
-            INNER JOIN authors_books ab ON b.book_id = ab.book_id
-            INNER JOIN authors a ON ab.author_id = a.author_id
-            LEFT JOIN read_list rl ON b.book_id = rl.book_id
-            WHERE a.author_id = ? AND rl.book_id IS NULL
-            GROUP BY b.book_id
-            ORDER BY RANDOM()
-            LIMIT ?
-            """
-            cursor = con.cursor()
-            cursor.execute(query, (author_id, self.total_books,))
-            self.suggestions = cursor.fetchall()
-            
-        if u_input.which_input == 'book':
-            title = u_input.name
-            embedding = openai.embeddings.create(model="text-embedding-ada-002",
-                                                input=[title]).data[0].embedding
-
-            filter_condition = {"type": {"$eq": "title"}}
-            search_results = index.query(
-                vector=embedding,
-                top_k=1,
-                include_metadata=True,
-                filter=filter_condition)
-
-            book_id = int(search_results['matches'][0]['metadata']['book_id'])
-
-            fetch_results = index.fetch(ids=['desc_' + str(book_id)])
-            desc_embedding = fetch_results.vectors['desc_' + str(book_id)].values
-
-            filter_condition = {"book_id": {"$nin": [book_id]}, "type": {"$eq": "description"}}
-            search_results = index.query(
-                vector=desc_embedding,
-                top_k=5,
-                include_metadata=True,
-                filter=filter_condition)
-
-            all_ids = [int(search_results['matches'][i]['metadata']['book_id']) for i in range(5)]
-
-            # Ensure we exclude books already in the read list
-            query = """
-            SELECT 
-                b.title,
-                GROUP_CONCAT(a.author_name, ', ') AS authors
-            FROM books b
-            INNER JOIN authors_books ab ON b.book_id = ab.book_id
-            INNER JOIN authors a ON ab.author_id = a.author_id
-            LEFT JOIN read_list rl ON b.book_id = rl.book_id
-            WHERE b.book_id IN ({}) AND rl.book_id IS NULL
-            GROUP BY b.book_id
-            """.format(','.join('?' for _ in all_ids))
-            cursor = con.cursor()
-            cursor.execute(query, all_ids)
-            self.suggestions = cursor.fetchall()
-            
-        con.close()
-        
-        if self.return_titles:
-            return self.suggestions
 
-        response = self.chain.invoke({ # gerar a resposta do bot de acordo com o outcome da situação
+            suggestions = None
+
+            index = get_retrieval_service()
+
+            if u_input.which_input == 'genre':
+                genre_name = u_input.name
+                cursor = con.cursor()
+                cursor.execute("SELECT genre_id FROM genres WHERE genre LIKE ?", (genre_name,))
+                genre_results = cursor.fetchall()
+
+                if not genre_results:
+                    return "Genre not in the Database"
+
+                genre_id = genre_results[0][0]
+                query = """
+                SELECT 
+                    b.title,
+                    GROUP_CONCAT(a.author_name, ', ') AS authors
+                FROM books b
+                INNER JOIN books_genres bg ON b.book_id = bg.book_id
+                INNER JOIN authors_books ab ON b.book_id = ab.book_id
+                INNER JOIN authors a ON ab.author_id = a.author_id
+                WHERE bg.genre_id = ? AND b.rating >= 4.7 AND {}
+                GROUP BY b.book_id
+                ORDER BY RANDOM()
+                LIMIT ?
+                """.format(not_read)
+                cursor = con.cursor()
+                cursor.execute(query, [genre_id] + read_list_ids + [self.total_books])
+                suggestions = cursor.fetchall()
+
+            if u_input.which_input == 'author':
+                author_name = u_input.name
+                cursor = con.cursor()
+                cursor.execute("SELECT author_id FROM authors WHERE author_name LIKE ?", (author_name,))
+                author_results = cursor.fetchall()
+
+                if not author_results:
+                    return "Author not in the Database"
+
+                author_id = author_results[0][0]
+                query = """
+                SELECT 
+                    b.book_id, 
+                    b.title 
+                FROM books b
+                INNER JOIN authors_books ab ON b.book_id = ab.book_id
+                INNER JOIN authors a ON ab.author_id = a.author_id
+                WHERE a.author_id = ? AND {}
+                GROUP BY b.book_id
+                ORDER BY RANDOM()
+                LIMIT ?
+                """.format(not_read)
+                cursor = con.cursor()
+                cursor.execute(query, [author_id] + read_list_ids + [self.total_books])
+                suggestions = cursor.fetchall()
+
+            if u_input.which_input == 'book':
+                title = u_input.name
+                embedding = embed_text(title)
+
+                filter_condition = {"type": {"$eq": "title"}}
+                search_results = index.query(
+                    vector=embedding,
+                    top_k=1,
+                    include_metadata=True,
+                    filter=filter_condition)
+
+                book_id = int(search_results['matches'][0]['metadata']['book_id'])
+
+                # Precomputed neighbours answer locally, without fetching and querying the index
+                neighbour_table = get_neighbour_table()
+                if neighbour_table is not None and book_id in neighbour_table:
+                    all_ids = neighbour_table.similar(book_id, k=5, exclude=read_list_ids)
+                else:
+                    fetch_results = index.fetch(ids=['desc_' + str(book_id)])
+                    desc_embedding = fetch_results.vectors['desc_' + str(book_id)].values
+
+                    filter_condition = {"book_id": {"$nin": [book_id]}, "type": {"$eq": "description"}}
+                    search_results = index.query(
+                        vector=desc_embedding,
+                        top_k=5,
+                        include_metadata=True,
+                        filter=filter_condition)
+
+                    all_ids = [int(match['metadata']['book_id']) for match in search_results['matches']]
+
+                # Ensure we exclude books already in the read list
+                query = """
+                SELECT 
+                    b.title,
+                    GROUP_CONCAT(a.author_name, ', ') AS authors
+                FROM books b
+                INNER JOIN authors_books ab ON b.book_id = ab.book_id
+                INNER JOIN authors a ON ab.author_id = a.author_id
+                WHERE b.book_id IN ({}) AND {}
+                GROUP BY b.book_id
+                """.format(','.join('?' for _ in all_ids), not_read)
+                cursor = con.cursor()
+                cursor.execute(query, all_ids + read_list_ids)
+                suggestions = cursor.fetchall()
+
+        return suggestions
+
+    def direct_answer(self, suggestions):
+        # Messages explaining why no suggestions could be made are returned as they are
+        if isinstance(suggestions, str) or self.return_titles:
+            return suggestions
+        return None
+
+    def get_response_inputs(self, user_input, suggestions):
+        return {
             "user_input": user_input['user_input'],
             'chat_history': user_input['chat_history'], # passar o chat_history
-            "suggestions": self.suggestions,
+            "suggestions": suggestions,
             "format_instructions": self.format_instructions
-        })
-
-        return response.output
\ No newline at end of file
+        }
\ No newline at end of file
@@ -1,4 +1,4 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates 
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
 
 from langchain.schema.runnable.base import Runnable
 from pydantic import BaseModel, Field
@@ -7,8 +7,8 @@ from langchain_community.chat_models import ChatOpenAI
 from langchain.tools import BaseTool
 from typing import Type, Any
 
-from pinecone import Pinecone
-import openai
+from chatbot.vectors.retrieval import get_retrieval_service
+from chatbot.vectors.embeddings import embed_text
 
 class ExtractTropeInput(BaseModel):
     trope: str 
@@ -56,13 +56,24 @@ class ExtractTrope(Runnable):
         )
         
         return result
+
+    async def ainvoke(self, inputs):
+        result = await self.chain.ainvoke(
+            {
+                "user_input": inputs["user_input"],
+                "chat_history": inputs["chat_history"],
+                "format_instructions": self.format_instructions,
+            }
+        )
+
+        return result
         
 ################################################################
 
 class SuggestBookOutput(BaseModel): 
         output: str 
 
-class SuggestBookGivenTropeChain(Runnable): 
+class SuggestBookGivenTropeChain(ExtractProcessRespondChain): 
     name: str = "SuggestBookGivenTropeChain" 
     description: str = "Suggest a book based on the user input"
     args_schema: Type[BaseModel] = SuggestBookOutput
@@ -72,7 +83,6 @@ class SuggestBookGivenTropeChain(Runnable):
         super().__init__()
         self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0)
         self.extract_chain = ExtractTrope(self.llm)
-        self.suggestions = None
 
         prompt_bot_return = PromptTemplate(
             system_template="""
@@ -102,19 +112,14 @@ class SuggestBookGivenTropeChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=SuggestBookOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__}) 
+        self.build_response_chains(self.prompt, self.output_parser)
     
-    def invoke(self, user_input, config):       
-        result = self.extract_chain.invoke(user_input)
-        trope = result.trope
+    def process(self, extracted, username):
+        suggestions = None
         
-        pinecone = Pinecone()
-        index = pinecone.Index('books')
+        index = get_retrieval_service()
 
-        trope_embedding = openai.embeddings.create(
-            model="text-embedding-ada-002",
-            input=[trope]
-        ).data[0].embedding
+        trope_embedding = embed_text(extracted.trope)
 
         search_results = index.query(
             vector=trope_embedding,
@@ -123,16 +128,14 @@ class SuggestBookGivenTropeChain(Runnable):
         )
 
         if "matches" in search_results and search_results["matches"]:
-            suggested_books = [match['metadata']['text'] for match in search_results['matches']]
-            self.suggestions = suggested_books
-        
-        response = self.chain.invoke(
-            {
+            suggestions = [match['metadata']['text'] for match in search_results['matches']]
+
+        return suggestions
+
+    def get_response_inputs(self, user_input, suggestions):
+        return {
                 "user_input": user_input['user_input'],
-                "suggestions": self.suggestions,
+                "suggestions": suggestions,
                 "chat_history": user_input['chat_history'],
                 "format_instructions": self.format_instructions,
-            }
-        )
-
-        return response.output
\ No newline at end of file
+            }
\ No newline at end of file
@@ -1,13 +1,14 @@
-from chatbot.chains.base import PromptTemplate, generate_prompt_templates
+from chatbot.chains.base import PromptTemplate, generate_prompt_templates, ExtractProcessRespondChain
+from chatbot.profile import user_profiles
 from pydantic import BaseModel
 from langchain import callbacks
 from langchain.tools import BaseTool
 from langchain.schema.runnable.base import Runnable
 from langchain_community.chat_models import ChatOpenAI
 from langchain.output_parsers import PydanticOutputParser
-from langchain_core.output_parsers import StrOutputParser
 from typing import Type
 import sqlitecloud
+from chatbot.db.pool import get_connection
 
 class InfoToUpdate(BaseModel):
     info_to_change: str
@@ -55,18 +56,27 @@ class ExtractInfoToUpdate(Runnable):
                 })
         return result
 
+    async def ainvoke(self, inputs):
+        with callbacks.collect_runs() as cb:
+            result = await self.chain.ainvoke(
+                {
+                    "user_input": inputs["user_input"],
+                    "chat_history": inputs["chat_history"],
+                    "format_instructions": self.format_instructions,
+                })
+        return result
+
 ######################################################
 class UpdateInfoOutput(BaseModel):
     output: str
 
-class UpdateUserInfoChain(Runnable):   
+class UpdateUserInfoChain(ExtractProcessRespondChain):   
 
     def __init__(self, memory: bool = True) -> str:
 
         self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
 
         self.extract_chain = ExtractInfoToUpdate(self.llm)
-        self.status = None
         prompt_bot_return = PromptTemplate(
             system_template = """
             You are a part of the database manager team for a book recommendation platform called Shelfmate. 
@@ -98,56 +108,56 @@ class UpdateUserInfoChain(Runnable):
         self.prompt = generate_prompt_templates(prompt_bot_return, memory=memory)
         self.output_parser = PydanticOutputParser(pydantic_object=UpdateInfoOutput)
         self.format_instructions = self.output_parser.get_format_instructions()
-        self.chain = (self.prompt | self.llm | self.output_parser).with_config({"run_name": self.__class__.__name__})
-
-    def invoke(self, user_input, config):
-        username = config.get('configurable').get('user_id')
-        user_info = self.extract_chain.invoke(user_input)
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
+        self.build_response_chains(self.prompt, self.output_parser)
 
-        # Checking if the info is new
-        cursor.execute(f"SELECT {user_info.info_to_change} FROM users WHERE username = ?", (username,))
-        query_results = cursor.fetchone()
-
-        if len(user_info.new_value) == 0 or user_info.new_value is None:
-            self.status = 'error_invalid_value_to_change'
-
-        if user_info.info_to_change in ['username','user']:
-            self.status = 'error_cannot_change_username'
-
-        if user_info.info_to_change == 'email':
+    def process(self, user_info, username):
+        status = None
+        with get_connection() as con:
             cursor = con.cursor()
-            if cursor.execute(f"SELECT email FROM users WHERE email = ?", (user_info.new_value,)).fetchone():
-                self.status = 'error_email_already_taken'
-        
-        if not self.status:
-            if query_results[0]!=user_info.new_value:
-                try:
-                    # Updating if the info to update is different from the info stored
-                    query = f"UPDATE users SET {user_info.info_to_change} = ? WHERE username = ?"
-                    params = (user_info.new_value, username)
-                    cursor = con.cursor()
-                    cursor.execute(query, params)
-                    con.commit()
-                    self.status = 'success'
-
-                except sqlitecloud.OperationalError as e:
-                    print(f"Error: {e}")
-                    self.status = 'error'
-                finally:
-                    cursor.close()
-                    con.close()
-            else: 
-                self.status = 'no_change'
-        
-        con.close()
-        
-        response = self.chain.invoke({
+
+            # Checking if the info is new
+            cursor.execute(f"SELECT {user_info.info_to_change} FROM users WHERE username = ?", (username,))
+            query_results = cursor.fetchone()
+
+            if len(user_info.new_value) == 0 or user_info.new_value is None:
+                status = 'error_invalid_value_to_change'
+
+            if user_info.info_to_change in ['username','user']:
+                status = 'error_cannot_change_username'
+
+            if user_info.info_to_change == 'email':
+                cursor = con.cursor()
+                if cursor.execute(f"SELECT email FROM users WHERE email = ?", (user_info.new_value,)).fetchone():
+                    status = 'error_email_already_taken'
+
+            if not status:
+                if query_results[0]!=user_info.new_value:
+                    try:
+                        # Updating if the info to update is different from the info stored
+                        query = f"UPDATE users SET {user_info.info_to_change} = ? WHERE username = ?"
+                        params = (user_info.new_value, username)
+                        cursor = con.cursor()
+                        cursor.execute(query, params)
+                        con.commit()
+                        # The cached profile of the user is now outdated
+                        user_profiles.invalidate(username)
+                        status = 'success'
+
+                    except sqlitecloud.OperationalError as e:
+                        print(f"Error: {e}")
+                        status = 'error'
+                    finally:
+                        cursor.close()
+                else: 
+                    status = 'no_change'
+
+
+        return status
+
+    def get_response_inputs(self, user_input, status):
+        return {
             "user_input": user_input['user_input'],
             'chat_history': user_input['chat_history'],
-            "status": self.status,
+            "status": status,
             "format_instructions": self.format_instructions
-        })
-
-        return response.output
\ No newline at end of file
+        }
\ No newline at end of file
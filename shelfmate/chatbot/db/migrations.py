@@ -0,0 +1,270 @@
+# Import necessary modules and classes
+import argparse
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from chatbot.db.pool import get_connection
+from chatbot.db.replica import get_replica_path
+
+# Versioned schema migrations, applied in order and recorded in schema_migrations.
+# Each statement is idempotent and only runs if its table exists, so the same
+# migrations apply to the remote database and to the local catalog replica. A
+# migration with missing tables is not recorded and is tried again on the next run.
+MIGRATIONS: List[Tuple[int, str, List[Tuple[str, str]]]] = [
+    (1, "Indexes for the join tables of the recommendation queries", [
+        ("authors_books", "CREATE INDEX IF NOT EXISTS idx_authors_books_author_book ON authors_books (author_id, book_id)"),
+        ("authors_books", "CREATE INDEX IF NOT EXISTS idx_authors_books_book_author ON authors_books (book_id, author_id)"),
+        ("books_genres", "CREATE INDEX IF NOT EXISTS idx_books_genres_genre_book ON books_genres (genre_id, book_id)"),
+        ("books_genres", "CREATE INDEX IF NOT EXISTS idx_books_genres_book_genre ON books_genres (book_id, genre_id)"),
+    ]),
+    (2, "Indexes for the user tables read on every turn", [
+        ("read_list", "CREATE INDEX IF NOT EXISTS idx_read_list_username_book ON read_list (username, book_id, rating)"),
+        ("read_list", "CREATE INDEX IF NOT EXISTS idx_read_list_book ON read_list (book_id)"),
+        ("fav_authors", "CREATE INDEX IF NOT EXISTS idx_fav_authors_username_author ON fav_authors (username, author_id)"),
+        ("fav_genres", "CREATE INDEX IF NOT EXISTS idx_fav_genres_username_genre ON fav_genres (username, genre_id)"),
+        ("users", "CREATE INDEX IF NOT EXISTS idx_users_email ON users (email)"),
+    ]),
+    (3, "Indexes for the catalog lookups and the book list filters", [
+        ("authors", "CREATE INDEX IF NOT EXISTS idx_authors_name ON authors (author_name)"),
+        ("authors", "CREATE INDEX IF NOT EXISTS idx_authors_top_genre ON authors (top_genre, author_name)"),
+        ("genres", "CREATE INDEX IF NOT EXISTS idx_genres_genre ON genres (genre)"),
+        ("books", "CREATE INDEX IF NOT EXISTS idx_books_title ON books (title, page_number)"),
+        ("books", "CREATE INDEX IF NOT EXISTS idx_books_published_date ON books (published_date, page_number)"),
+        ("books", "CREATE INDEX IF NOT EXISTS idx_books_page_number ON books (page_number)"),
+        ("books", "CREATE INDEX IF NOT EXISTS idx_books_rating ON books (rating)"),
+    ]),
+]
+
+# Representative versions of the hot queries of the chains and pages, with sample parameters
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "profile_read_list": ("""
+        SELECT rl.book_id, b.rating
+        FROM read_list rl
+        INNER JOIN books b ON rl.book_id = b.book_id
+        WHERE rl.username = ?
+    """, ("sunny22",)),
+    "profile_fav_genres": ("SELECT genre_id FROM fav_genres WHERE username = ?", ("sunny22",)),
+    "profile_fav_authors": ("SELECT author_id FROM fav_authors WHERE username = ?", ("sunny22",)),
+    "read_list_contains": ("SELECT book_id FROM read_list WHERE username = ? AND book_id = ?", ("sunny22", 1)),
+    "books_by_fav_genres": ("""
+        SELECT b.title, GROUP_CONCAT(a.author_name, ', ') AS authors
+        FROM books b
+        INNER JOIN books_genres bg ON b.book_id = bg.book_id
+        INNER JOIN authors_books ab ON b.book_id = ab.book_id
+        INNER JOIN authors a ON ab.author_id = a.author_id
+        LEFT JOIN read_list rl ON b.book_id = rl.book_id
+        WHERE bg.genre_id IN (?, ?) AND rl.book_id IS NULL AND b.rating > 4
+        GROUP BY b.book_id
+    """, (7, 15)),
+    "books_by_fav_authors": ("""
+        SELECT b.title, GROUP_CONCAT(a.author_name, ', ') AS authors
+        FROM books b
+        INNER JOIN authors_books ab ON b.book_id = ab.book_id
+        INNER JOIN authors a ON ab.author_id = a.author_id
+        LEFT JOIN read_list rl ON b.book_id = rl.book_id
+        WHERE ab.author_id IN (?, ?) AND rl.book_id IS NULL AND b.rating > 4
+        GROUP BY b.book_id
+    """, (4021, 5185)),
+    "similar_authors": ("""
+        SELECT DISTINCT a2.author_name
+        FROM authors a2
+        INNER JOIN authors_books ab2 ON a2.author_id = ab2.author_id
+        WHERE ab2.book_id IN (
+            SELECT DISTINCT ab.book_id
+            FROM authors_books ab
+            WHERE ab.author_id IN (?)
+        ) AND a2.author_id NOT IN (?)
+    """, (4021, 4021)),
+    "authors_of_books": ("""
+        SELECT DISTINCT a.author_name
+        FROM authors a
+        INNER JOIN authors_books ab ON a.author_id = ab.author_id
+        WHERE ab.book_id IN (?, ?)
+    """, (1, 2)),
+    "authors_by_top_genre": ("""
+        SELECT DISTINCT a.author_name
+        FROM authors a
+        WHERE a.top_genre = ?
+        ORDER BY a.author_name
+        LIMIT 5
+    """, (7,)),
+    "author_by_name": ("SELECT author_id FROM authors WHERE author_name = ?", ("DK",)),
+    "genre_by_name": ("SELECT genre_id FROM genres WHERE genre = ?", ("Fiction",)),
+    "pages_of_titles": ("SELECT page_number FROM books WHERE title IN (?, ?)", ("Dune", "Emma")),
+    "book_list_filters": ("""
+        SELECT b.title, b.published_date, b.page_number, b.description
+        FROM books b
+        WHERE b.published_date BETWEEN ? AND ? AND b.page_number BETWEEN ? AND ?
+        ORDER BY b.title LIMIT 20
+    """, (2000, 2005, 100, 300)),
+    "login_by_email": ("SELECT username FROM users WHERE email = ?", ("sandra.silva@example.com",)),
+}
+
+
+def get_existing_tables(con) -> set:
+    """List the tables of a database.
+
+    Args:
+        con: An open connection to the database.
+
+    Returns:
+        The set of table names.
+    """
+    cursor = con.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migrations(con, tables: Optional[Iterable[str]] = None) -> List[int]:
+    """Apply the pending migrations to a database.
+
+    Args:
+        con: An open connection to the database.
+        tables: If given, only the migrations whose tables are all in this set are
+            applied, e.g. the catalog tables of the local replica. The others are
+            skipped silently.
+
+    Returns:
+        The versions that were fully applied by this call.
+    """
+    cursor = con.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations
+        (version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL)
+    """)
+    cursor = con.cursor()
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {row[0] for row in cursor.fetchall()}
+    scope = set(tables) if tables is not None else None
+    tables = get_existing_tables(con)
+
+    newly_applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        if scope is not None and not {table for table, _ in statements} <= scope:
+            continue
+
+        for table, statement in statements:
+            if table in tables:
+                cursor = con.cursor()
+                cursor.execute(statement)
+
+        # A migration is only recorded once all its tables exist, so the statements
+        # skipped now run when the missing tables are created
+        missing = sorted({table for table, _ in statements} - tables)
+        if missing:
+            con.commit()
+            print(f"Migration {version} left pending, missing tables: {', '.join(missing)}")
+            continue
+
+        cursor = con.cursor()
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+            (version, description, time.strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        con.commit()
+        newly_applied.append(version)
+
+    return newly_applied
+
+
+def explain_query_plan(con, query: str, params: tuple = ()) -> List[str]:
+    """Retrieve the query plan SQLite chooses for a query.
+
+    Args:
+        con: An open connection to the database.
+        query: The query to explain.
+        params: The parameters of the query.
+
+    Returns:
+        The detail line of each step of the plan.
+    """
+    cursor = con.cursor()
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    # The detail is the last column of each row
+    return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan(step: str) -> bool:
+    """Check if a query plan step reads a whole table instead of using an index.
+
+    Args:
+        step: The detail line of a query plan step.
+
+    Returns:
+        True if the step scans a table without an index.
+    """
+    return step.startswith("SCAN") and "INDEX" not in step
+
+
+def query_plan_report(con) -> Dict[str, Dict[str, Any]]:
+    """Explain the hot queries whose tables exist in a database.
+
+    Args:
+        con: An open connection to the database.
+
+    Returns:
+        A dictionary with the plan of each query and the tables it fully scans.
+    """
+    tables = get_existing_tables(con)
+    report = {}
+    for name, (query, params) in HOT_QUERIES.items():
+        try:
+            plan = explain_query_plan(con, query, params)
+        except Exception as e:
+            # Some queries mix catalog and user tables, which the replica does not have
+            if any(table in str(e) for table in ("read_list", "users", "fav_")) or not tables:
+                continue
+            raise
+        report[name] = {
+            "plan": plan,
+            "full_scans": [step for step in plan if is_full_scan(step)],
+        }
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, Any]]) -> None:
+    """Print a query plan report.
+
+    Args:
+        report: The report built by query_plan_report.
+    """
+    for name, info in report.items():
+        status = "FULL SCAN" if info["full_scans"] else "ok"
+        print(f"{name}: {status}")
+        for step in info["plan"]:
+            print(f"    {step}")
+
+
+if __name__ == "__main__":
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description="Apply the index migrations and report the query plans.")
+    parser.add_argument("--local", action="store_true", help="Use the local catalog replica instead of the remote database.")
+    parser.add_argument("--explain", action="store_true", help="Print the query plans of the hot queries.")
+    parser.add_argument("--explain-only", action="store_true", help="Print the query plans without migrating.")
+    args = parser.parse_args()
+
+    def run(con):
+        if args.explain_only or args.explain:
+            print("Before:" if not args.explain_only else "Query plans:")
+            print_report(query_plan_report(con))
+        if not args.explain_only:
+            versions = apply_migrations(con)
+            print(f"Applied migrations: {versions or 'none, already up to date'}")
+            if args.explain:
+                print("After:")
+                print_report(query_plan_report(con))
+
+    if args.local:
+        con = sqlite3.connect(get_replica_path())
+        try:
+            run(con)
+        finally:
+            con.close()
+    else:
+        with get_connection() as con:
+            run(con)
@@ -0,0 +1,244 @@
+# Import necessary modules and classes
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import sqlitecloud
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available before the checkout timeout."""
+
+
+class ConnectionPool:
+    """Bounded pool of keep-alive connections to the SQLite Cloud database.
+
+    Connections are created on demand up to a maximum size and returned to the pool
+    after use instead of being closed, so the TLS and authentication handshake is
+    paid once per connection rather than once per query. Connections that have been
+    idle for a while are checked with a cheap query before being handed out again.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_size: int = 8,
+        timeout: float = 10.0,
+        health_check_after: float = 30.0,
+    ):
+        """Initialize the pool.
+
+        Args:
+            url: The connection string of the database.
+            max_size: Maximum number of open connections.
+            timeout: Seconds to wait for a free connection before giving up.
+            health_check_after: Seconds a connection may stay idle before it is
+                checked again on checkout.
+        """
+        self.url = url
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+
+        # Idle connections with the time they were returned, most recent last
+        self.idle: List[Tuple[Any, float]] = []
+        self.active = 0
+        self._condition = threading.Condition()
+
+        # Counters exported by stats()
+        self.created = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ConnectionPool":
+        """Create a pool configured from the environment variables.
+
+        Returns:
+            A pool using SHELFMATE_DATABASE_URL, SHELFMATE_DB_POOL_SIZE,
+            SHELFMATE_DB_POOL_TIMEOUT and SHELFMATE_DB_HEALTH_CHECK_SECONDS.
+
+        Raises:
+            RuntimeError: If SHELFMATE_DATABASE_URL is not set.
+        """
+        # The connection string holds the API key, so it is only read from the environment
+        url = os.getenv("SHELFMATE_DATABASE_URL")
+        if not url:
+            raise RuntimeError(
+                "SHELFMATE_DATABASE_URL is not set. Add the SQLite Cloud connection string "
+                "(sqlitecloud://<host>:<port>/<database>?apikey=<key>) to the environment or to the .env file."
+            )
+
+        return cls(
+            url=url,
+            max_size=int(os.getenv("SHELFMATE_DB_POOL_SIZE", "8")),
+            timeout=float(os.getenv("SHELFMATE_DB_POOL_TIMEOUT", "10")),
+            health_check_after=float(os.getenv("SHELFMATE_DB_HEALTH_CHECK_SECONDS", "30")),
+        )
+
+    def _connect(self):
+        con = sqlitecloud.connect(self.url)
+        with self._condition:
+            self.created += 1
+        return con
+
+    @staticmethod
+    def _is_healthy(con) -> bool:
+        try:
+            cursor = con.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, con) -> None:
+        try:
+            con.close()
+        except Exception:
+            pass
+        with self._condition:
+            self.discarded += 1
+
+    def checkout(self):
+        """Take a connection from the pool, opening a new one if there is room.
+
+        Returns:
+            An open connection to the database.
+
+        Raises:
+            PoolTimeout: If every connection stays in use for longer than the timeout.
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.timeout
+
+        with self._condition:
+            while not self.idle and self.active >= self.max_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {self.timeout:.1f}s"
+                    )
+                self._condition.wait(remaining)
+
+            entry = self.idle.pop() if self.idle else None
+            self.active += 1
+
+            wait_seconds = time.perf_counter() - start_time
+            self.checkouts += 1
+            self.total_wait_seconds += wait_seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+        try:
+            if entry is not None:
+                con, returned_at = entry
+                # Only connections that have been idle for a while are checked
+                if time.monotonic() - returned_at < self.health_check_after or self._is_healthy(con):
+                    return con
+                self._discard(con)
+
+            return self._connect()
+        except BaseException:
+            # Give the slot back if no connection could be opened
+            with self._condition:
+                self.active -= 1
+                self._condition.notify()
+            raise
+
+    def checkin(self, con, broken: bool = False) -> None:
+        """Return a connection to the pool.
+
+        Args:
+            con: The connection taken with checkout.
+            broken: If True, the connection is closed instead of being reused.
+        """
+        if broken:
+            self._discard(con)
+
+        with self._condition:
+            self.active -= 1
+            if not broken:
+                self.idle.append((con, time.monotonic()))
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Check out a connection for the duration of a with block.
+
+        The connection is always returned to the pool, also when the block returns
+        early or raises. After an error it is only reused if it still answers.
+
+        Returns:
+            A context manager yielding an open connection.
+        """
+        con = self.checkout()
+        try:
+            yield con
+        except BaseException:
+            self.checkin(con, broken=not self._is_healthy(con))
+            raise
+        else:
+            self.checkin(con)
+
+    def close(self) -> None:
+        """Close every idle connection of the pool."""
+        with self._condition:
+            idle, self.idle = self.idle, []
+        for con, _ in idle:
+            self._discard(con)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the usage counters of the pool.
+
+        Returns:
+            A dictionary with the active and idle counts and the checkout wait times.
+        """
+        with self._condition:
+            return {
+                "max_size": self.max_size,
+                "active": self.active,
+                "idle": len(self.idle),
+                "created": self.created,
+                "discarded": self.discarded,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": (
+                    self.total_wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0
+                ),
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Retrieve the pool shared by the whole process, creating it on first use.
+
+    The pool is created lazily so the environment variables loaded by the pages
+    with load_dotenv are taken into account.
+
+    Returns:
+        The shared connection pool.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool.from_env()
+    return _pool
+
+
+def get_connection():
+    """Check out a connection from the shared pool.
+
+    Returns:
+        A context manager yielding an open connection to the database.
+    """
+    return get_pool().connection()
@@ -0,0 +1,310 @@
+# Import necessary modules and classes
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from chatbot.db.pool import get_connection
+
+# Root of the repository, where the data folder lives
+ROOT_DIR = Path(__file__).resolve().parents[3]
+DATA_DIR = ROOT_DIR / "data" / "final_data"
+DEFAULT_REPLICA_PATH = ROOT_DIR / "data" / "catalog.db"
+
+# Catalog tables are static and can be read locally, user tables stay remote
+CATALOG_SCHEMA = {
+    "books": """
+        CREATE TABLE books
+        (book_id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT NOT NULL,
+        published_date INTEGER,
+        page_number INTEGER NOT NULL,
+        rating REAL) WITHOUT ROWID
+    """,
+    "genres": """
+        CREATE TABLE genres
+        (genre_id INTEGER PRIMARY KEY,
+        genre TEXT NOT NULL) WITHOUT ROWID
+    """,
+    "authors": """
+        CREATE TABLE authors
+        (author_id INTEGER PRIMARY KEY,
+        author_name TEXT NOT NULL,
+        top_genre INTEGER NOT NULL,
+        FOREIGN KEY (top_genre) REFERENCES genres(genre_id)) WITHOUT ROWID
+    """,
+    "authors_books": """
+        CREATE TABLE authors_books
+        (book_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        FOREIGN KEY (book_id) REFERENCES books(book_id),
+        FOREIGN KEY (author_id) REFERENCES authors(author_id))
+    """,
+    "books_genres": """
+        CREATE TABLE books_genres
+        (book_id INTEGER NOT NULL,
+        genre_id INTEGER NOT NULL,
+        FOREIGN KEY (book_id) REFERENCES books(book_id),
+        FOREIGN KEY (genre_id) REFERENCES genres(genre_id))
+    """,
+}
+
+# CSV file, CSV columns and column types of each catalog table, in table column order
+CATALOG_SOURCES = {
+    "books": ("books.csv", ["book_id", "title", "description", "published_date", "page_number", "rating"],
+              [int, str, str, int, int, float]),
+    "genres": ("genres.csv", ["genre_id", "genre"], [int, str]),
+    "authors": ("authors.csv", ["author_id", "author", "genre_id"], [int, str, int]),
+    "authors_books": ("authors_books.csv", ["book_id", "author_id"], [int, int]),
+    "books_genres": ("books_genres.csv", ["book_id", "genre_id"], [int, int]),
+}
+
+
+def get_replica_path() -> Path:
+    """Retrieve the location of the local catalog replica.
+
+    Returns:
+        The path set in SHELFMATE_CATALOG_REPLICA, or data/catalog.db by default.
+    """
+    return Path(os.getenv("SHELFMATE_CATALOG_REPLICA", DEFAULT_REPLICA_PATH))
+
+
+def _convert(value: str, column_type):
+    # Empty cells and floats written by pandas ("12.0") are normalized here
+    if value is None or value == "":
+        return None
+    if column_type is int:
+        return int(float(value))
+    return column_type(value)
+
+
+def read_catalog_csv(table: str, data_dir: Path = DATA_DIR) -> Optional[List[tuple]]:
+    """Read the rows of a catalog table from its CSV file.
+
+    Args:
+        table: The name of the catalog table.
+        data_dir: The folder with the CSV files.
+
+    Returns:
+        The typed rows of the table, or None if there is no CSV file for it.
+    """
+    file_name, columns, types = CATALOG_SOURCES[table]
+    path = Path(data_dir) / file_name
+    if not path.exists():
+        return None
+
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        return [
+            tuple(_convert(row[column], column_type) for column, column_type in zip(columns, types))
+            for row in reader
+        ]
+
+
+def read_remote_table(table: str) -> List[tuple]:
+    """Copy the rows of a catalog table from the remote database.
+
+    Args:
+        table: The name of the catalog table.
+
+    Returns:
+        The rows of the table, in table column order.
+    """
+    with get_connection() as con:
+        cursor = con.cursor()
+        cursor.execute(f"SELECT * FROM {table}")
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def build_replica(
+    path: Optional[Path] = None, data_dir: Path = DATA_DIR, use_remote: bool = True
+) -> Dict[str, Any]:
+    """Build the local catalog replica from the CSV files.
+
+    Tables without a CSV file (books is not shipped in data/final_data) are mirrored
+    from the remote database. The replica is written to a temporary file and moved
+    into place at the end, so readers never see a half-built database.
+
+    Args:
+        path: Where to write the replica. Defaults to get_replica_path().
+        data_dir: The folder with the CSV files.
+        use_remote: If False, tables without a CSV file are left empty.
+
+    Returns:
+        A dictionary with the number of rows and the source of each table.
+    """
+    path = Path(path or get_replica_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    report = {}
+    con = sqlite3.connect(tmp_path)
+    try:
+        for table, ddl in CATALOG_SCHEMA.items():
+            con.execute(ddl)
+
+            rows = read_catalog_csv(table, data_dir)
+            source = "csv"
+            if rows is None:
+                rows = read_remote_table(table) if use_remote else []
+                source = "remote" if use_remote else "missing"
+
+            placeholders = ", ".join("?" for _ in CATALOG_SOURCES[table][1])
+            con.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({placeholders})", rows)
+            report[table] = {"rows": len(rows), "source": source}
+
+        # Same indexes as the remote database for the catalog queries, the user
+        # tables are not replicated
+        from chatbot.db.migrations import apply_migrations
+        apply_migrations(con, tables=CATALOG_SCHEMA)
+
+        con.execute("CREATE TABLE replica_info (key TEXT PRIMARY KEY, value TEXT)")
+        con.execute("INSERT INTO replica_info VALUES ('built_at', ?)", (time.strftime("%Y-%m-%d %H:%M:%S"),))
+        # Row count and source of each table, to tell an incomplete replica from a full one
+        con.executemany("INSERT INTO replica_info VALUES (?, ?)", [
+            (f"{table}.{key}", str(value)) for table, info in report.items() for key, value in info.items()
+        ])
+        con.commit()
+    finally:
+        con.close()
+
+    os.replace(tmp_path, path)
+    return report
+
+
+class CatalogReplica:
+    """Read-only access to the local catalog replica.
+
+    Every thread keeps its own SQLite connection, which is reopened when the replica
+    file is rebuilt.
+    """
+
+    def __init__(self, path: Path):
+        """Initialize the replica reader.
+
+        Args:
+            path: The location of the replica file.
+        """
+        self.path = Path(path)
+        self._local = threading.local()
+        self._checked_mtime = None
+        self._has_books = False
+
+    def exists(self) -> bool:
+        """Check if the replica file has been built."""
+        return self.path.exists()
+
+    def connect(self) -> sqlite3.Connection:
+        """Retrieve the connection of the current thread to the replica.
+
+        Returns:
+            A read-only SQLite connection.
+        """
+        mtime = self.path.stat().st_mtime
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.mtime != mtime:
+            if con is not None:
+                con.close()
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.con = con
+            self._local.mtime = mtime
+        return con
+
+    def has_books(self) -> bool:
+        """Check if the books table of the replica has rows.
+
+        A replica built with --no-remote has an empty books table, as books.csv is not
+        shipped. The check is repeated only when the replica file is rebuilt.
+
+        Returns:
+            True if the replica can answer the catalog queries.
+        """
+        mtime = self.path.stat().st_mtime
+        if self._checked_mtime != mtime:
+            cursor = self.connect().cursor()
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM books)")
+            self._has_books = bool(cursor.fetchone()[0])
+            self._checked_mtime = mtime
+            if not self._has_books:
+                print(f"The catalog replica {self.path} has no books, reading the catalog from the remote database")
+        return self._has_books
+
+    def info(self) -> Dict[str, str]:
+        """Read the build time and the row count and source of each table of the replica."""
+        cursor = self.connect().cursor()
+        cursor.execute("SELECT key, value FROM replica_info")
+        return dict(cursor.fetchall())
+
+
+_replica: Optional[CatalogReplica] = None
+
+
+def get_replica() -> CatalogReplica:
+    """Retrieve the replica reader shared by the process, creating it on first use.
+
+    Returns:
+        The catalog replica reader.
+    """
+    global _replica
+    if _replica is None or _replica.path != get_replica_path():
+        _replica = CatalogReplica(get_replica_path())
+    return _replica
+
+
+def use_local_catalog() -> bool:
+    """Decide if the catalog tables are read from the local replica.
+
+    SHELFMATE_CATALOG_SOURCE can be 'local', 'remote' or 'auto' (the default), which
+    reads locally whenever the replica has been built with its books.
+
+    Returns:
+        True if catalog reads go to the local replica.
+    """
+    source = os.getenv("SHELFMATE_CATALOG_SOURCE", "auto").lower()
+    if source == "remote":
+        return False
+    if source == "local":
+        return True
+    replica = get_replica()
+    return replica.exists() and replica.has_books()
+
+
+@contextmanager
+def get_catalog_connection() -> Iterator[Any]:
+    """Open a connection for queries that only touch the catalog tables
+    (genres, authors, books, authors_books and books_genres).
+
+    Returns:
+        A context manager yielding a connection to the local replica, or a pooled
+        connection to the remote database when the replica is not in use.
+    """
+    if use_local_catalog():
+        yield get_replica().connect()
+    else:
+        with get_connection() as con:
+            yield con
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local catalog replica from data/final_data.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the replica.")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Folder with the CSV files.")
+    parser.add_argument("--no-remote", action="store_true",
+                        help="Do not mirror the tables without a CSV file from the remote database.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    report = build_replica(args.output, args.data_dir, use_remote=not args.no_remote)
+    for table, info in report.items():
+        print(f"{table}: {info['rows']} rows ({info['source']})")
+    if not report["books"]["rows"]:
+        print("Warning: the books table is empty, the catalog will keep being read from the remote database")
+    print(f"Replica built in {time.perf_counter() - start_time:.2f}s")
@@ -1,5 +1,9 @@
 # Import necessary modules and classes
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict, List, Tuple
 
 from langchain_core.chat_history import BaseChatMessageHistory
@@ -13,14 +17,18 @@ from pydantic import BaseModel, Field
 class InMemoryHistory(BaseChatMessageHistory, BaseModel):
     """In-memory implementation of chat message history.
 
-    Stores a list of messages within the session.
+    Stores the most recent messages of the session, which are sent with every prompt.
     """
 
     messages: List[BaseMessage] = Field(default_factory=list)
+    max_messages: int = 20
 
     def add_messages(self, messages: List[BaseMessage]):
-        """Add a list of messages to the in-memory store."""
+        """Add a list of messages to the in-memory store, dropping the oldest ones
+        beyond max_messages."""
         self.messages.extend(messages)
+        if len(self.messages) > self.max_messages:
+            self.messages = self.messages[-self.max_messages:]
 
     def clear(self) -> None:
         """Clear all messages from the in-memory store."""
@@ -31,12 +39,20 @@ class MemoryManager:
     """Manages session history and configuration for user interactions.
 
     Stores session-specific configurations and provides access to
-    session histories.
+    session histories. The manager is shared by every session of the process, so
+    the sessions idle for longer than SHELFMATE_SESSION_IDLE_SECONDS (1 hour by
+    default) are dropped, as are the least recently used ones beyond
+    SHELFMATE_MAX_SESSIONS (1000 by default).
     """
 
     def __init__(self):
         """Initialize session manager."""
-        self.store: Dict[Tuple[str, str], InMemoryHistory] = {}
+        self.store: Dict[Tuple[str, str], InMemoryHistory] = OrderedDict()
+        self.last_used: Dict[Tuple[str, str], float] = {}
+        self.max_sessions = int(os.getenv("SHELFMATE_MAX_SESSIONS", 1000))
+        self.idle_seconds = float(os.getenv("SHELFMATE_SESSION_IDLE_SECONDS", 3600))
+        self.max_messages = int(os.getenv("SHELFMATE_HISTORY_MAX_MESSAGES", 20))
+        self._lock = threading.Lock()
         self.history_factory_config = [
             ConfigurableFieldSpec(
                 id="user_id",
@@ -68,11 +84,26 @@ class MemoryManager:
         Returns:
             An instance of BaseChatMessageHistory for managing the chat history.
         """
-        if (user_id, conversation_id) not in self.store:
-            # Initialize new in-memory history if not already stored
-            self.store[(user_id, conversation_id)] = InMemoryHistory()
-
-        return self.store[(user_id, conversation_id)]
+        key = (user_id, conversation_id)
+        with self._lock:
+            now = time.monotonic()
+            if key not in self.store:
+                # Initialize new in-memory history if not already stored
+                self.store[key] = InMemoryHistory(max_messages=self.max_messages)
+            self.store.move_to_end(key)
+            self.last_used[key] = now
+            self._evict(now)
+
+            return self.store[key]
+
+    def _evict(self, now: float) -> None:
+        # The least recently used sessions come first in the store
+        while self.store:
+            oldest = next(iter(self.store))
+            if len(self.store) <= self.max_sessions and now - self.last_used[oldest] <= self.idle_seconds:
+                break
+            del self.store[oldest]
+            del self.last_used[oldest]
 
     def get_history_factory_config(self) -> List[ConfigurableFieldSpec]:
         """Retrieve configuration settings for history factory.
@@ -0,0 +1,116 @@
+# Import necessary modules and classes
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+from chatbot.db.pool import get_connection
+
+
+class UserProfileCache:
+    """Process-wide cache of the read-only profile data of each user.
+
+    Stores the district, the favorite genres and authors and the read list of a
+    user so that the chains can read them without querying the database on every
+    turn. Entries expire after a time-to-live and are invalidated by the chains
+    that write to the user tables.
+    """
+
+    def __init__(self, ttl_seconds: float = 300):
+        """Initialize the cache.
+
+        Args:
+            ttl_seconds: Number of seconds a profile stays valid after being loaded.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.store: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._user_locks: Dict[str, threading.Lock] = {}
+
+    def _get_user_lock(self, username: str) -> threading.Lock:
+        with self._lock:
+            return self._user_locks.setdefault(username, threading.Lock())
+
+    def get(self, username: str) -> Dict[str, Any]:
+        """Retrieve the profile of a user, loading it from the database if needed.
+
+        Concurrent requests for the same user wait for a single load.
+
+        Args:
+            username: Identifier for the user.
+
+        Returns:
+            A dictionary with the profile information of the user.
+        """
+        with self._get_user_lock(username):
+            entry = self.store.get(username)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            profile = self.load(username)
+            self.store[username] = (time.monotonic(), profile)
+            return profile
+
+    def load(self, username: str) -> Dict[str, Any]:
+        """Load the profile of a user from the database.
+
+        Args:
+            username: Identifier for the user.
+
+        Returns:
+            A dictionary with the profile information of the user.
+        """
+        with get_connection() as con:
+            cursor = con.cursor()
+            cursor.execute("SELECT district FROM users WHERE username = ?", (username,))
+            row = cursor.fetchone()
+            district = row[0] if row else None
+
+            cursor = con.cursor()
+            cursor.execute("SELECT genre_id FROM fav_genres WHERE username = ?", (username,))
+            fav_genre_ids = [row[0] for row in cursor.fetchall()]
+
+            cursor = con.cursor()
+            cursor.execute("SELECT author_id FROM fav_authors WHERE username = ?", (username,))
+            fav_author_ids = [row[0] for row in cursor.fetchall()]
+
+            # Books in the read list that are well rated are considered favorites
+            cursor = con.cursor()
+            cursor.execute("""
+                SELECT rl.book_id, b.rating
+                FROM read_list rl
+                INNER JOIN books b ON rl.book_id = b.book_id
+                WHERE rl.username = ?
+            """, (username,))
+            read_list = cursor.fetchall()
+
+        return {
+            "district": district,
+            "fav_genre_ids": fav_genre_ids,
+            "fav_author_ids": fav_author_ids,
+            "read_book_ids": [book_id for book_id, _ in read_list],
+            "liked_book_ids": [
+                book_id for book_id, rating in read_list
+                if rating is not None and rating >= 4
+            ],
+        }
+
+    def invalidate(self, username: str) -> None:
+        """Drop the cached profile of a user after their data changed.
+
+        Args:
+            username: Identifier for the user.
+        """
+        with self._get_user_lock(username):
+            self.store.pop(username, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Report the hit and miss counters of the cache."""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.store)}
+
+
+# Profile cache shared by the chatbot and its chains
+user_profiles = UserProfileCache()
@@ -0,0 +1,140 @@
+# Import necessary modules and classes
+import os
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chatbot.vectors.embeddings import get_embedding_cache
+
+# Intents whose answers only depend on the documents, not on the user
+CACHEABLE_INTENTS = ("ask_about_company_info", "ask_about_chatbot_features")
+
+
+class SemanticAnswerCache:
+    """Answers of the FAQ intents, reused for questions with a similar embedding.
+
+    Each intent keeps the normalized embeddings of the questions it answered with the
+    answers and the seconds they took to generate. A question whose cosine similarity
+    to a cached question reaches the threshold gets the cached answer. Entries are
+    stored under the version of the document corpus, so a re-ingest of the PDFs
+    drops the answers built from the previous documents.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 500):
+        """Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity between two questions to share an answer.
+            max_entries: Number of answers kept per intent, the oldest are dropped first.
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.intents: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        # Counters exported by stats(), per intent
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.saved_seconds: Counter = Counter()
+
+    def _entries(self, intent: str, version: str) -> Dict[str, Any]:
+        entries = self.intents.get(intent)
+        if entries is None or entries["version"] != version:
+            entries = {"version": version, "vectors": np.empty((0, 0), dtype=np.float32),
+                       "answers": [], "seconds": []}
+            self.intents[intent] = entries
+        return entries
+
+    def lookup(self, intent: str, version: str, question: str) -> Tuple[Optional[str], np.ndarray]:
+        """Search the cached answer of a similar question.
+
+        Args:
+            intent: The intent of the question.
+            version: The version of the document corpus.
+            question: The question of the user.
+
+        Returns:
+            The cached answer or None, and the normalized embedding of the question
+            to pass to store() after a miss.
+        """
+        vector = np.asarray(get_embedding_cache().embed_one(question), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+
+        with self._lock:
+            entries = self._entries(intent, version)
+            if len(entries["answers"]):
+                scores = entries["vectors"] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.hits[intent] += 1
+                    self.saved_seconds[intent] += entries["seconds"][best]
+                    return entries["answers"][best], vector
+            self.misses[intent] += 1
+        return None, vector
+
+    def store(self, intent: str, version: str, vector: Sequence[float], answer: str, seconds: float) -> None:
+        """Cache the answer of a question.
+
+        Args:
+            intent: The intent of the question.
+            version: The version of the document corpus.
+            vector: The normalized embedding returned by lookup().
+            answer: The generated answer.
+            seconds: The time it took to generate the answer.
+        """
+        if not answer:
+            return
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            entries = self._entries(intent, version)
+            vectors = entries["vectors"] if len(entries["answers"]) else np.empty((0, len(vector)), dtype=np.float32)
+            entries["vectors"] = np.vstack([vectors, vector])[-self.max_entries:]
+            entries["answers"] = (entries["answers"] + [answer])[-self.max_entries:]
+            entries["seconds"] = (entries["seconds"] + [seconds])[-self.max_entries:]
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self.intents.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the hit rate and the generation time saved for each intent.
+
+        Returns:
+            A dictionary with the counters of each cacheable intent.
+        """
+        report: Dict[str, Any] = {"threshold": self.threshold}
+        for intent in CACHEABLE_INTENTS:
+            lookups = self.hits[intent] + self.misses[intent]
+            entries = self.intents.get(intent)
+            report[intent] = {
+                "entries": len(entries["answers"]) if entries else 0,
+                "hits": self.hits[intent],
+                "misses": self.misses[intent],
+                "hit_rate": self.hits[intent] / lookups if lookups else 0.0,
+                "saved_seconds": self.saved_seconds[intent],
+            }
+        return report
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Retrieve the answer cache shared by the process, creating it on first use.
+
+    The similarity threshold comes from SHELFMATE_ANSWER_CACHE_THRESHOLD.
+
+    Returns:
+        The shared answer cache.
+    """
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    threshold=float(os.getenv("SHELFMATE_ANSWER_CACHE_THRESHOLD", "0.95")))
+    return _answer_cache
@@ -0,0 +1,203 @@
+# Standard Library Imports
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from chatbot.catalog.resolver import normalize_name
+from chatbot.db.replica import ROOT_DIR
+from chatbot.rag.ingest import PDF_DIR, file_hash
+
+BOOKSTORES_PDF = PDF_DIR / "libraries_per_district.pdf"
+DEFAULT_BOOKSTORES_PATH = ROOT_DIR / "data" / "bookstores.json"
+
+# Names users may write instead of the Portuguese name of a district
+DISTRICT_ALIASES = {
+    "lisbon": "Lisboa",
+    "oporto": "Porto",
+}
+
+HEADING_PATTERN = re.compile(r"^#{2,}\s*(.+?)\s*$")
+ENTRY_PATTERN = re.compile(r"^\d+\.\s*\*\*(.+?)\*\*\s*:?\s*(.*)$")
+
+
+def parse_bookstores(text: str) -> Dict[str, List[Dict[str, str]]]:
+    """Parse the text of the bookstores PDF into a table.
+
+    The PDF has one '#### <district>' heading per district followed by a numbered
+    list of '<n>. **<bookstore>**: <description>' entries, whose descriptions span
+    several lines.
+
+    Args:
+        text: The text of the PDF.
+
+    Returns:
+        The bookstores of each district, in the order of the PDF.
+    """
+    table: Dict[str, List[Dict[str, str]]] = {}
+    district = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        heading = HEADING_PATTERN.match(line)
+        if heading:
+            # The title of the document is a heading with a higher level than the districts
+            district = heading.group(1) if line.startswith("####") else None
+            if district is not None:
+                table[district] = []
+            continue
+
+        if district is None:
+            continue
+        entry = ENTRY_PATTERN.match(line)
+        if entry:
+            table[district].append({"name": entry.group(1).strip(), "description": entry.group(2).strip()})
+        elif table[district]:
+            table[district][-1]["description"] = f"{table[district][-1]['description']} {line}".strip()
+
+    return {district: bookstores for district, bookstores in table.items() if bookstores}
+
+
+def extract_bookstores(pdf_file: Path = BOOKSTORES_PDF, path: Optional[Path] = None) -> Dict[str, List[Dict[str, str]]]:
+    """Extract the bookstores PDF into the local bookstore table.
+
+    Args:
+        pdf_file: The bookstores PDF.
+        path: Where to write the table. Defaults to get_bookstore_table_path().
+
+    Returns:
+        The bookstores of each district.
+    """
+    from langchain_community.document_loaders import PyMuPDFLoader
+
+    path = Path(path or get_bookstore_table_path())
+    pages = PyMuPDFLoader(str(pdf_file)).load()
+    table = parse_bookstores("\n".join(page.page_content for page in pages))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.json")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump({"source": pdf_file.name, "sha256": file_hash(pdf_file),
+                   "extracted_at": time.strftime("%Y-%m-%d %H:%M:%S"), "districts": table},
+                  file, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return table
+
+
+class BookstoreTable:
+    """Bookstores of each district, looked up without retrieval or embeddings."""
+
+    def __init__(self, path: Path):
+        """Load the table.
+
+        Args:
+            path: The file written by extract_bookstores.
+        """
+        self.path = Path(path)
+        with open(self.path, encoding="utf-8") as file:
+            data = json.load(file)
+        self.sha256: str = data["sha256"]
+        self.districts: Dict[str, List[Dict[str, str]]] = data["districts"]
+
+        self.keys = {normalize_name(district): district for district in self.districts}
+        self.keys.update({alias: district for alias, district in DISTRICT_ALIASES.items() if district in self.districts})
+        # Longest names first, so 'Viana do Castelo' is found before any shorter match
+        self.pattern = re.compile(r"\b(" + "|".join(
+            re.escape(key) for key in sorted(self.keys, key=len, reverse=True)) + r")\b")
+
+    def __contains__(self, district: Optional[str]) -> bool:
+        return self.resolve(district) is not None
+
+    def resolve(self, district: Optional[str]) -> Optional[str]:
+        """Find the district of the table matching a district name, ignoring accents and case."""
+        if not district:
+            return None
+        return self.keys.get(normalize_name(district))
+
+    def find_district(self, text: str) -> Optional[str]:
+        """Find the first district of the table mentioned in a text.
+
+        Args:
+            text: The question of the user.
+
+        Returns:
+            The district as written in the table, or None if none is mentioned.
+        """
+        match = self.pattern.search(normalize_name(text)) if self.keys else None
+        return self.keys[match.group(1)] if match else None
+
+    def bookstores(self, district: str) -> List[Dict[str, str]]:
+        """Retrieve the bookstores of a district, or an empty list if it is not in the table."""
+        return self.districts.get(self.resolve(district), [])
+
+    def format_answer(self, district: str) -> str:
+        """Write the answer listing the bookstores of a district.
+
+        Args:
+            district: The district.
+
+        Returns:
+            The numbered list of the bookstores with the first sentence of their description.
+        """
+        district = self.resolve(district)
+        lines = [f"These are the best bookstores in {district}:"]
+        for position, bookstore in enumerate(self.districts[district], start=1):
+            summary = re.split(r"(?<=[.!?])\s", bookstore["description"], maxsplit=1)[0]
+            lines.append(f"{position}. **{bookstore['name']}**: {summary}")
+        return "\n".join(lines)
+
+
+def get_bookstore_table_path() -> Path:
+    """Retrieve the location of the bookstore table.
+
+    Returns:
+        The path set in SHELFMATE_BOOKSTORE_TABLE, or data/bookstores.json by default.
+    """
+    return Path(os.getenv("SHELFMATE_BOOKSTORE_TABLE", DEFAULT_BOOKSTORES_PATH))
+
+
+_table: Optional[BookstoreTable] = None
+_table_lock = threading.Lock()
+
+
+def get_bookstore_table() -> Optional[BookstoreTable]:
+    """Retrieve the bookstore table shared by the process.
+
+    On first use the table is extracted again if the bookstores PDF changed since
+    the last extraction.
+
+    Returns:
+        The bookstore table, or None if it is missing and could not be extracted.
+    """
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                path = get_bookstore_table_path()
+                try:
+                    if path.exists():
+                        _table = BookstoreTable(path)
+                    if BOOKSTORES_PDF.exists() and (_table is None or _table.sha256 != file_hash(BOOKSTORES_PDF)):
+                        extract_bookstores(BOOKSTORES_PDF, path)
+                        _table = BookstoreTable(path)
+                except Exception as e:
+                    print(f"Bookstore table unavailable: {e}")
+    return _table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the bookstores per district PDF into a local table.")
+    parser.add_argument("--pdf", type=Path, default=BOOKSTORES_PDF, help="The bookstores PDF.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the table.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    table = extract_bookstores(args.pdf, args.output)
+    print(f"Extracted {sum(len(bookstores) for bookstores in table.values())} bookstores "
+          f"in {len(table)} districts in {time.perf_counter() - start_time:.2f}s")
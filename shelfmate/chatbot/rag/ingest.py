@@ -0,0 +1,299 @@
+# Standard Library Imports
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Third-Party Libraries
+import numpy as np
+
+# LangChain Libraries
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from chatbot.db.replica import ROOT_DIR
+from chatbot.vectors.embeddings import get_embedding_cache
+
+PDF_DIR = ROOT_DIR / "data" / "pdfs"
+DEFAULT_DOCUMENT_INDEX_PATH = ROOT_DIR / "data" / "rag_index"
+
+
+def file_hash(path: Path) -> str:
+    """Compute the SHA-256 of a file, used to detect PDFs that changed since the last ingest."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into the lowercase words used by the keyword index."""
+    return re.findall(r"\w+", text.casefold())
+
+
+def load_pdf_chunks(pdf_file: Path) -> List[Document]:
+    """Parse a PDF and split it in overlapping chunks.
+
+    Uses the same loader and splitter settings as the notebook that filled the
+    Pinecone 'documents' index.
+
+    Args:
+        pdf_file: The path of the PDF.
+
+    Returns:
+        The chunks, with the source file, page and start index in their metadata.
+    """
+    from langchain_community.document_loaders import PyMuPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    pages = PyMuPDFLoader(str(pdf_file)).load()
+    text_splitter = RecursiveCharacterTextSplitter(
+        separators=["\n"],
+        chunk_size=1000,
+        chunk_overlap=250,
+        add_start_index=True)
+    chunks = text_splitter.split_documents(pages)
+    for chunk in chunks:
+        chunk.metadata = {
+            "source": pdf_file.name,
+            "page": chunk.metadata.get("page"),
+            "start_index": chunk.metadata.get("start_index"),
+        }
+    return chunks
+
+
+def ingest_documents(path: Optional[Path] = None, pdf_dir: Path = PDF_DIR) -> Dict[str, str]:
+    """Build or update the local document index from the PDFs.
+
+    Only the PDFs whose hash changed since the last ingest are parsed and embedded
+    again. The chunks of unchanged PDFs are reused and the ones of deleted PDFs are
+    dropped. The index is written to a temporary folder and moved into place.
+
+    Args:
+        path: Where to write the index. Defaults to get_document_index_path().
+        pdf_dir: The folder with the PDFs.
+
+    Returns:
+        The status of each PDF: 'unchanged', 'added', 'updated' or 'removed'.
+    """
+    path = Path(path or get_document_index_path())
+    previous = DocumentIndex(path) if (path / "manifest.json").exists() else None
+
+    chunks: List[Dict[str, Any]] = []
+    vectors: List[np.ndarray] = []
+    files: Dict[str, str] = {}
+    status: Dict[str, str] = {}
+
+    for pdf_file in sorted(Path(pdf_dir).glob("*.pdf")):
+        digest = file_hash(pdf_file)
+        files[pdf_file.name] = digest
+
+        if previous is not None and previous.files.get(pdf_file.name) == digest:
+            rows = [row for row, chunk in enumerate(previous.chunks) if chunk["source"] == pdf_file.name]
+            chunks.extend(previous.chunks[row] for row in rows)
+            vectors.extend(previous.vectors[row] for row in rows)
+            status[pdf_file.name] = "unchanged"
+            continue
+
+        documents = load_pdf_chunks(pdf_file)
+        embeddings = get_embedding_cache().embed([document.page_content for document in documents])
+        chunks.extend({"text": document.page_content, **document.metadata} for document in documents)
+        vectors.extend(np.asarray(embedding, dtype=np.float32) for embedding in embeddings)
+        status[pdf_file.name] = "updated" if previous is not None and pdf_file.name in previous.files else "added"
+
+    if previous is not None:
+        for name in previous.files:
+            if name not in files:
+                status[name] = "removed"
+
+    if previous is not None and all(value == "unchanged" for value in status.values()):
+        return status
+
+    matrix = np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    if len(matrix):
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+
+    # Keyword index: term frequencies of each chunk, scored with BM25 at query time
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    lengths = []
+    for row, chunk in enumerate(chunks):
+        terms = Counter(tokenize(chunk["text"]))
+        lengths.append(sum(terms.values()))
+        for term, count in terms.items():
+            postings.setdefault(term, []).append((row, count))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    np.save(tmp_path / "vectors.npy", matrix.astype(np.float32))
+    with open(tmp_path / "keywords.json", "w", encoding="utf-8") as file:
+        json.dump({"lengths": lengths, "postings": postings}, file)
+    with open(tmp_path / "manifest.json", "w", encoding="utf-8") as file:
+        json.dump({"ingested_at": time.strftime("%Y-%m-%d %H:%M:%S"), "files": files, "chunks": chunks}, file)
+
+    if path.exists():
+        old_path = path.with_name(path.name + ".old")
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        for file in old_path.iterdir():
+            file.unlink()
+        old_path.rmdir()
+    else:
+        os.replace(tmp_path, path)
+
+    return status
+
+
+class DocumentIndex:
+    """Chunks of the PDFs with their vectors and keyword postings, searched in process."""
+
+    def __init__(self, path: Path):
+        """Load the index.
+
+        Args:
+            path: The folder written by ingest_documents.
+        """
+        self.path = Path(path)
+        with open(self.path / "manifest.json", encoding="utf-8") as file:
+            manifest = json.load(file)
+        self.files: Dict[str, str] = manifest["files"]
+        self.chunks: List[Dict[str, Any]] = manifest["chunks"]
+        self.vectors = np.load(self.path / "vectors.npy")
+
+        with open(self.path / "keywords.json", encoding="utf-8") as file:
+            keywords = json.load(file)
+        self.lengths = np.asarray(keywords["lengths"], dtype=np.float32)
+        self.postings: Dict[str, List[List[int]]] = keywords["postings"]
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def version(self) -> str:
+        """Identifier of the ingested documents, which changes when any PDF changes."""
+        return hashlib.sha256(json.dumps(self.files, sort_keys=True).encode()).hexdigest()[:16]
+
+    def vector_scores(self, vector: List[float]) -> np.ndarray:
+        """Cosine similarity of every chunk to a query vector."""
+        query = np.asarray(vector, dtype=np.float32)
+        return self.vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+    def keyword_scores(self, text: str, k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+        """BM25 score of every chunk for the words of a query."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+            for row, count in postings:
+                norm = k1 * (1 - b + b * self.lengths[row] / self.average_length)
+                scores[row] += idf * count * (k1 + 1) / (count + norm)
+        return scores
+
+    def search(self, query: str, k: int = 2, score_threshold: float = 0.5) -> List[Tuple[Document, float]]:
+        """Find the chunks that best answer a question.
+
+        The chunks are ranked by reciprocal rank fusion of the vector and keyword
+        rankings, and only chunks whose cosine similarity reaches the threshold are kept.
+
+        Args:
+            query: The question.
+            k: Number of chunks to return.
+            score_threshold: Minimum cosine similarity of a chunk.
+
+        Returns:
+            The chunks with their cosine similarity, best first.
+        """
+        if not len(self.chunks):
+            return []
+
+        vector_scores = self.vector_scores(get_embedding_cache().embed_one(query))
+        keyword_scores = self.keyword_scores(query)
+
+        fused = np.zeros(len(self.chunks), dtype=np.float32)
+        for scores in (vector_scores, keyword_scores):
+            ranks = np.empty(len(scores), dtype=np.int64)
+            ranks[np.argsort(-scores, kind="stable")] = np.arange(len(scores))
+            fused += 1 / (60 + ranks)
+
+        results = []
+        for row in np.argsort(-fused, kind="stable"):
+            if vector_scores[row] < score_threshold:
+                continue
+            chunk = self.chunks[row]
+            metadata = {key: value for key, value in chunk.items() if key != "text"}
+            results.append((Document(page_content=chunk["text"], metadata=metadata), float(vector_scores[row])))
+            if len(results) == k:
+                break
+        return results
+
+
+class LocalDocumentRetriever(BaseRetriever):
+    """LangChain retriever over the local document index."""
+
+    index: Any
+    k: int = 2
+    score_threshold: float = 0.5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [document for document, _ in self.index.search(query, self.k, self.score_threshold)]
+
+
+def get_document_index_path() -> Path:
+    """Retrieve the location of the local document index.
+
+    Returns:
+        The path set in SHELFMATE_DOCUMENT_INDEX, or data/rag_index by default.
+    """
+    return Path(os.getenv("SHELFMATE_DOCUMENT_INDEX", DEFAULT_DOCUMENT_INDEX_PATH))
+
+
+_document_index: Optional[DocumentIndex] = None
+_document_index_lock = threading.Lock()
+
+
+def get_document_index() -> Optional[DocumentIndex]:
+    """Retrieve the document index shared by the process.
+
+    On first use the PDFs are checked against the hashes of the index and the ones
+    that changed are ingested again before the index is loaded.
+
+    Returns:
+        The document index, or None if there are no PDFs and no index, or the
+        ingest failed.
+    """
+    global _document_index
+    if _document_index is None:
+        with _document_index_lock:
+            if _document_index is None:
+                path = get_document_index_path()
+                try:
+                    if any(PDF_DIR.glob("*.pdf")):
+                        ingest_documents(path)
+                    if (path / "manifest.json").exists():
+                        _document_index = DocumentIndex(path)
+                except Exception as e:
+                    print(f"Local document index unavailable: {e}")
+    return _document_index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest the PDFs of data/pdfs into the local document index.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the index.")
+    parser.add_argument("--pdf-dir", type=Path, default=PDF_DIR, help="Folder with the PDFs.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    for name, file_status in ingest_documents(args.output, args.pdf_dir).items():
+        print(f"{name}: {file_status}")
+    print(f"Ingest finished in {time.perf_counter() - start_time:.2f}s")
@@ -1,49 +1,79 @@
 # Standard Library Imports
+import asyncio
 import os
-from typing import List
+import time
+from operator import itemgetter
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 # Third-Party Libraries
 from pinecone import Index, Pinecone
 
 # LangChain Libraries
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.chat_models import ChatOpenAI
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
 
 from chatbot.chains.base import PromptTemplate, generate_prompt_templates
-import sqlitecloud
+from chatbot.profile import user_profiles
+from chatbot.rag.answer_cache import CACHEABLE_INTENTS, get_answer_cache
+from chatbot.rag.bookstores import get_bookstore_table
+from chatbot.rag.ingest import LocalDocumentRetriever, get_document_index
+from chatbot.vectors.embeddings import CachedEmbeddings
+
+BOOKSTORE_INTENT = "recommend_bookstores_per_district"
+
+
+def get_document_retriever() -> Tuple[Any, str]:
+    """Build the retriever of the context of the answers.
+
+    SHELFMATE_RAG_BACKEND can be 'local', 'pinecone' or 'auto' (the default), which
+    searches the local document index whenever it could be loaded.
+
+    Returns:
+        A LangChain retriever that returns up to 2 chunks with a similarity of at least 0.5,
+        and the version of the documents it searches.
+    """
+    if os.getenv("SHELFMATE_RAG_BACKEND", "auto").lower() != "pinecone":
+        document_index = get_document_index()
+        if document_index is not None:
+            return LocalDocumentRetriever(index=document_index, k=2, score_threshold=0.5), document_index.version
+
+    pc = Pinecone()
+    index: Index = pc.Index("documents")
+    vector_store = PineconeVectorStore(index=index, embedding=CachedEmbeddings())
+    retriever = vector_store.as_retriever(
+        search_type="similarity_score_threshold",
+        search_kwargs={"k": 2, "score_threshold": 0.5})
+    return retriever, "pinecone:documents"
+
 
 class RagChain:
+    """Answers questions about ShelfMate, its features and the bookstores of a district.
 
-    def __init__(self, username):
+    The chain is built once and shared by every session. The district of the user is
+    a prompt variable read from the profile cache on each call, so a turn only pays
+    for the retrieval and the generation. Answers to company and feature questions
+    do not depend on the user and go through the semantic answer cache, and bookstore
+    questions are answered from the bookstore table without retrieval.
+    """
+
+    def __init__(self):
         
         def format_docs(documents):
             return "\n\n".join(doc.page_content for doc in documents)
         
-        pc = Pinecone()
-        index: Index = pc.Index("documents")
-        vector_store = PineconeVectorStore(index=index, embedding=OpenAIEmbeddings(model="text-embedding-ada-002"))
-        retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={"k": 2, "score_threshold": 0.5})
+        retriever, self.corpus_version = get_document_retriever()
+        self.answer_cache = get_answer_cache()
         
         self.llm = ChatOpenAI(model='gpt-4o-mini', temperature=0.2)
 
-        con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-        cursor = con.cursor()
-        user_district = cursor.execute(f"SELECT district FROM users WHERE username = ?", (username,)).fetchone()[0]
-
-        self.template = PromptTemplate(system_template=f"""You are the Shelfmate chatbot, an online platform that focus on book recommendations. 
+        self.template = PromptTemplate(system_template="""You are the Shelfmate chatbot, an online platform that focus on book recommendations. 
                 Your task is to clarify the features of the book recommendation system and other Shelfmate features, answer questions \
                 about the ShelfMate Company, or provide the best bookstores for a specific district.
                 Use the following pieces of context to answer the user question at the end.
                 Use three sentences maximum and keep the answer as concise as possible.                            
                 If the user asks for bookstores in their district or in the district they live in, use this district: {user_district}.
-                Do not greet the user in the beggining of the message as this is already in the middle of the conversation."""
-        +
-        """
+                Do not greet the user in the beggining of the message as this is already in the middle of the conversation.
         
         Use this context to answer the user question:
         {context}
@@ -53,14 +83,126 @@ class RagChain:
 
         self.custom_rag_prompt = generate_prompt_templates(self.template, memory=False)
 
+        # Bookstore questions are answered from the table extracted from the bookstores PDF,
+        # written as is or, with SHELFMATE_BOOKSTORE_PHRASING=llm, phrased by the language model
+        self.bookstores = get_bookstore_table()
+        self.bookstore_phrasing = os.getenv("SHELFMATE_BOOKSTORE_PHRASING", "table").lower() == "llm"
+        self.bookstore_template = PromptTemplate(system_template="""You are the Shelfmate chatbot, an online platform that focus on book recommendations. 
+                Your task is to recommend the best bookstores of the district {district} to the user, using only the list below.
+                Keep the name of every bookstore and describe each one in a short sentence.
+                Do not greet the user in the beggining of the message as this is already in the middle of the conversation.
+
+        Bookstores:
+        {bookstores}
+        """, human_template="Question: {question}")
+        self.bookstore_chain = (
+            generate_prompt_templates(self.bookstore_template, memory=False)
+            | self.llm
+            | StrOutputParser()
+        )
+
         self.rag_chain = (
-            {"context": retriever | format_docs, 
-            "question": RunnablePassthrough()
+            {"context": itemgetter("question") | retriever | format_docs, 
+            "question": itemgetter("question"),
+            "user_district": itemgetter("user_district")
             }
             | self.custom_rag_prompt
             | self.llm
             | StrOutputParser()
         )
 
-    def run_chain(self, question) -> str:
-        return self.rag_chain.invoke(question)
\ No newline at end of file
+    @staticmethod
+    def get_inputs(question: str, username: str) -> Dict[str, Any]:
+        """Build the inputs of the chain for a question of a user.
+
+        Args:
+            question: The question of the user.
+            username: Identifier for the user, whose district comes from the profile cache.
+
+        Returns:
+            The question and the district of the user.
+        """
+        return {"question": question, "user_district": user_profiles.get(username)["district"]}
+
+    def get_bookstore_inputs(self, question: str, username: str) -> Optional[Dict[str, Any]]:
+        """Look up the bookstores of the district of a bookstore question.
+
+        The district named in the question is used first, then the district of the user.
+
+        Args:
+            question: The question of the user.
+            username: Identifier for the user, whose district comes from the profile cache.
+
+        Returns:
+            The question, the district and the formatted list of its bookstores, or None
+            if there is no bookstore table or the district is not in it.
+        """
+        if self.bookstores is None:
+            return None
+        district = self.bookstores.find_district(question) or self.bookstores.resolve(
+            user_profiles.get(username)["district"])
+        if district is None:
+            return None
+        return {"question": question, "district": district, "bookstores": self.bookstores.format_answer(district)}
+
+    def run_chain(self, question, username, intent: Optional[str] = None) -> str:
+        if intent == BOOKSTORE_INTENT:
+            inputs = self.get_bookstore_inputs(question, username)
+            if inputs is not None:
+                return self.bookstore_chain.invoke(inputs) if self.bookstore_phrasing else inputs["bookstores"]
+
+        if intent not in CACHEABLE_INTENTS:
+            return self.rag_chain.invoke(self.get_inputs(question, username))
+
+        answer, vector = self.answer_cache.lookup(intent, self.corpus_version, question)
+        if answer is None:
+            start_time = time.perf_counter()
+            answer = self.rag_chain.invoke(self.get_inputs(question, username))
+            self.answer_cache.store(intent, self.corpus_version, vector, answer, time.perf_counter() - start_time)
+        return answer
+
+    async def arun_chain(self, question, username, intent: Optional[str] = None) -> str:
+        if intent == BOOKSTORE_INTENT:
+            inputs = await asyncio.to_thread(self.get_bookstore_inputs, question, username)
+            if inputs is not None:
+                return await self.bookstore_chain.ainvoke(inputs) if self.bookstore_phrasing else inputs["bookstores"]
+
+        if intent in CACHEABLE_INTENTS:
+            # The question may need an embedding request, which is blocking
+            answer, vector = await asyncio.to_thread(self.answer_cache.lookup, intent, self.corpus_version, question)
+            if answer is not None:
+                return answer
+
+        # The profile may need a database query, which is blocking
+        inputs = await asyncio.to_thread(self.get_inputs, question, username)
+        start_time = time.perf_counter()
+        answer = await self.rag_chain.ainvoke(inputs)
+        if intent in CACHEABLE_INTENTS:
+            self.answer_cache.store(intent, self.corpus_version, vector, answer, time.perf_counter() - start_time)
+        return answer
+
+    def stream_chain(self, question, username, intent: Optional[str] = None) -> Iterator[str]:
+        if intent == BOOKSTORE_INTENT:
+            inputs = self.get_bookstore_inputs(question, username)
+            if inputs is not None:
+                if self.bookstore_phrasing:
+                    yield from self.bookstore_chain.stream(inputs)
+                else:
+                    yield inputs["bookstores"]
+                return
+
+        if intent not in CACHEABLE_INTENTS:
+            yield from self.rag_chain.stream(self.get_inputs(question, username))
+            return
+
+        answer, vector = self.answer_cache.lookup(intent, self.corpus_version, question)
+        if answer is not None:
+            yield answer
+            return
+
+        start_time = time.perf_counter()
+        pieces = []
+        for piece in self.rag_chain.stream(self.get_inputs(question, username)):
+            pieces.append(piece)
+            yield piece
+        self.answer_cache.store(intent, self.corpus_version, vector, "".join(pieces), time.perf_counter() - start_time)
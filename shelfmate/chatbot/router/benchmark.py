@@ -0,0 +1,221 @@
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from chatbot.router.classifier import IntentClassifier
+
+BASE_DIR = os.path.dirname(__file__)
+DEFAULT_DATASET = os.path.join(BASE_DIR, "synthetic_intentions_corrected.json")
+DEFAULT_LAYER = os.path.join(BASE_DIR, "layer_corrected.json")
+# The data folder at the root of the repository, like the other generated files
+DEFAULT_OUTPUT = os.path.normpath(os.path.join(BASE_DIR, "..", "..", "..", "data", "router_benchmark.json"))
+
+# Label of the messages that should not match any route
+NO_INTENT = "None"
+
+
+def load_labelled_messages(path: str = DEFAULT_DATASET) -> Tuple[List[str], List[str]]:
+    """Load the labelled synthetic messages.
+
+    Args:
+        path: JSON file with a list of {"Intention", "Message"} items.
+
+    Returns:
+        The messages and their intents, 'None' for the messages without intent.
+    """
+    with open(path, encoding="utf-8") as file:
+        items = json.load(file)
+    return [item["Message"] for item in items], [item["Intention"] or NO_INTENT for item in items]
+
+
+def load_route_utterances(layer_path: str = DEFAULT_LAYER) -> Set[str]:
+    """Load the utterances of the routes of a layer.
+
+    Most of the labelled messages are also route utterances, which the router matches
+    with a score of about 1. They say nothing about how the router handles new messages.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+
+    Returns:
+        The utterances of all the routes.
+    """
+    with open(layer_path, encoding="utf-8") as file:
+        layer = json.load(file)
+    return {utterance for route in layer["routes"] for utterance in route["utterances"]}
+
+
+def unseen_messages(messages: Sequence[str], labels: Sequence[str],
+                    utterances: Set[str]) -> Tuple[List[str], List[str]]:
+    """Keep the labelled messages that are not route utterances.
+
+    Args:
+        messages: The labelled messages.
+        labels: Their intents.
+        utterances: The utterances of the routes.
+
+    Returns:
+        The messages the router was not built from, and their intents.
+    """
+    pairs = [(message, label) for message, label in zip(messages, labels) if message not in utterances]
+    return [message for message, _ in pairs], [label for _, label in pairs]
+
+
+def classification_report(labels: Sequence[str], predictions: Sequence[str]) -> Dict[str, Any]:
+    """Compute the quality metrics of a set of predictions.
+
+    A prediction of 'None' means the message fell through to the LLM fallback.
+
+    Args:
+        labels: The expected intents.
+        predictions: The predicted intents.
+
+    Returns:
+        A dictionary with the accuracy, the fallback rates, the precision and recall of
+        each intent and the most frequent confusion pairs.
+    """
+    pairs = Counter(zip(labels, predictions))
+    label_counts = Counter(labels)
+    prediction_counts = Counter(predictions)
+
+    per_intent = {}
+    for intent in sorted(set(labels) | set(predictions)):
+        correct = pairs[(intent, intent)]
+        per_intent[intent] = {
+            "support": label_counts[intent],
+            "precision": correct / prediction_counts[intent] if prediction_counts[intent] else 0.0,
+            "recall": correct / label_counts[intent] if label_counts[intent] else 0.0,
+        }
+
+    with_intent = [prediction for label, prediction in zip(labels, predictions) if label != NO_INTENT]
+    return {
+        "messages": len(labels),
+        "accuracy": sum(pairs[(intent, intent)] for intent in label_counts) / len(labels) if labels else 0.0,
+        # Share of all the messages, and of the messages that have an intent, sent to the LLM fallback
+        "fallback_rate": prediction_counts[NO_INTENT] / len(labels) if labels else 0.0,
+        "missed_fallback_rate": with_intent.count(NO_INTENT) / len(with_intent) if with_intent else 0.0,
+        "per_intent": per_intent,
+        "confusions": [
+            {"label": label, "prediction": prediction, "count": count}
+            for (label, prediction), count in pairs.most_common() if label != prediction
+        ],
+    }
+
+
+def latency_report(classifier: IntentClassifier, messages: Sequence[str], batch_size: int = 64) -> Dict[str, Any]:
+    """Measure the latency of single queries and the throughput of batches.
+
+    Args:
+        classifier: The classifier.
+        messages: The queries.
+        batch_size: Number of queries classified per batch for the throughput.
+
+    Returns:
+        A dictionary with the p50, p95 and p99 latency of a single query in
+        milliseconds and the number of queries per second in batches.
+    """
+    timings = []
+    for message in messages:
+        start_time = time.perf_counter()
+        classifier.classify(message)
+        timings.append((time.perf_counter() - start_time) * 1000)
+
+    start_time = time.perf_counter()
+    for start in range(0, len(messages), batch_size):
+        classifier.classify_batch(messages[start:start + batch_size])
+    batch_seconds = time.perf_counter() - start_time
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) if timings else (0.0, 0.0, 0.0)
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "single_qps": len(timings) / (sum(timings) / 1000) if timings else 0.0,
+        "batch_qps": len(messages) / batch_seconds if batch_seconds else 0.0,
+        "batch_size": batch_size,
+    }
+
+
+def run_benchmark(classifier: IntentClassifier, messages: Sequence[str], labels: Sequence[str],
+                  batch_size: int = 64, utterances: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """Classify the labelled messages and measure the quality and the latency.
+
+    The messages are encoded in batches for the quality metrics.
+
+    Args:
+        classifier: The classifier.
+        messages: The labelled messages.
+        labels: Their intents.
+        batch_size: Number of messages encoded at a time.
+        utterances: The utterances of the routes. When given, the quality is also
+            reported on the messages that are not route utterances.
+
+    Returns:
+        The classification reports, on all the messages and on the unseen ones, and
+        the latency report.
+    """
+    predictions = []
+    for start in range(0, len(messages), batch_size):
+        results = classifier.classify_batch(messages[start:start + batch_size])
+        predictions.extend(result.intent or NO_INTENT for result in results)
+
+    results = {
+        "aggregation": classifier.aggregation,
+        "classification": classification_report(labels, predictions),
+        "latency": latency_report(classifier, messages, batch_size),
+    }
+    if utterances is not None:
+        unseen = [(label, prediction) for message, label, prediction in zip(messages, labels, predictions)
+                  if message not in utterances]
+        results["unseen_classification"] = classification_report(
+            [label for label, _ in unseen], [prediction for _, prediction in unseen])
+    return results
+
+
+def print_report(results: Dict[str, Any], top_confusions: int = 10) -> None:
+    """Print the benchmark results in a readable form."""
+    latency = results["latency"]
+    for section, title in (("classification", "All messages"),
+                           ("unseen_classification", "Messages that are not route utterances")):
+        if section not in results:
+            continue
+        classification = results[section]
+        print(f"{title}: {classification['messages']}  accuracy: {classification['accuracy']:.3f}  "
+              f"fallback rate: {classification['fallback_rate']:.3f}  "
+              f"missed fallback rate: {classification['missed_fallback_rate']:.3f}")
+        print(f"{'intent':<40}{'support':>8}{'precision':>11}{'recall':>8}")
+        for intent, metrics in classification["per_intent"].items():
+            print(f"{intent:<40}{metrics['support']:>8}{metrics['precision']:>11.3f}{metrics['recall']:>8.3f}")
+        print("Most frequent confusions:")
+        for confusion in classification["confusions"][:top_confusions]:
+            print(f"  {confusion['label']} -> {confusion['prediction']}: {confusion['count']}")
+    print(f"Latency p50 {latency['p50_ms']:.2f}ms  p95 {latency['p95_ms']:.2f}ms  p99 {latency['p99_ms']:.2f}ms  "
+          f"single {latency['single_qps']:.1f} q/s  batch {latency['batch_qps']:.1f} q/s")
+
+
+if __name__ == "__main__":
+    from chatbot.router.loader import load_intention_classifier
+
+    parser = argparse.ArgumentParser(description="Benchmark the intent router on the labelled synthetic messages.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="JSON file with the labelled messages.")
+    parser.add_argument("--layer", default=DEFAULT_LAYER, help="The route layer JSON file, to find the unseen messages.")
+    parser.add_argument("--aggregation", default="max", choices=["max", "topk_mean"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Where to write the results as JSON.")
+    args = parser.parse_args()
+
+    messages, labels = load_labelled_messages(args.dataset)
+    classifier = IntentClassifier.from_route_layer(load_intention_classifier(), aggregation=args.aggregation)
+    results = run_benchmark(classifier, messages, labels, args.batch_size, load_route_utterances(args.layer))
+    print_report(results)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=4)
+
+    print(f"Results written to {args.output}")
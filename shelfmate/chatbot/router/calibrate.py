@@ -0,0 +1,214 @@
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from chatbot.router.benchmark import (DEFAULT_DATASET, NO_INTENT, classification_report, load_labelled_messages,
+                                      load_route_utterances, unseen_messages)
+from chatbot.router.classifier import IntentClassifier
+
+# Thresholds tried for each route
+DEFAULT_GRID = np.round(np.arange(0.30, 0.951, 0.01), 2)
+
+
+def predict(scores: np.ndarray, thresholds: np.ndarray, routes: Sequence[str]) -> List[str]:
+    """Pick the intent of each message like IntentClassifier does.
+
+    Args:
+        scores: The score of each route (columns) for each message (rows).
+        thresholds: The threshold of each route.
+        routes: The names of the routes.
+
+    Returns:
+        The best route that passes its threshold for each message, 'None' if no route does.
+    """
+    passing = np.where(scores > thresholds, scores, -np.inf)
+    best = passing.argmax(axis=1)
+    return [routes[route] if np.isfinite(passing[row, route]) else NO_INTENT for row, route in enumerate(best)]
+
+
+def calibrate_thresholds(scores: np.ndarray, labels: Sequence[str], routes: Sequence[str],
+                         target_precision: float = 0.9, grid: Sequence[float] = DEFAULT_GRID,
+                         rounds: int = 5) -> np.ndarray:
+    """Search the lowest threshold of each route that keeps its precision on target.
+
+    Lower thresholds send fewer messages to the LLM fallback, but let through more
+    messages of other intents. Routes are tuned one at a time, the others fixed, and
+    the passes are repeated until no threshold changes.
+
+    Args:
+        scores: The score of each route (columns) for each labelled message (rows).
+        labels: The intent of each message, 'None' for the messages without intent.
+        routes: The names of the routes.
+        target_precision: Minimum precision of every route.
+        grid: The thresholds tried, in increasing order.
+        rounds: Maximum number of passes over the routes.
+
+    Returns:
+        The threshold of each route.
+    """
+    labels = np.asarray(labels)
+    thresholds = np.full(len(routes), max(grid), dtype=np.float32)
+
+    for _ in range(rounds):
+        changed = False
+        for route, name in enumerate(routes):
+            previous = thresholds[route]
+            best = max(grid)
+            for threshold in grid:
+                thresholds[route] = threshold
+                predicted = np.asarray(predict(scores, thresholds, routes)) == name
+                # A route that matches nothing has no false positives
+                if not predicted.any() or np.mean(labels[predicted] == name) >= target_precision:
+                    best = threshold
+                    break
+            thresholds[route] = best
+            changed |= not np.isclose(previous, best)
+        if not changed:
+            break
+
+    return thresholds
+
+
+def stratified_split(labels: Sequence[str], holdout: float, seed: int = 42) -> Tuple[np.ndarray, np.ndarray]:
+    """Split the messages in a calibration and a held-out part with the same intent mix.
+
+    Args:
+        labels: The intent of each message.
+        holdout: Share of the messages of each intent kept out of the calibration.
+        seed: Seed of the split.
+
+    Returns:
+        The positions of the calibration messages and of the held-out messages.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    calibration, held_out = [], []
+    for label in sorted(set(labels.tolist())):
+        positions = rng.permutation(np.flatnonzero(labels == label))
+        cut = int(round(len(positions) * holdout))
+        held_out.extend(positions[:cut])
+        calibration.extend(positions[cut:])
+    return np.sort(calibration), np.sort(held_out)
+
+
+def operating_point(labels: Sequence[str], predictions: Sequence[str]) -> Dict[str, Any]:
+    """Summarize the accuracy, fallback rate and per-intent precision and recall of predictions."""
+    report = classification_report([str(label) for label in labels], list(predictions))
+    return {key: report[key] for key in ("messages", "accuracy", "fallback_rate", "missed_fallback_rate", "per_intent")}
+
+
+def write_thresholds(layer_path: str, thresholds: Dict[str, float], calibration: Dict[str, Any]) -> None:
+    """Store the tuned thresholds and their operating point in the layer config.
+
+    The thresholds go to the score_threshold field of each route, which RouteLayer and
+    IntentClassifier read when the layer is loaded.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+        thresholds: The threshold of each route.
+        calibration: The settings and the measured operating point of the calibration.
+    """
+    with open(layer_path, encoding="utf-8") as file:
+        layer = json.load(file)
+    for route in layer["routes"]:
+        if route["name"] in thresholds:
+            route["score_threshold"] = thresholds[route["name"]]
+    layer["calibration"] = calibration
+    with open(layer_path, "w", encoding="utf-8") as file:
+        json.dump(layer, file, indent=4, ensure_ascii=False)
+
+
+def run_calibration(classifier: IntentClassifier, messages: Sequence[str], labels: Sequence[str],
+                    target_precision: float = 0.9, holdout: float = 0.25, batch_size: int = 64,
+                    utterances: Optional[Set[str]] = None) -> Tuple[Dict[str, float], Dict[str, Any]]:
+    """Encode the labelled messages once and tune the route thresholds.
+
+    Args:
+        classifier: The classifier of the router, with 'max' aggregation.
+        messages: The labelled messages.
+        labels: Their intents.
+        target_precision: Minimum precision of every route.
+        holdout: Share of the messages kept to measure the operating point.
+        batch_size: Number of messages encoded at a time.
+        utterances: The utterances of the routes. The messages among them score about 1
+            against their own route and would pull the thresholds down, so they are
+            left out of the calibration and of the operating points.
+
+    Returns:
+        The threshold of each route, and the calibration report.
+    """
+    excluded = 0
+    if utterances is not None:
+        total = len(messages)
+        messages, labels = unseen_messages(messages, labels, utterances)
+        excluded = total - len(messages)
+
+    vectors = np.concatenate([
+        np.asarray(classifier.encoder(list(messages[start:start + batch_size])))
+        for start in range(0, len(messages), batch_size)
+    ])
+    scores = classifier.route_scores(vectors)
+    labels = np.asarray(labels)
+
+    calibration_rows, held_out_rows = stratified_split(labels, holdout) if holdout > 0 else (
+        np.arange(len(labels)), np.empty(0, dtype=np.int64))
+    thresholds = calibrate_thresholds(scores[calibration_rows], labels[calibration_rows], classifier.routes,
+                                      target_precision)
+
+    report: Dict[str, Any] = {
+        "target_precision": target_precision,
+        "aggregation": classifier.aggregation,
+        "calibrated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "messages": len(labels),
+        "excluded_route_utterances": excluded,
+        "calibration": operating_point(labels[calibration_rows],
+                                       predict(scores[calibration_rows], thresholds, classifier.routes)),
+    }
+    if len(held_out_rows):
+        # The same held-out messages with the previous thresholds, so the two are comparable
+        report["before"] = operating_point(labels[held_out_rows],
+                                           predict(scores[held_out_rows], classifier.thresholds, classifier.routes))
+        report["holdout"] = operating_point(labels[held_out_rows],
+                                            predict(scores[held_out_rows], thresholds, classifier.routes))
+
+    return {route: round(float(threshold), 4) for route, threshold in zip(classifier.routes, thresholds)}, report
+
+
+def print_operating_point(name: str, point: Optional[Dict[str, Any]]) -> None:
+    """Print the accuracy and fallback rate of an operating point."""
+    if point is None:
+        return
+    print(f"{name:<12} messages {point['messages']:>4}  accuracy {point['accuracy']:.3f}  "
+          f"fallback rate {point['fallback_rate']:.3f}  missed fallback rate {point['missed_fallback_rate']:.3f}")
+
+
+if __name__ == "__main__":
+    from chatbot.router.loader import FILE_PATH, load_intention_classifier
+
+    parser = argparse.ArgumentParser(description="Tune the score threshold of each route on the labelled messages.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="JSON file with the labelled messages.")
+    parser.add_argument("--layer", default=FILE_PATH, help="The route layer JSON file to update.")
+    parser.add_argument("--target-precision", type=float, default=0.9, help="Minimum precision of every route.")
+    parser.add_argument("--holdout", type=float, default=0.25, help="Share of messages kept to measure the result.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the thresholds without writing them.")
+    args = parser.parse_args()
+
+    messages, labels = load_labelled_messages(args.dataset)
+    classifier = IntentClassifier.from_route_layer(load_intention_classifier())
+    thresholds, report = run_calibration(classifier, messages, labels, args.target_precision, args.holdout,
+                                         utterances=load_route_utterances(args.layer))
+    print(f"Calibrated on {report['messages']} messages, "
+          f"{report['excluded_route_utterances']} route utterances left out")
+
+    for route, threshold in thresholds.items():
+        print(f"{route:<40}{threshold:.2f}")
+    print_operating_point("calibration", report["calibration"])
+    print_operating_point("before", report.get("before"))
+    print_operating_point("holdout", report.get("holdout"))
+
+    if not args.dry_run:
+        write_thresholds(args.layer, thresholds, report)
+        print(f"Thresholds written to {args.layer}")
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from semantic_router import RouteLayer
+
+
+class IntentScores:
+    """Result of the classification of one query.
+
+    Attributes:
+        scores: The aggregated score of every route.
+        ranked: The routes that pass their threshold with their score, best first.
+    """
+
+    def __init__(self, scores: Dict[str, float], ranked: List[Tuple[str, float]]):
+        self.scores = scores
+        self.ranked = ranked
+
+    @property
+    def intent(self) -> Optional[str]:
+        """The best route that passes its threshold, or None."""
+        return self.ranked[0][0] if self.ranked else None
+
+    @property
+    def score(self) -> float:
+        """The score of the best route that passes its threshold, or 0."""
+        return self.ranked[0][1] if self.ranked else 0.0
+
+    @property
+    def margin(self) -> float:
+        """How much the best route beats the runner-up, over all the routes.
+
+        A small margin means the query is ambiguous between two intents.
+        """
+        best = sorted(self.scores.values(), reverse=True)[:2]
+        if not best:
+            return 0.0
+        return best[0] - best[1] if len(best) > 1 else best[0]
+
+    def __repr__(self) -> str:
+        return f"IntentScores(intent={self.intent!r}, score={self.score:.3f}, margin={self.margin:.3f})"
+
+
+class IntentClassifier:
+    """Intent classifier over the matrix of the route utterance embeddings.
+
+    A query is encoded once, scored against every utterance with one matrix product,
+    and the scores are aggregated per route, either with the best utterance ('max')
+    or with the mean of the k best utterances ('topk_mean'). Routes whose aggregated
+    score does not exceed their threshold are left out of the ranking.
+    """
+
+    def __init__(self, encoder, embeddings: np.ndarray, route_names: Sequence[str],
+                 thresholds: Dict[str, float], aggregation: str = "max", top_k: int = 3,
+                 default_threshold: float = 0.5):
+        """Initialize the classifier.
+
+        Args:
+            encoder: Callable that turns a list of texts into a list of embeddings.
+            embeddings: Matrix with the embedding of each utterance.
+            route_names: The route of each utterance.
+            thresholds: The score threshold of each route.
+            aggregation: 'max' or 'topk_mean'.
+            top_k: Number of utterances averaged per route by 'topk_mean'.
+            default_threshold: Threshold of the routes missing from thresholds.
+        """
+        if aggregation not in ("max", "topk_mean"):
+            raise ValueError(f"Unsupported aggregation method: {aggregation}. Choose 'max' or 'topk_mean'.")
+        self.encoder = encoder
+        self.aggregation = aggregation
+        self.top_k = top_k
+
+        # Group the utterances of each route in contiguous rows, in order of first appearance
+        route_names = np.asarray(route_names)
+        self.routes: List[str] = list(dict.fromkeys(route_names.tolist()))
+        route_ids = np.array([self.routes.index(name) for name in route_names])
+        order = np.argsort(route_ids, kind="stable")
+        self.starts = np.searchsorted(route_ids[order], np.arange(len(self.routes)))
+        self.ends = np.append(self.starts[1:], len(order))
+
+        matrix = np.asarray(embeddings, dtype=np.float32)[order]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms > 0, norms, 1)
+        self.thresholds = np.array([thresholds.get(name, default_threshold) for name in self.routes],
+                                   dtype=np.float32)
+
+    @classmethod
+    def from_route_layer(cls, route_layer: RouteLayer, aggregation: str = "max", top_k: int = 3) -> "IntentClassifier":
+        """Build the classifier from the encoder, index and route thresholds of a RouteLayer."""
+        thresholds = {
+            route.name: route.score_threshold for route in route_layer.routes if route.score_threshold is not None
+        }
+        return cls(route_layer.encoder, route_layer.index.index, route_layer.index.routes, thresholds,
+                   aggregation=aggregation, top_k=top_k, default_threshold=route_layer.score_threshold)
+
+    def route_scores(self, vectors: np.ndarray) -> np.ndarray:
+        """Aggregate the utterance scores of query vectors per route.
+
+        Args:
+            vectors: Matrix with one query embedding per row.
+
+        Returns:
+            Matrix with the score of each route (columns) for each query (rows).
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        similarities = (queries / np.where(norms > 0, norms, 1)) @ self.matrix.T
+
+        if self.aggregation == "max":
+            return np.maximum.reduceat(similarities, self.starts, axis=1)
+
+        scores = np.empty((len(queries), len(self.routes)), dtype=np.float32)
+        for route, (start, end) in enumerate(zip(self.starts, self.ends)):
+            k = min(self.top_k, end - start)
+            best = -np.partition(-similarities[:, start:end], k - 1, axis=1)[:, :k]
+            scores[:, route] = best.mean(axis=1)
+        return scores
+
+    def classify_vectors(self, vectors: np.ndarray) -> List[IntentScores]:
+        """Classify already encoded queries.
+
+        Args:
+            vectors: Matrix with one query embedding per row.
+
+        Returns:
+            The scores of each query.
+        """
+        scores = self.route_scores(vectors)
+        results = []
+        for row in scores:
+            ranked = [(self.routes[route], float(row[route])) for route in np.argsort(-row, kind="stable")
+                      if row[route] > self.thresholds[route]]
+            results.append(IntentScores(dict(zip(self.routes, row.tolist())), ranked))
+        return results
+
+    def classify_batch(self, texts: Sequence[str]) -> List[IntentScores]:
+        """Classify several queries, encoded with a single call to the encoder.
+
+        Args:
+            texts: The user inputs.
+
+        Returns:
+            The scores of each query, in the same order.
+        """
+        if not texts:
+            return []
+        return self.classify_vectors(np.asarray(self.encoder(list(texts))))
+
+    def classify(self, text: str) -> IntentScores:
+        """Classify a query.
+
+        Args:
+            text: The user input.
+
+        Returns:
+            The scores of the query, with the best intent in the intent attribute.
+        """
+        return self.classify_batch([text])[0]
+
+
+def microbenchmark(route_layer: RouteLayer, classifier: IntentClassifier, texts: Sequence[str],
+                   repeats: int = 3) -> Dict[str, Any]:
+    """Compare the latency of the classifier with RouteLayer.retrieve_multiple_routes.
+
+    Both are timed end to end (encoding included) one query at a time, and on
+    already encoded queries to isolate the scoring. The classifier is also timed
+    on the whole batch.
+
+    Args:
+        route_layer: The RouteLayer the classifier was built from.
+        classifier: The classifier.
+        texts: The queries.
+        repeats: Number of runs of each measure, the best one is kept.
+
+    Returns:
+        A dictionary with the milliseconds per query of each path and the share of
+        queries where both pick the same intent.
+    """
+    def best_of(function) -> float:
+        timings = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start_time)
+        return min(timings) * 1000 / len(texts)
+
+    def route_layer_intent(**kwargs) -> Optional[str]:
+        routes = route_layer.retrieve_multiple_routes(**kwargs)
+        return routes[0].name if routes else None
+
+    vectors = np.asarray(classifier.encoder(list(texts)))
+    agreement = np.mean([
+        route_layer_intent(vector=vector) == result.intent
+        for vector, result in zip(vectors, classifier.classify_vectors(vectors))
+    ])
+
+    return {
+        "queries": len(texts),
+        "route_layer_ms": best_of(lambda: [route_layer_intent(text=text) for text in texts]),
+        "classifier_ms": best_of(lambda: [classifier.classify(text) for text in texts]),
+        "classifier_batch_ms": best_of(lambda: classifier.classify_batch(texts)),
+        "route_layer_scoring_ms": best_of(lambda: [route_layer_intent(vector=vector) for vector in vectors]),
+        "classifier_scoring_ms": best_of(lambda: [classifier.classify_vectors(vector) for vector in vectors]),
+        "classifier_batch_scoring_ms": best_of(lambda: classifier.classify_vectors(vectors)),
+        "agreement": float(agreement),
+    }
+
+
+if __name__ == "__main__":
+    from chatbot.router.loader import BASE_DIR, load_intention_classifier
+
+    parser = argparse.ArgumentParser(description="Compare the intent classifier with the RouteLayer path.")
+    parser.add_argument("--queries", default=os.path.join(BASE_DIR, "synthetic_intentions_corrected.json"),
+                        help="JSON file with the messages to classify.")
+    parser.add_argument("--limit", type=int, default=200, help="Number of messages used.")
+    parser.add_argument("--aggregation", default="max", choices=["max", "topk_mean"])
+    args = parser.parse_args()
+
+    with open(args.queries, encoding="utf-8") as file:
+        messages = [item["Message"] for item in json.load(file)][:args.limit]
+
+    route_layer = load_intention_classifier()
+    classifier = IntentClassifier.from_route_layer(route_layer, aggregation=args.aggregation)
+    for metric, value in microbenchmark(route_layer, classifier, messages).items():
+        print(f"{metric}: {value:.3f}" if isinstance(value, float) else f"{metric}: {value}")
@@ -0,0 +1,151 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import List, Tuple
+
+import numpy as np
+from semantic_router import Route, RouteLayer
+from semantic_router.encoders import AutoEncoder
+from semantic_router.index.local import LocalIndex
+from semantic_router.layer import LayerConfig
+
+
+def embeddings_paths(layer_path: str) -> Tuple[str, str]:
+    """Locate the files with the precomputed utterance embeddings of a layer.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+
+    Returns:
+        The paths of the embeddings array and of its metadata, next to the JSON file.
+    """
+    base, _ = os.path.splitext(layer_path)
+    return f"{base}.embeddings.npy", f"{base}.embeddings.json"
+
+
+def layer_hash(layer_path: str) -> str:
+    """Compute the SHA-256 of the encoder and the utterances of a route layer file.
+
+    Other fields, like the route thresholds written by the calibration, do not change
+    the embeddings and are left out.
+    """
+    with open(layer_path, encoding="utf-8") as file:
+        layer = json.load(file)
+    content = {
+        "encoder_type": layer.get("encoder_type"),
+        "encoder_name": layer.get("encoder_name"),
+        "routes": [[route["name"], route["utterances"]] for route in layer.get("routes", [])],
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def route_utterances(routes: List[Route]) -> Tuple[List[str], List[str]]:
+    """List the utterances of the routes with the name of their route.
+
+    The order is the one RouteLayer uses to fill its index.
+
+    Args:
+        routes: The routes of the layer.
+
+    Returns:
+        The route name of each utterance, and the utterances.
+    """
+    route_names = [route.name for route in routes for _ in route.utterances]
+    utterances = [utterance for route in routes for utterance in route.utterances]
+    return route_names, utterances
+
+
+def build_route_embeddings(layer_path: str, encoder=None) -> np.ndarray:
+    """Encode the utterances of a route layer and store them next to its JSON file.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+        encoder: The encoder of the layer. Created from the layer config if not given.
+
+    Returns:
+        The embeddings, one row per utterance.
+    """
+    config = LayerConfig.from_file(layer_path)
+    if encoder is None:
+        encoder = AutoEncoder(type=config.encoder_type, name=config.encoder_name).model
+    _, utterances = route_utterances(config.routes)
+    embeddings = np.asarray(encoder(utterances), dtype=np.float32)
+
+    array_path, meta_path = embeddings_paths(layer_path)
+    np.save(array_path + ".tmp.npy", embeddings)
+    os.replace(array_path + ".tmp.npy", array_path)
+    with open(meta_path, "w", encoding="utf-8") as file:
+        json.dump({
+            "layer_sha256": layer_hash(layer_path),
+            "encoder_name": config.encoder_name,
+            "utterances": len(utterances),
+            "dimension": int(embeddings.shape[1]) if len(embeddings) else 0,
+        }, file, indent=4)
+    return embeddings
+
+
+def load_route_embeddings(layer_path: str):
+    """Map the precomputed utterance embeddings of a layer if they are up to date.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+
+    Returns:
+        The memory-mapped embeddings, or None if they are missing or were built from
+        other utterances or another encoder.
+    """
+    array_path, meta_path = embeddings_paths(layer_path)
+    if not (os.path.exists(array_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, encoding="utf-8") as file:
+        meta = json.load(file)
+    if meta.get("layer_sha256") != layer_hash(layer_path):
+        return None
+    return np.load(array_path, mmap_mode="r")
+
+
+def load_encoded_route_layer(layer_path: str) -> RouteLayer:
+    """Build a RouteLayer from a JSON file without encoding its utterances.
+
+    The utterance embeddings are read from the file written by build_route_embeddings,
+    which is rebuilt first when the utterances or the encoder changed.
+
+    Args:
+        layer_path: The path of the route layer JSON file.
+
+    Returns:
+        The RouteLayer, equivalent to RouteLayer.from_json(layer_path).
+    """
+    config = LayerConfig.from_file(layer_path)
+    encoder = AutoEncoder(type=config.encoder_type, name=config.encoder_name).model
+
+    embeddings = load_route_embeddings(layer_path)
+    if embeddings is None:
+        print("Route embeddings missing or outdated, encoding the route utterances...")
+        build_route_embeddings(layer_path, encoder)
+        embeddings = load_route_embeddings(layer_path)
+
+    route_names, utterances = route_utterances(config.routes)
+    index = LocalIndex(index=embeddings, routes=np.array(route_names), utterances=np.array(utterances))
+
+    # Passing the routes to the constructor would encode them again, so they are set afterwards
+    route_layer = RouteLayer(encoder=encoder, index=index)
+    route_layer.routes = config.routes
+    for route in route_layer.routes:
+        if route.score_threshold is None:
+            route.score_threshold = route_layer.score_threshold
+    return route_layer
+
+
+if __name__ == "__main__":
+    from chatbot.router.loader import FILE_PATH
+
+    parser = argparse.ArgumentParser(description="Encode the route utterances once and store them next to the layer.")
+    parser.add_argument("--layer", default=FILE_PATH, help="The route layer JSON file.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    embeddings = build_route_embeddings(args.layer)
+    print(f"Encoded {len(embeddings)} utterances in {time.perf_counter() - start_time:.2f}s")
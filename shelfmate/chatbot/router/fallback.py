@@ -0,0 +1,369 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from semantic_router import RouteLayer
+
+from chatbot.router.benchmark import BASE_DIR, DEFAULT_DATASET, NO_INTENT, load_labelled_messages
+from chatbot.router.classifier import IntentClassifier
+
+# The data folder at the root of the repository, like the other generated files
+DEFAULT_EMBEDDINGS = os.path.normpath(os.path.join(BASE_DIR, "..", "..", "..", "data", "fallback_examples.npy"))
+
+# Intent of the labelled messages without intent, answered by the chitchat chain
+CHITCHAT_INTENT = "chitchat"
+
+# Intents of RouterChain that are handled by a broader intent of the bot
+LLM_INTENT_ALIASES = {
+    "suggest_authors_given_input": "suggest_authors",
+    "suggest_authors_given_favorites": "suggest_authors",
+    "suggest_books_given_input": "suggest_books",
+    "suggest_books_given_favorites": "suggest_books",
+}
+
+# Intents whose handlers write to the user data. A wrong guess is costly, so the
+# language model router decides them instead of the nearest neighbours.
+WRITE_INTENTS = ("update_profile_info", "insert_new_favorite_author_genre", "add_book_to_read_list")
+
+# Stages that can resolve the intent of a message the router could not classify
+FALLBACK_STAGES = ("knn", "llm_chitchat", "llm_router")
+
+
+class FallbackPrediction:
+    """Result of the kNN fallback for one query.
+
+    Attributes:
+        candidate: The intent with the most similarity-weighted votes among the neighbours.
+        vote: The share of the votes that went to the candidate.
+        similarity: The cosine similarity of the nearest neighbour labelled with the candidate.
+        confident: Whether the candidate can be used without asking the language model.
+    """
+
+    def __init__(self, candidate: str, vote: float, similarity: float, confident: bool):
+        self.candidate = candidate
+        self.vote = vote
+        self.similarity = similarity
+        self.confident = confident
+
+    @property
+    def intent(self) -> Optional[str]:
+        """The candidate if the prediction is confident, None if the query is ambiguous."""
+        return self.candidate if self.confident else None
+
+    def __repr__(self) -> str:
+        return (f"FallbackPrediction(candidate={self.candidate!r}, vote={self.vote:.3f}, "
+                f"similarity={self.similarity:.3f}, confident={self.confident})")
+
+
+class KnnFallbackClassifier:
+    """k-nearest-neighbour classifier over embedded labelled messages.
+
+    It resolves the messages that no route matched without calling a language model:
+    the k most similar labelled messages vote for their intent, weighted by their
+    similarity. A query is ambiguous, and left to the language model, when the
+    neighbours do not agree, or when the nearest neighbour of the winning intent is
+    not similar enough. For a route, similar enough means above the score threshold
+    of the route plus a margin, so the fallback never accepts a message with less
+    evidence than the router itself would have needed. Write intents are always
+    left to the language model.
+    """
+
+    def __init__(self, encoder, embeddings: np.ndarray, labels: Sequence[str], k: int = 7,
+                 min_similarity: float = 0.45, min_vote: float = 0.6,
+                 thresholds: Optional[Dict[str, float]] = None, margin: float = 0.05,
+                 llm_intents: Sequence[str] = WRITE_INTENTS):
+        """Initialize the classifier.
+
+        Args:
+            encoder: Callable that turns a list of texts into a list of embeddings.
+            embeddings: Matrix with the embedding of each labelled message.
+            labels: The intent of each labelled message, 'chitchat' for small talk.
+            k: Number of neighbours that vote.
+            min_similarity: Minimum similarity of the nearest chitchat neighbour, and of
+                the intents without a threshold.
+            min_vote: Minimum share of the votes of the winning intent.
+            thresholds: The score threshold of each route.
+            margin: Added to the route thresholds.
+            llm_intents: Intents that are never resolved by the fallback.
+        """
+        self.encoder = encoder
+        self.k = min(k, len(labels))
+        self.min_similarity = min_similarity
+        self.min_vote = min_vote
+        self.thresholds = dict(thresholds or {})
+        self.margin = margin
+        self.llm_intents = set(llm_intents)
+
+        self.intents: List[str] = sorted(set(labels))
+        self.label_ids = np.array([self.intents.index(label) for label in labels])
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.matrix = matrix / np.where(norms > 0, norms, 1)
+
+    def required_similarity(self, intent: str) -> float:
+        """The similarity the nearest neighbour of an intent needs for a confident prediction."""
+        if intent in self.thresholds:
+            return self.thresholds[intent] + self.margin
+        return self.min_similarity
+
+    def classify_vectors(self, vectors: np.ndarray) -> List[FallbackPrediction]:
+        """Classify already encoded queries.
+
+        Args:
+            vectors: Matrix with one query embedding per row.
+
+        Returns:
+            The prediction for each query.
+        """
+        queries = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        similarities = (queries / np.where(norms > 0, norms, 1)) @ self.matrix.T
+
+        neighbours = np.argpartition(-similarities, self.k - 1, axis=1)[:, :self.k]
+        predictions = []
+        for row, positions in zip(similarities, neighbours):
+            weights = np.clip(row[positions], 0, None)
+            votes = np.bincount(self.label_ids[positions], weights=weights, minlength=len(self.intents))
+            best = int(votes.argmax())
+            candidate = self.intents[best]
+            vote = float(votes[best] / votes.sum()) if votes.sum() > 0 else 0.0
+            similarity = float(row[positions][self.label_ids[positions] == best].max())
+            predictions.append(FallbackPrediction(
+                candidate, vote, similarity,
+                confident=(vote >= self.min_vote and similarity >= self.required_similarity(candidate)
+                           and candidate not in self.llm_intents),
+            ))
+        return predictions
+
+    def classify(self, text: str) -> FallbackPrediction:
+        """Classify a query.
+
+        Args:
+            text: The user input.
+
+        Returns:
+            The prediction, whose intent is None if the query is ambiguous.
+        """
+        return self.classify_vectors(np.asarray(self.encoder([text])))[0]
+
+
+class FallbackStats:
+    """Counts which stage resolved the intent of the messages the router could not classify."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Counter = Counter()
+        self.intents: Dict[str, Counter] = {stage: Counter() for stage in FALLBACK_STAGES}
+        self.seconds: Counter = Counter()
+
+    def record(self, stage: str, intent: Optional[str], seconds: float) -> None:
+        """Count a message resolved by a stage.
+
+        Args:
+            stage: One of FALLBACK_STAGES.
+            intent: The intent the stage resolved.
+            seconds: Time spent by the fallback on the message, all the stages tried included.
+        """
+        with self._lock:
+            self.stages[stage] += 1
+            self.intents[stage][str(intent)] += 1
+            self.seconds[stage] += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """Report how many messages each stage resolved and how long it took.
+
+        Returns:
+            A dictionary with the share of the messages resolved locally and the count,
+            mean latency and intents of each stage.
+        """
+        with self._lock:
+            total = sum(self.stages.values())
+            return {
+                "messages": total,
+                "local_rate": self.stages["knn"] / total if total else 0.0,
+                "stages": {
+                    stage: {
+                        "count": self.stages[stage],
+                        "mean_ms": self.seconds[stage] * 1000 / self.stages[stage] if self.stages[stage] else 0.0,
+                        "intents": dict(self.intents[stage]),
+                    }
+                    for stage in FALLBACK_STAGES
+                },
+            }
+
+
+def examples_hash(dataset_path: str, encoder_name: str) -> str:
+    """Compute the SHA-256 of the labelled messages and of the encoder that embeds them."""
+    with open(dataset_path, "rb") as file:
+        return hashlib.sha256(file.read() + encoder_name.encode()).hexdigest()
+
+
+def load_fallback_examples(dataset_path: str = DEFAULT_DATASET):
+    """Load the labelled messages, with the messages without intent labelled as chitchat.
+
+    Args:
+        dataset_path: JSON file with a list of {"Intention", "Message"} items.
+
+    Returns:
+        The messages and their intents.
+    """
+    messages, labels = load_labelled_messages(dataset_path)
+    return messages, [CHITCHAT_INTENT if label == NO_INTENT else label for label in labels]
+
+
+def build_example_embeddings(encoder, encoder_name: str, messages: Sequence[str], dataset_path: str = DEFAULT_DATASET,
+                             path: str = DEFAULT_EMBEDDINGS, batch_size: int = 64) -> np.ndarray:
+    """Encode the labelled messages and store them for the next start.
+
+    Args:
+        encoder: The encoder of the router.
+        encoder_name: The name of the encoder, stored to detect a change of encoder.
+        messages: The labelled messages.
+        dataset_path: The file the messages come from.
+        path: Where to write the embeddings.
+        batch_size: Number of messages encoded at a time.
+
+    Returns:
+        The embeddings, one row per message.
+    """
+    embeddings = np.concatenate([
+        np.asarray(encoder(list(messages[start:start + batch_size])), dtype=np.float32)
+        for start in range(0, len(messages), batch_size)
+    ])
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.save(path + ".tmp.npy", embeddings)
+    os.replace(path + ".tmp.npy", path)
+    with open(os.path.splitext(path)[0] + ".json", "w", encoding="utf-8") as file:
+        json.dump({"sha256": examples_hash(dataset_path, encoder_name), "encoder_name": encoder_name,
+                   "messages": len(messages)}, file, indent=4)
+    return embeddings
+
+
+def load_example_embeddings(encoder_name: str, dataset_path: str = DEFAULT_DATASET, path: str = DEFAULT_EMBEDDINGS):
+    """Map the stored embeddings of the labelled messages if they are up to date.
+
+    Returns:
+        The memory-mapped embeddings, or None if they are missing or were built from
+        other messages or another encoder.
+    """
+    meta_path = os.path.splitext(path)[0] + ".json"
+    if not (os.path.exists(path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path, encoding="utf-8") as file:
+        meta = json.load(file)
+    if meta.get("sha256") != examples_hash(dataset_path, encoder_name):
+        return None
+    return np.load(path, mmap_mode="r")
+
+
+def load_fallback_classifier(route_layer: RouteLayer, dataset_path: str = DEFAULT_DATASET,
+                             path: Optional[str] = None) -> KnnFallbackClassifier:
+    """Build the kNN fallback with the encoder of the router.
+
+    The embeddings of the labelled messages are encoded on the first start and read
+    back afterwards, until the messages or the encoder change. The route thresholds
+    come from the router, so a calibration raises the bar of the fallback too.
+
+    Args:
+        route_layer: The router, whose encoder embeds the messages.
+        dataset_path: JSON file with the labelled messages.
+        path: Where the embeddings are stored. Defaults to SHELFMATE_FALLBACK_EMBEDDINGS,
+            or data/fallback_examples.npy.
+
+    Returns:
+        The kNN fallback classifier.
+    """
+    path = path or os.getenv("SHELFMATE_FALLBACK_EMBEDDINGS", DEFAULT_EMBEDDINGS)
+    encoder = route_layer.encoder
+    encoder_name = str(getattr(encoder, "name", type(encoder).__name__))
+
+    messages, labels = load_fallback_examples(dataset_path)
+    embeddings = load_example_embeddings(encoder_name, dataset_path, path)
+    if embeddings is None:
+        print("Fallback examples missing or outdated, encoding the labelled messages...")
+        embeddings = build_example_embeddings(encoder, encoder_name, messages, dataset_path, path)
+
+    thresholds = {
+        route.name: route.score_threshold if route.score_threshold is not None else route_layer.score_threshold
+        for route in route_layer.routes
+    }
+    return KnnFallbackClassifier(
+        encoder, embeddings, labels,
+        k=int(os.getenv("SHELFMATE_FALLBACK_K", 7)),
+        min_similarity=float(os.getenv("SHELFMATE_FALLBACK_MIN_SIMILARITY", 0.45)),
+        min_vote=float(os.getenv("SHELFMATE_FALLBACK_MIN_VOTE", 0.6)),
+        thresholds=thresholds,
+        margin=float(os.getenv("SHELFMATE_FALLBACK_MARGIN", 0.05)),
+    )
+
+
+def evaluate_fallback(classifier: KnnFallbackClassifier, router: IntentClassifier, vectors: np.ndarray,
+                      labels: Sequence[str], folds: int = 5, seed: int = 42) -> Dict[str, Any]:
+    """Measure the fallback with cross-validation on the messages the router does not match.
+
+    Only these messages reach the fallback in the bot. Each fold is classified by the
+    neighbours of the other folds.
+
+    Args:
+        classifier: The classifier, whose settings are used for every fold.
+        router: The classifier of the router, which decides the messages left to the fallback.
+        vectors: The embeddings of the labelled messages.
+        labels: Their intents.
+        folds: Number of folds.
+        seed: Seed of the split in folds.
+
+    Returns:
+        The number of unmatched messages, the share of them resolved locally, the
+        accuracy of these, and the accuracy on all of them if the ambiguous ones were
+        answered anyway.
+    """
+    labels = np.asarray(labels)
+    unmatched = np.array([result.intent is None for result in router.classify_vectors(vectors)])
+    fold_of = np.random.default_rng(seed).permutation(len(labels)) % folds
+    confident, correct, candidate_correct = 0, 0, 0
+    for fold in range(folds):
+        train, test = fold_of != fold, (fold_of == fold) & unmatched
+        model = KnnFallbackClassifier(classifier.encoder, vectors[train], labels[train].tolist(), classifier.k,
+                                      classifier.min_similarity, classifier.min_vote, classifier.thresholds,
+                                      classifier.margin, classifier.llm_intents)
+        for prediction, label in zip(model.classify_vectors(vectors[test]), labels[test]):
+            confident += prediction.confident
+            correct += prediction.confident and prediction.candidate == label
+            candidate_correct += prediction.candidate == label
+
+    total = int(unmatched.sum())
+    return {
+        "messages": len(labels),
+        "unmatched": total,
+        "local_rate": confident / total if total else 0.0,
+        "local_accuracy": correct / confident if confident else 0.0,
+        "candidate_accuracy": candidate_correct / total if total else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    from chatbot.router.loader import load_intention_classifier
+
+    parser = argparse.ArgumentParser(description="Encode the fallback examples and measure the kNN fallback.")
+    parser.add_argument("--dataset", default=DEFAULT_DATASET, help="JSON file with the labelled messages.")
+    parser.add_argument("--folds", type=int, default=5, help="Number of cross-validation folds.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    route_layer = load_intention_classifier()
+    fallback = load_fallback_classifier(route_layer, args.dataset)
+    print(f"Fallback classifier ready in {time.perf_counter() - start_time:.2f}s")
+
+    _, example_labels = load_fallback_examples(args.dataset)
+    report = evaluate_fallback(fallback, IntentClassifier.from_route_layer(route_layer), np.asarray(fallback.matrix),
+                               example_labels, args.folds)
+    print(f"Messages not matched by the router: {report['unmatched']} of {report['messages']}")
+    print(f"Resolved locally: {report['local_rate']:.3f}  accuracy of those: {report['local_accuracy']:.3f}  "
+          f"accuracy without the LLM: {report['candidate_accuracy']:.3f}")
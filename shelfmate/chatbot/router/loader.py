@@ -2,6 +2,8 @@ import os
 
 from semantic_router import RouteLayer
 
+from chatbot.router.encoded import load_encoded_route_layer
+
 FILENAME = "layer_corrected.json" # using the manually corrected user messages
 BASE_DIR = os.path.dirname(__file__)
 FILE_PATH = os.path.join(BASE_DIR, FILENAME)
@@ -11,6 +13,10 @@ def load_intention_classifier() -> RouteLayer:
     """
     Load json a file in the `router` folder.
 
+    The utterance embeddings are mapped from the file precomputed next to the JSON
+    file instead of being encoded again, and are rebuilt when the utterances change.
+    The route thresholds come from the JSON file, as written by the calibration.
+
     Returns:
         RouteLayer object to classify user intentions.
 
@@ -21,6 +27,6 @@ def load_intention_classifier() -> RouteLayer:
     if not os.path.exists(FILE_PATH):
         raise FileNotFoundError(f"File not found: {FILE_PATH}")
 
-    rl = RouteLayer.from_json(FILE_PATH)
+    rl = load_encoded_route_layer(FILE_PATH)
 
     return rl
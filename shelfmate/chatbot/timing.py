@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+
+class StageTimer:
+    """Records when each stage of a chatbot turn starts and ends.
+
+    Offsets are measured from the creation of the timer, so stages that run
+    concurrently show overlapping intervals.
+    """
+
+    def __init__(self):
+        """Initialize the timer at the beginning of a turn."""
+        self.origin = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, stage: str, start: float, end: float) -> None:
+        with self._lock:
+            self.stages[stage] = {
+                "start_ms": (start - self.origin) * 1000,
+                "end_ms": (end - self.origin) * 1000,
+                "duration_ms": (end - start) * 1000,
+            }
+
+    def run(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """Run a function and record the interval it took as a stage.
+
+        Args:
+            stage: Name of the stage.
+            func: The function to run.
+
+        Returns:
+            The return value of the function.
+        """
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._record(stage, start, time.perf_counter())
+
+    async def arun(self, stage: str, awaitable) -> Any:
+        """Await a coroutine and record the interval it took as a stage.
+
+        Args:
+            stage: Name of the stage.
+            awaitable: The coroutine to await.
+
+        Returns:
+            The result of the coroutine.
+        """
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self._record(stage, start, time.perf_counter())
+
+    def stream(self, stage: str, chunks: Iterable) -> Iterator:
+        """Iterate over a stream and record the interval it took as a stage.
+
+        The time until the first chunk arrives is recorded as a separate stage
+        named after the stage with a `_first_chunk` suffix.
+
+        Args:
+            stage: Name of the stage.
+            chunks: The stream to iterate over.
+
+        Returns:
+            An iterator over the chunks of the stream.
+        """
+        start = time.perf_counter()
+        first_chunk = True
+        try:
+            for chunk in chunks:
+                if first_chunk:
+                    self._record(f"{stage}_first_chunk", start, time.perf_counter())
+                    first_chunk = False
+                yield chunk
+        finally:
+            self._record(stage, start, time.perf_counter())
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Return the recorded stages ordered by their start offset."""
+        with self._lock:
+            return dict(sorted(self.stages.items(), key=lambda item: item[1]["start_ms"]))
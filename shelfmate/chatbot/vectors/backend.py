@@ -0,0 +1,353 @@
+# Import necessary modules and classes
+import argparse
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from pinecone import Pinecone
+
+from chatbot.db.replica import ROOT_DIR
+
+DEFAULT_INDEX_NAME = "books"
+DEFAULT_LOCAL_INDEX_PATH = ROOT_DIR / "data" / "vectors"
+
+
+class Vector:
+    """Vector returned by fetch, with the same attributes as the Pinecone client."""
+
+    def __init__(self, id: str, values: List[float], metadata: Dict[str, Any]):
+        self.id = id
+        self.values = values
+        self.metadata = metadata
+
+
+class FetchResponse:
+    """Result of fetch, with the vectors by id like the Pinecone client."""
+
+    def __init__(self, vectors: Dict[str, Vector]):
+        self.vectors = vectors
+
+
+class PineconeBackend:
+    """Vector backend that queries the remote Pinecone index."""
+
+    def __init__(self, index_name: str = DEFAULT_INDEX_NAME, pool_threads: int = 8):
+        """Initialize the backend.
+
+        Args:
+            index_name: The name of the Pinecone index.
+            pool_threads: Number of connections the client keeps open to the index.
+        """
+        self.index_name = index_name
+        self.pool_threads = pool_threads
+        self._index = None
+
+    @property
+    def index(self):
+        # The client is created on first use so importing the chains needs no API key
+        if self._index is None:
+            self._index = Pinecone().Index(self.index_name, pool_threads=self.pool_threads)
+        return self._index
+
+    def query(self, vector: Sequence[float], top_k: int = 10, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, **kwargs):
+        """Find the vectors most similar to a query vector (see LocalVectorIndex.query)."""
+        return self.index.query(vector=np.asarray(vector, dtype=float).tolist(), top_k=top_k, include_metadata=include_metadata,
+                                filter=filter, **kwargs)
+
+    def fetch(self, ids: Sequence[str]):
+        """Retrieve vectors by id (see LocalVectorIndex.fetch)."""
+        return self.index.fetch(ids=list(ids))
+
+
+class LocalVectorIndex:
+    """Exact vector search over a local copy of the Pinecone 'books' index.
+
+    The vectors are stored normalized in a float32 .npy file that is memory-mapped,
+    so only the pages that are read stay in memory. Queries are scored with NumPy dot
+    products over blocks of rows (the cosine similarity of the Pinecone index), and the
+    metadata filters are evaluated over columnar arrays of book ids and types.
+    """
+
+    # Metadata fields that can be filtered, stored as one array each
+    FILTER_FIELDS = ("book_id", "type")
+
+    def __init__(self, path: Path, block_size: int = 65536):
+        """Open the local index.
+
+        Args:
+            path: The folder written by export_local_index.
+            block_size: Number of rows scored by each matrix product.
+        """
+        self.path = Path(path)
+        self.block_size = block_size
+
+        with open(self.path / "manifest.json", encoding="utf-8") as file:
+            manifest = json.load(file)
+        self.ids: List[str] = manifest["ids"]
+        self.texts: List[str] = manifest["texts"]
+        self.type_names: List[str] = manifest["types"]
+
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self.book_ids = np.load(self.path / "book_ids.npy")
+        self.types = np.load(self.path / "types.npy")
+        self.positions = {vector_id: position for position, vector_id in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def metadata(self, position: int) -> Dict[str, Any]:
+        """Rebuild the Pinecone metadata of a row."""
+        return {
+            "book_id": float(self.book_ids[position]),
+            "type": self.type_names[self.types[position]],
+            "text": self.texts[position],
+        }
+
+    def _column(self, field: str) -> np.ndarray:
+        if field == "book_id":
+            return self.book_ids
+        if field == "type":
+            return self.types
+        raise ValueError(f"Unsupported filter field: {field}")
+
+    def _encode(self, field: str, values: Iterable[Any]) -> np.ndarray:
+        # Types are compared through their codes, unknown types match nothing
+        if field == "type":
+            return np.array([self.type_names.index(value) for value in values if value in self.type_names],
+                            dtype=self.types.dtype)
+        return np.array([int(value) for value in values], dtype=self.book_ids.dtype)
+
+    def filter_mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Evaluate a Pinecone metadata filter over every row.
+
+        Supports $eq, $ne, $in and $nin on book_id and type, plain values (as $eq),
+        and $and of several conditions.
+
+        Args:
+            filter: The metadata filter, as passed to Pinecone.
+
+        Returns:
+            A boolean array with the rows that pass the filter, or None without filter.
+        """
+        if not filter:
+            return None
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, condition in filter.items():
+            if field == "$and":
+                for sub_filter in condition:
+                    mask &= self.filter_mask(sub_filter)
+                continue
+
+            column = self._column(field)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for operator, value in condition.items():
+                if operator in ("$eq", "$ne"):
+                    matches = np.isin(column, self._encode(field, [value]))
+                elif operator in ("$in", "$nin"):
+                    matches = np.isin(column, self._encode(field, value))
+                else:
+                    raise ValueError(f"Unsupported filter operator: {operator}")
+                mask &= ~matches if operator in ("$ne", "$nin") else matches
+
+        return mask
+
+    def query(self, vector: Sequence[float], top_k: int = 10, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, include_values: bool = False, **kwargs) -> Dict[str, Any]:
+        """Find the vectors most similar to a query vector.
+
+        Args:
+            vector: The query vector.
+            top_k: Number of matches to return.
+            include_metadata: If True, the matches include their metadata.
+            filter: A Pinecone metadata filter.
+            include_values: If True, the matches include their vector.
+
+        Returns:
+            A dictionary shaped like a Pinecone query response, with the matches sorted
+            by decreasing cosine similarity.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        mask = self.filter_mask(filter)
+        best_scores = np.empty(0, dtype=np.float32)
+        best_positions = np.empty(0, dtype=np.int64)
+
+        for start in range(0, len(self.ids), self.block_size):
+            scores = self.vectors[start:start + self.block_size] @ query
+            if mask is not None:
+                scores = np.where(mask[start:start + self.block_size], scores, -np.inf)
+
+            # Keep the top_k of the block and merge them with the best so far
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_positions = np.concatenate([best_positions, top + start])
+
+            if len(best_scores) > top_k:
+                keep = np.argpartition(-best_scores, top_k)[:top_k]
+                best_scores, best_positions = best_scores[keep], best_positions[keep]
+
+        order = np.argsort(-best_scores, kind="stable")
+        matches = []
+        for index in order:
+            if not np.isfinite(best_scores[index]):
+                continue
+            position = int(best_positions[index])
+            match = {"id": self.ids[position], "score": float(best_scores[index])}
+            if include_metadata:
+                match["metadata"] = self.metadata(position)
+            if include_values:
+                match["values"] = self.vectors[position].tolist()
+            matches.append(match)
+
+        return {"matches": matches, "namespace": ""}
+
+    def fetch(self, ids: Sequence[str]) -> FetchResponse:
+        """Retrieve vectors by id.
+
+        Args:
+            ids: The ids of the vectors, like 'desc_12' or 'title_12'.
+
+        Returns:
+            A response whose vectors attribute maps each id found to its vector.
+        """
+        vectors = {}
+        for vector_id in ids:
+            position = self.positions.get(vector_id)
+            if position is not None:
+                vectors[vector_id] = Vector(vector_id, self.vectors[position].tolist(), self.metadata(position))
+        return FetchResponse(vectors)
+
+
+def export_local_index(path: Optional[Path] = None, index_name: str = DEFAULT_INDEX_NAME,
+                       batch_size: int = 100) -> int:
+    """Copy the Pinecone index to a local index.
+
+    The files are written to a temporary folder and moved into place at the end, so
+    readers never see a half-written index.
+
+    Args:
+        path: Where to write the local index. Defaults to get_local_index_path().
+        index_name: The name of the Pinecone index.
+        batch_size: Number of vectors fetched per request.
+
+    Returns:
+        The number of exported vectors.
+    """
+    path = Path(path or get_local_index_path())
+    index = Pinecone().Index(index_name)
+
+    ids, texts, book_ids, types, type_names, rows = [], [], [], [], [], []
+    for page in index.list():
+        for start in range(0, len(page), batch_size):
+            fetched = index.fetch(ids=page[start:start + batch_size]).vectors
+            for vector_id, vector in fetched.items():
+                metadata = vector.metadata or {}
+                if metadata.get("type") not in type_names:
+                    type_names.append(metadata.get("type"))
+                ids.append(vector_id)
+                texts.append(metadata.get("text", ""))
+                book_ids.append(int(metadata.get("book_id", -1)))
+                types.append(type_names.index(metadata.get("type")))
+                rows.append(vector.values)
+
+    vectors = np.asarray(rows, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms > 0, norms, 1)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    np.save(tmp_path / "vectors.npy", vectors)
+    np.save(tmp_path / "book_ids.npy", np.asarray(book_ids, dtype=np.int64))
+    np.save(tmp_path / "types.npy", np.asarray(types, dtype=np.int8))
+    with open(tmp_path / "manifest.json", "w", encoding="utf-8") as file:
+        json.dump({"index": index_name, "exported_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "dimension": int(vectors.shape[1]) if len(vectors) else 0,
+                   "types": type_names, "ids": ids, "texts": texts}, file)
+
+    if path.exists():
+        old_path = path.with_name(path.name + ".old")
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        for file in old_path.iterdir():
+            file.unlink()
+        old_path.rmdir()
+    else:
+        os.replace(tmp_path, path)
+
+    return len(ids)
+
+
+def get_local_index_path() -> Path:
+    """Retrieve the location of the local vector index.
+
+    Returns:
+        The path set in SHELFMATE_VECTOR_INDEX, or data/vectors by default.
+    """
+    return Path(os.getenv("SHELFMATE_VECTOR_INDEX", DEFAULT_LOCAL_INDEX_PATH))
+
+
+def use_local_vectors() -> bool:
+    """Decide if the vector searches run on the local index.
+
+    SHELFMATE_VECTOR_BACKEND can be 'local', 'pinecone' or 'auto' (the default), which
+    searches locally whenever the local index has been exported.
+
+    Returns:
+        True if vector searches go to the local index.
+    """
+    backend = os.getenv("SHELFMATE_VECTOR_BACKEND", "auto").lower()
+    if backend == "pinecone":
+        return False
+    if backend == "local":
+        return True
+    return (get_local_index_path() / "manifest.json").exists()
+
+
+_backends: Dict[Any, Any] = {}
+_backends_lock = threading.Lock()
+
+
+def get_vector_backend():
+    """Retrieve the vector backend shared by the process, creating it on first use.
+
+    Returns:
+        A LocalVectorIndex or a PineconeBackend, both with the query and fetch
+        methods of a Pinecone index.
+    """
+    key = ("local", get_local_index_path()) if use_local_vectors() else ("pinecone", DEFAULT_INDEX_NAME)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                if key[0] == "local":
+                    backend = LocalVectorIndex(key[1])
+                else:
+                    backend = PineconeBackend(key[1], pool_threads=int(os.getenv("SHELFMATE_VECTOR_WORKERS", "8")))
+                _backends[key] = backend
+    return backend
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the Pinecone 'books' index to a local vector index.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the local index.")
+    parser.add_argument("--index", default=DEFAULT_INDEX_NAME, help="Name of the Pinecone index.")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    count = export_local_index(args.output, args.index)
+    print(f"Exported {count} vectors in {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,208 @@
+# Import necessary modules and classes
+import argparse
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from chatbot.db.replica import ROOT_DIR, get_catalog_connection
+from chatbot.vectors.backend import LocalVectorIndex, export_local_index, get_local_index_path
+
+DEFAULT_CENTROIDS_PATH = ROOT_DIR / "data" / "centroids.npz"
+
+
+def group_centroids(pairs: Sequence[Tuple[int, int]], book_rows: Dict[int, int],
+                    vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Average the description vectors of the books of each group (author or genre).
+
+    Args:
+        pairs: The (group id, book id) pairs, like the rows of authors_books.
+        book_rows: The row of the description vector of each book.
+        vectors: Matrix with the normalized description vectors.
+
+    Returns:
+        The sorted group ids, their normalized centroids and their number of books.
+        Groups without any book vector are left out.
+    """
+    pairs = [(group_id, book_rows[book_id]) for group_id, book_id in pairs if book_id in book_rows]
+    if not pairs:
+        dimension = vectors.shape[1] if vectors.ndim == 2 else 0
+        return np.empty(0, dtype=np.int64), np.empty((0, dimension), dtype=np.float32), np.empty(0, dtype=np.int32)
+
+    group_ids, rows = (np.asarray(column) for column in zip(*pairs))
+    unique_ids, positions = np.unique(group_ids, return_inverse=True)
+
+    sums = np.zeros((len(unique_ids), vectors.shape[1]), dtype=np.float32)
+    # Blocks of pairs keep the gathered vectors small
+    for start in range(0, len(rows), 8192):
+        np.add.at(sums, positions[start:start + 8192], np.asarray(vectors[rows[start:start + 8192]], dtype=np.float32))
+    counts = np.bincount(positions, minlength=len(unique_ids)).astype(np.int32)
+
+    norms = np.linalg.norm(sums, axis=1, keepdims=True)
+    return unique_ids.astype(np.int64), sums / np.where(norms > 0, norms, 1), counts
+
+
+def build_centroid_index(index: LocalVectorIndex, path: Optional[Path] = None) -> Dict[str, Any]:
+    """Compute one vector per author and per genre from the description vectors of their books.
+
+    Args:
+        index: The local vector index with the description vectors.
+        path: Where to write the centroids. Defaults to get_centroid_index_path().
+
+    Returns:
+        A dictionary with the number of authors and genres and the build time.
+    """
+    path = Path(path or get_centroid_index_path())
+    start_time = time.perf_counter()
+
+    rows = np.flatnonzero(index.filter_mask({"type": {"$eq": "description"}}))
+    book_rows = {int(book_id): int(row) for book_id, row in zip(index.book_ids[rows], rows)}
+
+    with get_catalog_connection() as con:
+        cursor = con.cursor()
+        cursor.execute("SELECT author_id, book_id FROM authors_books")
+        author_books = [(int(author_id), int(book_id)) for author_id, book_id in cursor.fetchall()]
+        cursor = con.cursor()
+        cursor.execute("SELECT genre_id, book_id FROM books_genres")
+        genre_books = [(int(genre_id), int(book_id)) for genre_id, book_id in cursor.fetchall()]
+
+    author_ids, author_vectors, author_counts = group_centroids(author_books, book_rows, index.vectors)
+    genre_ids, genre_vectors, genre_counts = group_centroids(genre_books, book_rows, index.vectors)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp_path, author_ids=author_ids, author_vectors=author_vectors, author_counts=author_counts,
+             genre_ids=genre_ids, genre_vectors=genre_vectors, genre_counts=genre_counts)
+    os.replace(tmp_path, path)
+
+    return {
+        "authors": len(author_ids),
+        "genres": len(genre_ids),
+        "build_seconds": time.perf_counter() - start_time,
+    }
+
+
+class CentroidIndex:
+    """Author and genre vectors, searched to find similar authors in a single query."""
+
+    def __init__(self, path: Path):
+        """Load the centroids.
+
+        Args:
+            path: The file written by build_centroid_index.
+        """
+        self.path = Path(path)
+        with np.load(self.path) as data:
+            self.author_ids = data["author_ids"]
+            self.author_vectors = data["author_vectors"]
+            self.genre_ids = data["genre_ids"]
+            self.genre_vectors = data["genre_vectors"]
+
+    @staticmethod
+    def _vectors(ids: np.ndarray, vectors: np.ndarray, wanted: Iterable[int]) -> np.ndarray:
+        return vectors[np.isin(ids, list(wanted))]
+
+    def has_authors(self, author_ids: Iterable[int]) -> bool:
+        """Check if at least one of the authors has a vector."""
+        return len(self._vectors(self.author_ids, self.author_vectors, author_ids)) > 0
+
+    def has_genres(self, genre_ids: Iterable[int]) -> bool:
+        """Check if at least one of the genres has a vector."""
+        return len(self._vectors(self.genre_ids, self.genre_vectors, genre_ids)) > 0
+
+    def nearest_authors(self, vector: Sequence[float], k: int = 5, exclude: Iterable[int] = ()) -> List[int]:
+        """Find the authors whose vector is closest to a vector.
+
+        Args:
+            vector: The query vector.
+            k: Number of authors to return.
+            exclude: Author ids to leave out.
+
+        Returns:
+            Up to k author ids, closest first.
+        """
+        scores = self.author_vectors @ np.asarray(vector, dtype=np.float32)
+        scores[np.isin(self.author_ids, list(exclude))] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(-scores[top])]
+        return [int(self.author_ids[position]) for position in top if np.isfinite(scores[position])]
+
+    def similar_authors(self, author_ids: Iterable[int], k: int = 5) -> List[int]:
+        """Find the authors most similar to one or several authors.
+
+        Args:
+            author_ids: The ids of the authors.
+            k: Number of authors to return.
+
+        Returns:
+            Up to k author ids, excluding the given ones.
+        """
+        author_ids = list(author_ids)
+        vectors = self._vectors(self.author_ids, self.author_vectors, author_ids)
+        if not len(vectors):
+            return []
+        return self.nearest_authors(vectors.mean(axis=0), k, exclude=author_ids)
+
+    def authors_for_genres(self, genre_ids: Iterable[int], k: int = 5) -> List[int]:
+        """Find the authors closest to one or several genres.
+
+        Args:
+            genre_ids: The ids of the genres.
+            k: Number of authors to return.
+
+        Returns:
+            Up to k author ids.
+        """
+        vectors = self._vectors(self.genre_ids, self.genre_vectors, list(genre_ids))
+        if not len(vectors):
+            return []
+        return self.nearest_authors(vectors.mean(axis=0), k)
+
+
+def get_centroid_index_path() -> Path:
+    """Retrieve the location of the author and genre centroids.
+
+    Returns:
+        The path set in SHELFMATE_CENTROID_INDEX, or data/centroids.npz by default.
+    """
+    return Path(os.getenv("SHELFMATE_CENTROID_INDEX", DEFAULT_CENTROIDS_PATH))
+
+
+_centroids: Optional[CentroidIndex] = None
+_centroids_lock = threading.Lock()
+
+
+def get_centroid_index() -> Optional[CentroidIndex]:
+    """Retrieve the centroid index shared by the process, loading it on first use.
+
+    Returns:
+        The centroid index, or None if it has not been built.
+    """
+    global _centroids
+    path = get_centroid_index_path()
+    if _centroids is None or _centroids.path != path:
+        if not path.exists():
+            return None
+        with _centroids_lock:
+            if _centroids is None or _centroids.path != path:
+                _centroids = CentroidIndex(path)
+    return _centroids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the author and genre centroid vectors.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the centroids.")
+    args = parser.parse_args()
+
+    # The description vectors are read from the local vector index, exported first if needed
+    if not (get_local_index_path() / "manifest.json").exists():
+        print("Exporting the Pinecone index to the local vector index...")
+        export_local_index()
+
+    report = build_centroid_index(LocalVectorIndex(get_local_index_path()), args.output)
+    for metric, value in report.items():
+        print(f"{metric}: {value:.2f}" if isinstance(value, float) else f"{metric}: {value}")
@@ -0,0 +1,237 @@
+# Import necessary modules and classes
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import openai
+from langchain_core.embeddings import Embeddings
+
+from chatbot.db.replica import ROOT_DIR
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+DEFAULT_CACHE_PATH = ROOT_DIR / "data" / "embeddings.db"
+
+
+def normalize_text(text: str) -> str:
+    """Normalize the spacing of a text, so that texts differing only in whitespace share a cache entry.
+
+    Case is kept, as the embedding of a text depends on it.
+
+    Args:
+        text: The text to embed.
+
+    Returns:
+        The cache key of the text.
+    """
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Embeddings of the OpenAI API cached in a local SQLite file.
+
+    Entries are keyed by model and normalized text and store the vector as float32
+    bytes. Each lookup refreshes the last use of the entry, and the least recently
+    used entries are evicted when the cache grows over its maximum size. Texts that
+    miss the cache in the same call are embedded with a single API request.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 50000, model: str = DEFAULT_EMBEDDING_MODEL):
+        """Open the cache, creating the file if needed.
+
+        Args:
+            path: The location of the cache file.
+            max_entries: Maximum number of cached embeddings.
+            model: The default embedding model.
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.model = model
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Calls come from the worker threads of the async path, one connection behind a lock
+        self._con = sqlite3.connect(self.path, check_same_thread=False)
+        self._con.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings
+            (model TEXT NOT NULL,
+            key TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (model, key)) WITHOUT ROWID
+        """)
+        self._con.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._con.commit()
+        self._lock = threading.Lock()
+        # Running number of entries, so inserts do not have to count the table
+        self._count = self._con.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+        # Counters exported by stats()
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+        self.evictions = 0
+        self.api_seconds = 0.0
+
+    def _create(self, texts: List[str], model: str) -> List[List[float]]:
+        start_time = time.perf_counter()
+        response = openai.embeddings.create(model=model, input=texts)
+        self.api_seconds += time.perf_counter() - start_time
+        self.api_calls += 1
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed(self, texts: Sequence[str], model: Optional[str] = None) -> List[List[float]]:
+        """Embed several texts, calling the API only for the ones not cached.
+
+        Args:
+            texts: The texts to embed.
+            model: The embedding model. Defaults to the model of the cache.
+
+        Returns:
+            The embedding of each text, in the same order.
+        """
+        model = model or self.model
+        keys = [normalize_text(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        now = time.time()
+
+        with self._lock:
+            found: Dict[str, List[float]] = {}
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                rows = self._con.execute(
+                    "SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({})".format(
+                        ",".join("?" for _ in batch)),
+                    [model] + batch,
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            if found:
+                self._con.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND key = ?",
+                                      [(now, model, key) for key in found])
+                self._con.commit()
+
+        # Repeated texts of the same call are embedded once, so they count as hits
+        missing = [key for key in unique_keys if key not in found]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            # The first text of each missing key is the one sent to the API
+            originals: Dict[str, str] = {}
+            for key, text in zip(keys, texts):
+                originals.setdefault(key, text)
+            vectors = self._create([originals[key] for key in missing], model)
+            found.update(zip(missing, vectors))
+
+            with self._lock:
+                # A key inserted by another thread in the meantime has the same vector, keep it
+                cursor = self._con.executemany(
+                    "INSERT OR IGNORE INTO embeddings (model, key, vector, last_used) VALUES (?, ?, ?, ?)",
+                    [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                     for key, vector in zip(missing, vectors)],
+                )
+                self._count += cursor.rowcount
+                self._evict()
+                self._con.commit()
+
+        return [found[key] for key in keys]
+
+    def embed_one(self, text: str, model: Optional[str] = None) -> List[float]:
+        """Embed a single text.
+
+        Args:
+            text: The text to embed.
+            model: The embedding model. Defaults to the model of the cache.
+
+        Returns:
+            The embedding of the text.
+        """
+        return self.embed([text], model)[0]
+
+    def _evict(self) -> None:
+        excess = self._count - self.max_entries
+        if excess > 0:
+            deleted = self._con.execute("""
+                DELETE FROM embeddings WHERE (model, key) IN (
+                    SELECT model, key FROM embeddings ORDER BY last_used LIMIT ?
+                )
+            """, (excess,)).rowcount
+            self._count -= deleted
+            self.evictions += deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the usage counters of the cache.
+
+        Returns:
+            A dictionary with the hits, misses, API calls and an estimate of the API
+            time saved by the hits.
+        """
+        lookups = self.hits + self.misses
+        seconds_per_miss = self.api_seconds / self.misses if self.misses else 0.0
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "api_calls": self.api_calls,
+            "evictions": self.evictions,
+            "api_seconds": self.api_seconds,
+            "saved_seconds_estimate": self.hits * seconds_per_miss,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings backed by the shared embedding cache, for the vector stores."""
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embedding_cache().embed(texts, self.model)
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_embedding_cache().embed_one(text, self.model)
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Retrieve the embedding cache shared by the process, creating it on first use.
+
+    The location and size come from SHELFMATE_EMBEDDING_CACHE and
+    SHELFMATE_EMBEDDING_CACHE_SIZE.
+
+    Returns:
+        The shared embedding cache.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    Path(os.getenv("SHELFMATE_EMBEDDING_CACHE", DEFAULT_CACHE_PATH)),
+                    max_entries=int(os.getenv("SHELFMATE_EMBEDDING_CACHE_SIZE", "50000")),
+                )
+    return _cache
+
+
+def embed_text(text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
+    """Embed a text through the shared embedding cache.
+
+    Args:
+        text: The text to embed.
+        model: The embedding model.
+
+    Returns:
+        The embedding of the text.
+    """
+    return get_embedding_cache().embed_one(text, model)
@@ -0,0 +1,192 @@
+# Import necessary modules and classes
+import argparse
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from chatbot.db.replica import ROOT_DIR
+from chatbot.vectors.backend import LocalVectorIndex, export_local_index, get_local_index_path
+
+DEFAULT_NEIGHBOURS_PATH = ROOT_DIR / "data" / "neighbours.npz"
+
+
+def compute_neighbours(vectors: np.ndarray, top_n: int = 20, block_size: int = 1024):
+    """Find the most similar rows of every row of a matrix of normalized vectors.
+
+    The similarities are computed one block of rows at a time, so the memory used is
+    block_size x rows instead of rows x rows.
+
+    Args:
+        vectors: Matrix with one normalized vector per row.
+        top_n: Number of neighbours kept for each row.
+        block_size: Number of rows compared to the whole matrix at a time.
+
+    Returns:
+        The positions of the neighbours of each row and their cosine similarities,
+        both with shape (rows, top_n) and sorted by decreasing similarity.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    rows = len(matrix)
+    top_n = max(0, min(top_n, rows - 1))
+    positions = np.empty((rows, top_n), dtype=np.int32)
+    scores = np.empty((rows, top_n), dtype=np.float32)
+    if top_n == 0:
+        return positions, scores
+
+    for start in range(0, rows, block_size):
+        block = matrix[start:start + block_size]
+        similarities = block @ matrix.T
+        # A book is not its own neighbour
+        similarities[np.arange(len(block)), np.arange(start, start + len(block))] = -np.inf
+
+        top = np.argpartition(-similarities, top_n - 1, axis=1)[:, :top_n]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        positions[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+
+    return positions, scores
+
+
+def build_neighbour_table(index: LocalVectorIndex, path: Optional[Path] = None, top_n: int = 20,
+                          block_size: int = 1024) -> Dict[str, Any]:
+    """Compute the nearest books of every book from their description vectors.
+
+    Args:
+        index: The local vector index with the description vectors.
+        path: Where to write the table. Defaults to get_neighbour_table_path().
+        top_n: Number of neighbours kept for each book.
+        block_size: Number of books compared to the whole catalog at a time.
+
+    Returns:
+        A dictionary with the number of books, the build time and the memory used.
+    """
+    path = Path(path or get_neighbour_table_path())
+    start_time = time.perf_counter()
+    tracemalloc.start()
+
+    rows = np.flatnonzero(index.filter_mask({"type": {"$eq": "description"}}))
+    book_ids = index.book_ids[rows]
+    positions, scores = compute_neighbours(index.vectors[rows], top_n, block_size)
+    neighbours = book_ids[positions]
+
+    # Sorted book ids allow binary search lookups
+    order = np.argsort(book_ids, kind="stable")
+    table = {
+        "book_ids": book_ids[order].astype(np.int64),
+        "neighbours": neighbours[order].astype(np.int32),
+        "scores": scores[order].astype(np.float16),
+    }
+
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp_path, **table)
+    os.replace(tmp_path, path)
+
+    return {
+        "books": len(book_ids),
+        "top_n": int(neighbours.shape[1]) if len(book_ids) else 0,
+        "build_seconds": time.perf_counter() - start_time,
+        "peak_traced_mb": peak_bytes / 2 ** 20,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "table_mb": sum(array.nbytes for array in table.values()) / 2 ** 20,
+    }
+
+
+class NeighbourTable:
+    """Precomputed most similar books of every book of the catalog."""
+
+    def __init__(self, path: Path):
+        """Load the table.
+
+        Args:
+            path: The file written by build_neighbour_table.
+        """
+        self.path = Path(path)
+        with np.load(self.path) as data:
+            self.book_ids = data["book_ids"]
+            self.neighbours = data["neighbours"]
+            self.scores = data["scores"]
+
+    def __contains__(self, book_id: int) -> bool:
+        return self._position(book_id) is not None
+
+    def _position(self, book_id: int) -> Optional[int]:
+        position = int(np.searchsorted(self.book_ids, book_id))
+        if position < len(self.book_ids) and self.book_ids[position] == book_id:
+            return position
+        return None
+
+    def similar(self, book_id: int, k: int = 5, exclude: Iterable[int] = ()) -> List[int]:
+        """Find the books most similar to a book.
+
+        Args:
+            book_id: The id of the book.
+            k: Number of similar books to return.
+            exclude: Book ids to leave out, like the books already read.
+
+        Returns:
+            Up to k book ids, most similar first, or an empty list if the book is not in the table.
+        """
+        position = self._position(book_id)
+        if position is None:
+            return []
+        exclude = set(exclude)
+        return [int(neighbour) for neighbour in self.neighbours[position] if neighbour not in exclude][:k]
+
+
+def get_neighbour_table_path() -> Path:
+    """Retrieve the location of the neighbour table.
+
+    Returns:
+        The path set in SHELFMATE_NEIGHBOUR_TABLE, or data/neighbours.npz by default.
+    """
+    return Path(os.getenv("SHELFMATE_NEIGHBOUR_TABLE", DEFAULT_NEIGHBOURS_PATH))
+
+
+_table: Optional[NeighbourTable] = None
+_table_lock = threading.Lock()
+
+
+def get_neighbour_table() -> Optional[NeighbourTable]:
+    """Retrieve the neighbour table shared by the process, loading it on first use.
+
+    Returns:
+        The neighbour table, or None if it has not been built.
+    """
+    global _table
+    path = get_neighbour_table_path()
+    if _table is None or _table.path != path:
+        if not path.exists():
+            return None
+        with _table_lock:
+            if _table is None or _table.path != path:
+                _table = NeighbourTable(path)
+    return _table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the most similar books of every book.")
+    parser.add_argument("--output", type=Path, default=None, help="Where to write the table.")
+    parser.add_argument("--top-n", type=int, default=20, help="Number of neighbours kept for each book.")
+    parser.add_argument("--block-size", type=int, default=1024, help="Books compared at a time.")
+    args = parser.parse_args()
+
+    # The description vectors are read from the local vector index, exported first if needed
+    if not (get_local_index_path() / "manifest.json").exists():
+        print("Exporting the Pinecone index to the local vector index...")
+        export_local_index()
+
+    report = build_neighbour_table(LocalVectorIndex(get_local_index_path()), args.output, args.top_n,
+                                   args.block_size)
+    for metric, value in report.items():
+        print(f"{metric}: {value:.2f}" if isinstance(value, float) else f"{metric}: {value}")
@@ -0,0 +1,311 @@
+# Import necessary modules and classes
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from chatbot.vectors.backend import FetchResponse, get_vector_backend
+
+
+def interest_centroids(embeddings: np.ndarray, interests: int = 1, iterations: int = 10,
+                       seed: int = 42) -> List[np.ndarray]:
+    """Summarize a set of book embeddings by one or several interest centroids.
+
+    With one interest this is the mean vector. With more, the normalized embeddings
+    are grouped with a few rounds of spherical k-means, so a user who likes both
+    thrillers and poetry gets one centroid for each instead of one in between.
+
+    Args:
+        embeddings: Matrix with one embedding per row.
+        interests: Number of interest clusters.
+        iterations: Number of k-means refinement rounds.
+        seed: Seed of the initial centroid choice.
+
+    Returns:
+        The centroids, largest cluster first.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    interests = max(1, min(interests, len(embeddings)))
+    if interests == 1:
+        return [embeddings.mean(axis=0)]
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    points = embeddings / np.where(norms > 0, norms, 1)
+
+    # k-means++ initialization: spread the first centroids over the embeddings
+    rng = np.random.default_rng(seed)
+    centroids = [points[rng.integers(len(points))]]
+    for _ in range(1, interests):
+        distances = np.min(1 - points @ np.stack(centroids).T, axis=1).clip(min=0)
+        if distances.sum() == 0:
+            break
+        centroids.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centroids = np.stack(centroids)
+
+    for _ in range(iterations):
+        labels = np.argmax(points @ centroids.T, axis=1)
+        updated = np.stack([
+            points[labels == cluster].mean(axis=0) if np.any(labels == cluster) else centroids[cluster]
+            for cluster in range(len(centroids))
+        ])
+        # Spherical k-means: project the means back on the unit sphere, so the
+        # assignment by dot product compares directions only
+        updated_norms = np.linalg.norm(updated, axis=1, keepdims=True)
+        updated = updated / np.where(updated_norms > 0, updated_norms, 1)
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+
+    labels = np.argmax(points @ centroids.T, axis=1)
+    sizes = np.bincount(labels, minlength=len(centroids))
+    return [centroids[cluster] for cluster in np.argsort(-sizes, kind="stable") if sizes[cluster] > 0]
+
+
+def merge_results(result_lists: Sequence[Sequence[int]], k: int) -> List[int]:
+    """Interleave the ranked results of several queries without duplicates.
+
+    Args:
+        result_lists: The book ids returned for each centroid, best first.
+        k: Number of book ids to keep.
+
+    Returns:
+        Up to k book ids, taking the best remaining result of each list in turn.
+    """
+    merged: List[int] = []
+    seen = set()
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank < len(results) and results[rank] not in seen:
+                seen.add(results[rank])
+                merged.append(results[rank])
+                if len(merged) == k:
+                    return merged
+    return merged
+
+
+class RetrievalTimeout(TimeoutError):
+    """Raised when a vector search does not answer before its timeout."""
+
+
+class RetrievalService:
+    """Single entry point to the 'books' vector index for every chain.
+
+    The service keeps one backend client and one thread pool for the whole process,
+    splits large fetches into batches, runs several queries concurrently and applies
+    a timeout to every call. Description vectors ('desc_<book_id>') rarely change, so
+    the fetched ones are kept in an in-process LRU cache and repeated favourites
+    lookups do not fetch them again.
+    """
+
+    def __init__(self, backend, max_workers: int = 8, timeout: Optional[float] = 10.0,
+                 fetch_batch_size: int = 100, cache_size: int = 10000):
+        """Initialize the service.
+
+        Args:
+            backend: The vector backend, with the query and fetch methods of a Pinecone index.
+            max_workers: Number of requests sent to the backend at the same time.
+            timeout: Default number of seconds a call may take, None to wait forever.
+            fetch_batch_size: Number of ids fetched per request.
+            cache_size: Number of description vectors kept in memory.
+        """
+        self.backend = backend
+        self.timeout = timeout
+        self.fetch_batch_size = fetch_batch_size
+        self.cache_size = cache_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="vector-search")
+
+        self._vectors: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters exported by stats()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.queries = 0
+        self.fetches = 0
+        self.timeouts = 0
+
+    def _wait(self, futures: List[Future], timeout: Optional[float]) -> List[Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = []
+        for future in futures:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeout:
+                self.timeouts += 1
+                for pending in futures:
+                    pending.cancel()
+                raise RetrievalTimeout(f"Vector search did not answer after {timeout:.1f}s")
+        return results
+
+    def _timeout(self, timeout: Optional[float]) -> Optional[float]:
+        return self.timeout if timeout is None else timeout
+
+    def query_many(self, vectors: Sequence[Sequence[float]], top_k: int = 10, include_metadata: bool = True,
+                   filter: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                   **kwargs) -> List[Any]:
+        """Run several similarity queries concurrently.
+
+        Args:
+            vectors: The query vectors.
+            top_k: Number of matches of each query.
+            include_metadata: If True, the matches include their metadata.
+            filter: A metadata filter applied to every query.
+            timeout: Seconds to wait for all the queries. Defaults to the service timeout.
+
+        Returns:
+            The response of each query, in the same order as the vectors.
+
+        Raises:
+            RetrievalTimeout: If the queries take longer than the timeout.
+        """
+        futures = [
+            self.executor.submit(self.backend.query, vector=list(vector), top_k=top_k,
+                                 include_metadata=include_metadata, filter=filter, **kwargs)
+            for vector in vectors
+        ]
+        self.queries += len(futures)
+        return self._wait(futures, self._timeout(timeout))
+
+    def query(self, vector: Sequence[float], top_k: int = 10, include_metadata: bool = True,
+              filter: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, **kwargs):
+        """Find the vectors most similar to a query vector.
+
+        Returns:
+            The response of the backend, shaped like a Pinecone query response.
+        """
+        return self.query_many([vector], top_k, include_metadata, filter, timeout, **kwargs)[0]
+
+    def fetch(self, ids: Sequence[str], timeout: Optional[float] = None) -> FetchResponse:
+        """Retrieve vectors by id, in batches and from the cache when possible.
+
+        Args:
+            ids: The ids of the vectors, like 'desc_12' or 'title_12'.
+            timeout: Seconds to wait for all the batches. Defaults to the service timeout.
+
+        Returns:
+            A response whose vectors attribute maps each id found to its vector.
+
+        Raises:
+            RetrievalTimeout: If the batches take longer than the timeout.
+        """
+        ids = list(dict.fromkeys(ids))
+        vectors: Dict[str, Any] = {}
+        with self._lock:
+            for vector_id in ids:
+                if vector_id in self._vectors:
+                    self._vectors.move_to_end(vector_id)
+                    vectors[vector_id] = self._vectors[vector_id]
+        self.cache_hits += len(vectors)
+
+        missing = [vector_id for vector_id in ids if vector_id not in vectors]
+        self.cache_misses += len(missing)
+        if missing:
+            batches = [missing[start:start + self.fetch_batch_size]
+                       for start in range(0, len(missing), self.fetch_batch_size)]
+            futures = [self.executor.submit(self.backend.fetch, batch) for batch in batches]
+            self.fetches += len(futures)
+            fetched = {}
+            for response in self._wait(futures, self._timeout(timeout)):
+                fetched.update(response.vectors)
+            vectors.update(fetched)
+
+            with self._lock:
+                for vector_id, vector in fetched.items():
+                    if vector_id.startswith("desc_"):
+                        self._vectors[vector_id] = vector
+                while len(self._vectors) > self.cache_size:
+                    self._vectors.popitem(last=False)
+
+        return FetchResponse(vectors)
+
+    def semantic_search(self, ids: Sequence[int], k: int, interests: int = 1,
+                        timeout: Optional[float] = None) -> List[int]:
+        """Find books similar to a set of books through their description embeddings.
+
+        Args:
+            ids: The ids of the books to start from.
+            k: Number of similar books to return.
+            interests: Number of interest clusters the books are split into. Each cluster
+                is queried separately and the results are interleaved.
+            timeout: Seconds to wait for each step. Defaults to the service timeout.
+
+        Returns:
+            The ids of up to k similar books, excluding the given ones.
+        """
+        ids = list(ids)
+        desc_ids = ['desc_' + str(i) for i in ids]
+        fetch_results = self.fetch(desc_ids, timeout=timeout)
+        embeddings = [fetch_results.vectors[i].values for i in desc_ids if i in fetch_results.vectors]
+        if not embeddings:
+            return []
+
+        centroids = interest_centroids(np.asarray(embeddings), interests)
+        filter_condition = {"book_id": {"$nin": ids},
+                            "type": {"$eq": 'description'}}
+
+        responses = self.query_many([centroid.tolist() for centroid in centroids], top_k=k,
+                                    filter=filter_condition, timeout=timeout)
+        result_lists = [
+            [int(match['metadata']['book_id']) for match in response["matches"]]
+            for response in responses
+        ]
+        return merge_results(result_lists, k)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the usage counters of the service.
+
+        Returns:
+            A dictionary with the cache, query, fetch and timeout counters.
+        """
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "backend": type(self.backend).__name__,
+            "cached_vectors": len(self._vectors),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "queries": self.queries,
+            "fetches": self.fetches,
+            "timeouts": self.timeouts,
+        }
+
+
+_service: Optional[RetrievalService] = None
+_service_lock = threading.Lock()
+
+
+def get_retrieval_service() -> RetrievalService:
+    """Retrieve the retrieval service shared by the process, creating it on first use.
+
+    The service follows the backend chosen by get_vector_backend(). The number of
+    workers and the timeout come from SHELFMATE_VECTOR_WORKERS and
+    SHELFMATE_VECTOR_TIMEOUT.
+
+    Returns:
+        The shared retrieval service.
+    """
+    global _service
+    backend = get_vector_backend()
+    if _service is None or _service.backend is not backend:
+        with _service_lock:
+            if _service is None or _service.backend is not backend:
+                _service = RetrievalService(
+                    backend,
+                    max_workers=int(os.getenv("SHELFMATE_VECTOR_WORKERS", "8")),
+                    timeout=float(os.getenv("SHELFMATE_VECTOR_TIMEOUT", "10")),
+                )
+    return _service
+
+
+def semantic_search(ids: Sequence[int], k: int, interests: int = 1) -> List[int]:
+    """Find books similar to a set of books with the shared retrieval service.
+
+    See RetrievalService.semantic_search.
+    """
+    return get_retrieval_service().semantic_search(ids, k, interests)
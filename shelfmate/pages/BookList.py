@@ -1,5 +1,5 @@
 import streamlit as st
-import sqlitecloud
+from chatbot.db.replica import get_catalog_connection
 
 # Display animated title
 st.markdown(
@@ -31,13 +31,11 @@ st.markdown(
 st.write("In this page you can have access to the books available in our database!")
 st.write("You will be able to filter the books by multiple categories to find the perfect book for you!")
 
-# Connect to the database
-con = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")
-c = con.cursor()
-
 # Query to find min and max for published date and number of pages
-c.execute("SELECT MIN(published_date), MAX(published_date), MIN(page_number), MAX(page_number) FROM books")
-min_pub_year, max_pub_year, min_pages, max_pages = c.fetchone()
+with get_catalog_connection() as con:
+    c = con.cursor()
+    c.execute("SELECT MIN(published_date), MAX(published_date), MIN(page_number), MAX(page_number) FROM books")
+    min_pub_year, max_pub_year, min_pages, max_pages = c.fetchone()
 
 # Create two columns: one for filters, one for book list
 col1, col2 = st.columns([1, 3])  # First column smaller (1), second one bigger (3)
@@ -122,9 +120,10 @@ with col2:
     
     filters = [item for item in filters if not isinstance(item, tuple)]
     # Execute the query with filters
-    c = con.cursor()
-    c.execute(query, filters)
-    book_list = c.fetchall()
+    with get_catalog_connection() as con:
+        c = con.cursor()
+        c.execute(query, filters)
+        book_list = c.fetchall()
     
 
     # Display the filtered books
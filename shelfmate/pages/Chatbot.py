@@ -1,34 +1,29 @@
 import streamlit as st
-import time
 from dotenv import load_dotenv
 from chatbot.bot import MainChatbot  # Import the chatbot class
-import sqlitecloud  
+from chatbot.db.pool import get_connection, get_pool
+from chatbot.catalog.cache import catalog_names
+from chatbot.rag.answer_cache import get_answer_cache
+from chatbot.vectors.embeddings import get_embedding_cache
+from chatbot.vectors.retrieval import get_retrieval_service
 # Load environment variables
 load_dotenv()
 
+# Build the chatbot once per server process and share it between all sessions
+@st.cache_resource(show_spinner="Warming up ShelfMate...")
+def get_chatbot():
+    return MainChatbot()
+
 # Function to check authentication
 def check_auth():
     return 'logged_in' in st.session_state and st.session_state.logged_in
 
-# Function to simulate streaming response
-def simulate_streaming(message):
-    buffer = ""
-    for char in message:
-        buffer += char
-        if char in [" ", "\n"]:
-            yield buffer.strip() + ("<br>" if char == "\n" else " ")
-            buffer = ""
-            time.sleep(0.1 if char == "\n" else 0.05)
-    if buffer:
-        yield buffer
-
 # Function to get user conversation_id from the database
 def get_user_conversation_id(username):
-    conn = sqlitecloud.connect("sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg")  # Path to your SQLite database
-    cursor = conn.cursor()
-    cursor.execute("SELECT conversation_id FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT conversation_id FROM users WHERE username = ?", (username,))
+        row = cursor.fetchone()
     if row:
         return row[0]
     return 0  # Return 0 if the user does not exist
@@ -41,6 +36,9 @@ if not check_auth():
 else:
     st.title("ShelfMate Chatbot")
 
+    # Show how long the shared chatbot took to warm up in this server process
+    st.sidebar.metric("Chatbot warm-up", f"{get_chatbot().warmup_seconds:.2f} s")
+
     username = st.session_state['username']
 
     # Get the conversation_id from the database
@@ -84,17 +82,35 @@ else:
         with st.chat_message("user", avatar="👤"):
             st.markdown(user_input)
 
-        # Initialize the chatbot instance
-        bot = MainChatbot()
-        bot.user_login(username=username, conversation_id=conversation_id)
+        # Reuse the warm chatbot instance shared by every session
+        bot = get_chatbot()
+
+        try:
+            # Stream the response into the chat as the language model generates it
+            timings = {}
+            response_stream = bot.stream_user_input(
+                {"user_input": user_input}, username=username, conversation_id=conversation_id,
+                timings=timings
+            )
+            with st.chat_message("assistant", avatar="images/corujafofa.jpg"):
+                response = st.write_stream(response_stream)
+            # Add assistant response to chat history
+            st.session_state.messages.append({"role": "assistant", "content": response})
 
-        with st.spinner('Thinking...'):
-            try:
-                # Process user input using the bot
-                response = bot.process_user_input({"user_input": user_input})
-                with st.chat_message("assistant", avatar="images/corujafofa.jpg"):
-                    st.markdown(response, unsafe_allow_html=True)
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": response})
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
\ No newline at end of file
+            # Show how the stages of this turn overlapped
+            with st.sidebar.expander("Last turn timings (ms)"):
+                st.json(timings)
+            with st.sidebar.expander("Database pool"):
+                st.json(get_pool().stats())
+            with st.sidebar.expander("Catalog names"):
+                st.json(catalog_names.stats())
+            with st.sidebar.expander("Embedding cache"):
+                st.json(get_embedding_cache().stats())
+            with st.sidebar.expander("Vector search"):
+                st.json(get_retrieval_service().stats())
+            with st.sidebar.expander("FAQ answer cache"):
+                st.json(get_answer_cache().stats())
+            with st.sidebar.expander("Fallback routing"):
+                st.json(get_chatbot().get_fallback_stats())
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
\ No newline at end of file
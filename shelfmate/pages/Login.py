@@ -1,35 +1,33 @@
-import sqlitecloud
 import streamlit as st
 import time
-
-# Database setup
-db_path = "sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg"
-conn = sqlitecloud.connect(db_path)
-cursor = conn.cursor()
+from chatbot.db.pool import get_connection
 
 # Helper Functions
 def check_if_email_exists(email):
-    cursor = conn.cursor()
-    cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
-    return cursor.fetchone() is not None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
+        return cursor.fetchone() is not None
 
 def verify_user(email, password):
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
-    return cursor.fetchone()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE email = ? AND password = ?", (email, password))
+        return cursor.fetchone()
 
 def get_username_by_email(email):
-    cursor = conn.cursor()
-    cursor.execute("SELECT username FROM users WHERE email = ?", (email,))
-    result = cursor.fetchone()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT username FROM users WHERE email = ?", (email,))
+        result = cursor.fetchone()
     return result[0] if result else None
 
 # Function to update user conversation_id in the database
 def update_user_conversation_id(username):
-    cursor = conn.cursor()
-    cursor.execute("UPDATE users SET conversation_id = conversation_id + 1 WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET conversation_id = conversation_id + 1 WHERE username = ?", (username,))
+        conn.commit()
 
 # Login Form
 st.title("Login")
@@ -1,5 +1,5 @@
 import streamlit as st
-import sqlitecloud
+from chatbot.db.pool import get_connection
 
 # Display animated title
 st.markdown(
@@ -40,10 +40,6 @@ if 'username' not in st.session_state:
 username = st.session_state['username']
 st.write(f"Hello, {username}!")
 
-# Connect to the database
-conn = sqlitecloud.connect('sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg')
-c = conn.cursor()
-
 # Create two columns: one for filters, one for book list
 col1, col2 = st.columns([1, 3])  # First column smaller (1), second one bigger (3)
 
@@ -90,9 +86,10 @@ with col2:
             query += " AND read_list.did_not_finish_flag = 0"
 
     # Execute the query with filters
-    c = conn.cursor()
-    c.execute(query, tuple(filters))
-    read_list = c.fetchall()
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute(query, tuple(filters))
+        read_list = c.fetchall()
 
     # Display the filtered books
     if read_list:
@@ -1,19 +1,17 @@
 import datetime
 import re
-import sqlitecloud
 import time
 
 import streamlit as st
 
-db_path = "sqlitecloud://cikwryuhhz.g6.sqlite.cloud:8860/shelfmate.db?apikey=fxZSlHTpxWU109u7go8avF2RRHsZ43JUxDfarjdFpYg"
-conn = sqlitecloud.connect(db_path)
-cursor = conn.cursor()
+from chatbot.db.pool import get_connection
 
 
 def check_email_exists(email):
-    cursor = conn.cursor()
-    cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
-    output = cursor.fetchone() is not None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
+        output = cursor.fetchone() is not None
     return output
 
 
@@ -86,14 +84,13 @@ with st.form("registration_form"):
         if check_email_exists(email):
             st.error("Email already registered!")
         else:
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT INTO users (name, email, district, username,password,gender) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (name, email, district, username,password,gender))
-            conn.commit()
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO users (name, email, district, username,password,gender) 
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (name, email, district, username,password,gender))
+                conn.commit()
             st.success("Registration successful!")
             time.sleep(1)
             st.switch_page("pages/Login.py")
-
-conn.close()
\ No newline at end of file
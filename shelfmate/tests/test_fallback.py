@@ -0,0 +1,65 @@
+import numpy as np
+
+from chatbot.router.fallback import WRITE_INTENTS, KnnFallbackClassifier
+
+# Three labelled messages around each of three orthogonal directions
+EMBEDDINGS = np.array([
+    [1.0, 0.02, 0.0, 0.0], [1.0, -0.02, 0.0, 0.0], [1.0, 0.0, 0.02, 0.0],
+    [0.02, 1.0, 0.0, 0.0], [-0.02, 1.0, 0.0, 0.0], [0.0, 1.0, 0.02, 0.0],
+    [0.0, 0.02, 1.0, 0.0], [0.0, -0.02, 1.0, 0.0], [0.02, 0.0, 1.0, 0.0],
+])
+LABELS = ["suggest_books"] * 3 + ["chitchat"] * 3 + ["add_book_to_read_list"] * 3
+
+
+def make_classifier(**kwargs):
+    options = {"k": 3, "thresholds": {"suggest_books": 0.5, "add_book_to_read_list": 0.5}, "margin": 0.05}
+    options.update(kwargs)
+    return KnnFallbackClassifier(None, EMBEDDINGS, LABELS, **options)
+
+
+def test_close_query_is_resolved_locally():
+    prediction = make_classifier().classify_vectors(np.array([[1.0, 0.0, 0.0, 0.0]]))[0]
+
+    assert prediction.intent == "suggest_books"
+    assert prediction.vote == 1.0
+
+
+def test_split_vote_is_left_to_the_llm():
+    # Halfway between two intents, the neighbours do not agree
+    classifier = make_classifier(k=6)
+    prediction = classifier.classify_vectors(np.array([[1.0, 1.0, 0.0, 0.0]]))[0]
+
+    assert prediction.vote < classifier.min_vote
+    assert prediction.intent is None
+
+
+def test_similarity_below_route_threshold_plus_margin_is_left_to_the_llm():
+    # Every neighbour agrees, but the nearest one has a similarity of about 0.8
+    query = np.array([[0.8, 0.0, 0.0, 0.6]])
+
+    strict = make_classifier(thresholds={"suggest_books": 0.78}).classify_vectors(query)[0]
+    lenient = make_classifier(thresholds={"suggest_books": 0.7}).classify_vectors(query)[0]
+
+    assert strict.candidate == "suggest_books" and strict.vote == 1.0
+    assert strict.similarity < 0.78 + 0.05
+    assert strict.intent is None
+    assert lenient.intent == "suggest_books"
+
+
+def test_chitchat_uses_the_minimum_similarity():
+    query = np.array([[0.0, 0.4, 0.0, 0.9]])
+
+    prediction = make_classifier(min_similarity=0.45).classify_vectors(query)[0]
+
+    assert prediction.candidate == "chitchat"
+    assert prediction.intent is None
+
+
+def test_write_intents_are_never_resolved_locally():
+    assert "add_book_to_read_list" in WRITE_INTENTS
+
+    prediction = make_classifier().classify_vectors(np.array([[0.0, 0.0, 1.0, 0.0]]))[0]
+
+    assert prediction.candidate == "add_book_to_read_list"
+    assert prediction.vote == 1.0 and prediction.similarity > 0.99
+    assert prediction.intent is None
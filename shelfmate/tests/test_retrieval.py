@@ -0,0 +1,29 @@
+import numpy as np
+
+from chatbot.vectors.retrieval import interest_centroids
+
+
+def test_interest_centroids_separates_two_clusters():
+    rng = np.random.default_rng(0)
+    # Two tight groups of unit-length directions, far apart on the sphere
+    first = np.array([1.0, 0.0, 0.0]) + rng.normal(scale=0.05, size=(6, 3))
+    second = np.array([0.0, 1.0, 0.0]) + rng.normal(scale=0.05, size=(4, 3))
+    # Scale the embeddings so the centroids only depend on their directions
+    embeddings = np.vstack([first * 3, second * 0.5])
+
+    centroids = interest_centroids(embeddings, interests=2)
+
+    assert len(centroids) == 2
+    np.testing.assert_allclose(np.linalg.norm(centroids, axis=1), 1.0, rtol=1e-5)
+    # Largest cluster first
+    assert np.argmax(centroids[0]) == 0
+    assert np.argmax(centroids[1]) == 1
+    assert centroids[0] @ centroids[1] < 0.2
+
+
+def test_interest_centroids_single_interest_is_mean():
+    embeddings = np.array([[1.0, 0.0], [0.0, 1.0]])
+
+    centroids = interest_centroids(embeddings, interests=1)
+
+    np.testing.assert_allclose(centroids[0], [0.5, 0.5])